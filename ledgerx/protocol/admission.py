@@ -0,0 +1,270 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.admission
+:synopsis: Priority queueing and load shedding of frames before parsing.
+:author: Amr Ali <amr@ledgerx.com>
+
+An :class:`Admission` stage sits between the socket and the parser. It
+peeks at the ``type`` field of each frame without parsing it (see
+:func:`~ledgerx.protocol.pipeline.field_key`), maps the type to a priority
+class (0 is the highest) and queues the frame in the bounded queue of its
+class. Frames are parsed only when taken, highest class first, so cancels
+do not wait behind market data requests:
+
+>>> admission = Admission(JsonParser, {'cancel': 0, 'order': 1}, default=2)
+>>> *routing, frame = router.recv_multipart()
+>>> reply = admission.offer(frame, routing)
+>>> if reply is not None:
+...     router.send_multipart(routing + [reply.dumps()])
+>>> for routing, msg in admission.drain(64):
+...     pass
+
+A frame is refused with a prebuilt status reply when the queue of its class
+is full (``rejected``), or when the stage is overloaded and its class is not
+one of the ``protected`` ones (``shed``). The stage is overloaded while more
+than ``shed_depth`` frames are queued in all, or while the oldest queued
+frame has waited more than ``shed_latency`` seconds. The reply is frozen and
+carries the message ID peeked from the frame, so the client can match it to
+its request. It is serialized once up front, with a placeholder ID that the
+ID of each frame is spliced into, so refusing a frame costs no parsing or
+serializing; its timestamp is that of the stage's creation. Frames without a
+message ID, and every frame if ``share_reply`` is set, get one shared reply
+without an ID.
+
+Every decision is counted, in total and by type, see
+:meth:`Admission.snapshot`.
+"""
+
+from collections import deque
+
+from ledgerx.protocol.metrics import Histogram
+from ledgerx.protocol.pipeline import field_key
+from ledgerx.protocol.system import monotonic
+
+ADMITTED = 'admitted'
+SHED = 'shed'
+REJECTED = 'rejected'
+
+_OVERLOADED = "server overloaded"
+# The message ID spliced out of the prebuilt reply
+_PLACEHOLDER = b'0123456789abcdef' * 2
+_HEX_DIGITS = b'0123456789abcdefABCDEF'
+
+class Admission(object):
+    """\
+    Bounded priority queues of unparsed frames.
+    """
+
+    def __init__(self, parser, priorities, default=None, max_depth=1000,
+            shed_depth=None, shed_latency=None, protected=1, precision=5,
+            share_reply=False):
+        """\
+        :param parser: A :class:`BaseMessageParser` class of JSON or msgpack
+            messages.
+        :param priorities: A dictionary of message types to priority classes,
+            0 being the highest.
+        :param default: The class of other types and of frames without a
+            type (default: one below the lowest in ``priorities``).
+        :param max_depth: The most frames queued per class; an integer or a
+            list by class.
+        :param shed_depth: Shed while more frames than this are queued in all
+            (default: never).
+        :param shed_latency: Shed while the oldest queued frame has waited
+            longer than this many seconds (default: never).
+        :param protected: The number of highest classes never shed; their
+            frames are only rejected when their queue is full.
+        :param precision: The precision of the queue wait histograms.
+        :param share_reply: Refuse every frame with :attr:`reply`, which has
+            no message ID, instead of a reply with the ID of the frame.
+        """
+        if default is None:
+            default = max(priorities.values(), default=-1) + 1
+        classes = max(max(priorities.values(), default=0), default) + 1
+        if isinstance(max_depth, int):
+            max_depth = [max_depth] * classes
+        if len(max_depth) != classes:
+            raise ValueError("max_depth must have {0} classes".format(classes))
+        self.parser = parser
+        self.priorities = dict(priorities)
+        self.default = default
+        self.max_depth = list(max_depth)
+        self.shed_depth = shed_depth
+        self.shed_latency = shed_latency
+        self.protected = protected
+        self.share_reply = share_reply
+        self.reply = parser.MessageStatus().server_error(
+                _OVERLOADED).freeze()
+        self.reply.dumps() # Serialize it up front
+        template = parser.MessageStatus()
+        template.mid = _PLACEHOLDER.decode('ascii')
+        template = template.server_error(_OVERLOADED).freeze()
+        self._parts = template.dumps().split(_PLACEHOLDER)
+        # None if the status messages of the parser carry no message ID
+        self._template = dict(template.__dict__) \
+                if len(self._parts) == 2 else None
+        self.stats = {ADMITTED: 0, SHED: 0, REJECTED: 0, 'taken': 0}
+        self.by_type = {}
+        self.waits = [Histogram(precision) for _ in range(classes)]
+        self._queues = [deque() for _ in range(classes)]
+        self._depth = 0
+        self._key = field_key(parser, 'type')
+        self._mid = field_key(parser, 'mid')
+        # Match the peeked value as it is: a quoted JSON string, or a
+        # msgpack string as bytes or str depending on the msgpack version
+        self._classes = {}
+        for mtype, cls in priorities.items():
+            raw = mtype.encode('utf8')
+            for k in (mtype, raw, b'"' + raw + b'"'):
+                self._classes[k] = cls
+
+    def __len__(self):
+        return self._depth
+
+    def depth(self, cls):
+        """\
+        :returns: The number of frames queued in a class.
+        """
+        return len(self._queues[cls])
+
+    def _type(self, raw):
+        if isinstance(raw, (bytes, bytearray)):
+            raw = bytes(raw).strip(b'"').decode('utf8', 'replace')
+        return raw
+
+    def _count(self, decision, raw):
+        self.stats[decision] += 1
+        counts = self.by_type.get(raw)
+        if counts is None:
+            counts = self.by_type[raw] = {ADMITTED: 0, SHED: 0, REJECTED: 0}
+        counts[decision] += 1
+
+    def overloaded(self, now=None):
+        """\
+        :returns: True if lower priority frames are being shed.
+        """
+        if self.shed_depth is not None and self._depth > self.shed_depth:
+            return True
+        if self.shed_latency is not None and self._depth:
+            now = monotonic() if now is None else now
+            oldest = min(q[0][0] for q in self._queues if q)
+            return now - oldest > self.shed_latency
+        return False
+
+    def classify(self, frame):
+        """\
+        :returns: The priority class and the peeked type of a frame, as it
+            was serialized; the type is None unless it is in
+            ``priorities``.
+        """
+        try:
+            raw = self._key(frame)
+            return self._classes[raw], raw
+        except Exception: # Not a message, no type or not a configured one
+            return self.default, None
+
+    def _refuse(self, frame):
+        if self.share_reply or self._template is None:
+            return self.reply
+        try:
+            mid = self._mid(frame)
+        except Exception: # Not a message
+            return self.reply
+        if isinstance(mid, str):
+            mid = mid.encode('utf8')
+        elif isinstance(mid, (bytes, bytearray)):
+            mid = bytes(mid).strip(b'"') # Quoted if peeked from JSON
+        else:
+            return self.reply
+        # Only hex IDs are spliced, as they need no escaping
+        if len(mid) != len(_PLACEHOLDER) or mid.translate(None, _HEX_DIGITS):
+            return self.reply
+        klass = type(self.reply)
+        reply = klass.__new__(klass)
+        state = reply.__dict__
+        state.update(self._template)
+        state['_mid'] = mid.decode('ascii')
+        state['_dumps'] = mid.join(self._parts)
+        return reply
+
+    def offer(self, frame, context=None):
+        """\
+        Queue a frame unless it is shed or rejected.
+
+        :param frame: A serialized message.
+        :param context: Anything to return with the message, e.g., the
+            routing frames to reply to.
+        :returns: None if the frame was queued, otherwise the status reply
+            to send back.
+        """
+        cls, raw = self.classify(frame)
+        now = monotonic()
+        queue = self._queues[cls]
+        if len(queue) >= self.max_depth[cls]:
+            self._count(REJECTED, raw)
+            return self._refuse(frame)
+        if cls >= self.protected and self.overloaded(now):
+            self._count(SHED, raw)
+            return self._refuse(frame)
+        queue.append((now, frame, context))
+        self._depth += 1
+        self._count(ADMITTED, raw)
+        return None
+
+    def take(self):
+        """\
+        Take and parse the oldest frame of the highest class.
+
+        :returns: A tuple of the context given to :meth:`offer` and the
+            parsed message (a status reply if it failed to parse), or None
+            if nothing is queued.
+        """
+        if not self._depth:
+            return None
+        for cls, queue in enumerate(self._queues):
+            if queue:
+                break
+        when, frame, context = queue.popleft()
+        self._depth -= 1
+        self.stats['taken'] += 1
+        self.waits[cls].record(int((monotonic() - when) * 1e9))
+        return context, self.parser.parse(frame)
+
+    def drain(self, budget=None):
+        """\
+        Take and parse frames, highest class first.
+
+        :param budget: The most frames to take (default: all queued).
+        :returns: An iterator of ``(context, msg)`` tuples.
+        """
+        taken = 0
+        while self._depth and (budget is None or taken < budget):
+            yield self.take()
+            taken += 1
+
+    def snapshot(self, reset=False):
+        """\
+        Get the admission metrics.
+
+        :param reset: Start over after taking the snapshot.
+        :returns: A dictionary of the counters in ``stats``, ``by_type``
+            counters keyed by type (None for the types not in
+            ``priorities``, which cannot be told apart without parsing),
+            the ``depths`` of the queues and their ``wait_ns``
+            :meth:`Histogram.snapshot` summaries, both by class, and whether
+            the stage is ``overloaded``.
+        """
+        res = dict(self.stats)
+        res['by_type'] = {self._type(raw): dict(counts)
+                for raw, counts in self.by_type.items()}
+        res['depths'] = [len(queue) for queue in self._queues]
+        res['wait_ns'] = [hist.snapshot() for hist in self.waits]
+        res['overloaded'] = self.overloaded()
+        if reset:
+            for k in self.stats:
+                self.stats[k] = 0
+            self.by_type = {}
+            for hist in self.waits:
+                hist.reset()
+        return res
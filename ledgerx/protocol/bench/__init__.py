@@ -0,0 +1,213 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.bench
+:synopsis: Benchmarks for the protocol library.
+:author: Amr Ali <amr@ledgerx.com>
+
+Benchmarks are laid out like unit tests: ``bench_*.py`` modules contain
+:class:`BenchmarkCase` subclasses whose ``bench*`` methods are timed. A case
+runs once per entry of its ``params`` list, which is how serializers and
+payload sizes are covered. Use :func:`ledgerx.protocol.tester.load_benchmark_suite`
+or ``python -m ledgerx.protocol.bench``.
+"""
+
+import os
+import platform
+import importlib
+import itertools
+
+from time import perf_counter
+from statistics import median, mean, pstdev
+
+from ledgerx.protocol.detail import jsonapi
+from ledgerx.protocol.version import VERSION_STRING
+
+class BenchmarkCase(object):
+    """\
+    A group of benchmarks sharing a fixture.
+    """
+    params = [{}]
+    number = None # Calls per run (default: auto-ranged to ``min_time``)
+    repeat = 5
+
+    def __init__(self, method_name, **params):
+        self.method_name = method_name
+        self.kwargs = params
+        for k, v in params.items():
+            setattr(self, k, v)
+
+    @property
+    def name(self):
+        name = '{0}.{1}.{2}'.format(self.__class__.__module__.rsplit('.', 1)[-1],
+                self.__class__.__name__, self.method_name)
+        if self.kwargs:
+            name += '[{0}]'.format(','.join('{0}={1}'.format(k, v)
+                for k, v in sorted(self.kwargs.items())))
+        return name
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def run(self, min_time=0.2):
+        """\
+        Time this benchmark.
+
+        :param min_time: The minimum duration of a single run in seconds
+            when ``number`` is auto-ranged.
+        :returns: A result dictionary; all timings are per call in nanoseconds.
+        """
+        self.setUp()
+        try:
+            func = getattr(self, self.method_name)
+            number = self.number or _autorange(func, min_time)
+            runs = [_timeit(func, number) for _ in range(self.repeat)]
+        finally:
+            self.tearDown()
+        return {
+                'number': number,
+                'repeat': self.repeat,
+                'min_ns': min(runs),
+                'median_ns': median(runs),
+                'mean_ns': mean(runs),
+                'stdev_ns': pstdev(runs),
+                }
+
+def _timeit(func, number):
+    t0 = perf_counter()
+    for _ in itertools.repeat(None, number):
+        func()
+    return (perf_counter() - t0) / number * 1e9
+
+def _autorange(func, min_time):
+    number = 1
+    while True:
+        t0 = perf_counter()
+        for _ in itertools.repeat(None, number):
+            func()
+        elapsed = perf_counter() - t0
+        if elapsed >= min_time:
+            return number
+        number *= 10 if elapsed < min_time / 10 else 2
+
+class BenchmarkSuite(object):
+    """\
+    A list of benchmark cases to be run together.
+    """
+
+    def __init__(self, cases=()):
+        self.cases = list(cases)
+
+    def __iter__(self):
+        return iter(self.cases)
+
+    def __len__(self):
+        return len(self.cases)
+
+    def filter(self, pattern):
+        """\
+        :returns: A new suite with the cases whose name contains ``pattern``.
+        """
+        return self.__class__(c for c in self.cases if pattern in c.name)
+
+    def run(self, min_time=0.2, stream=None):
+        """\
+        Run all benchmarks.
+
+        :param min_time: See :meth:`BenchmarkCase.run`.
+        :param stream: A file to report progress to (default: None).
+        :returns: A results dictionary suitable for :func:`save_results`.
+        """
+        res = {}
+        for case in self.cases:
+            res[case.name] = case.run(min_time)
+            if stream:
+                stream.write('{0:<72} {1:>12.1f} ns\n'.format(
+                    case.name, res[case.name]['median_ns']))
+                stream.flush()
+        return {'meta': _metadata(), 'results': res}
+
+class BenchmarkLoader(object):
+    """\
+    Find benchmark cases in ``bench_*.py`` modules.
+    """
+    pattern = 'bench_'
+
+    def load_from_case(self, klass):
+        names = sorted(n for n in dir(klass)
+                if n.startswith('bench') and callable(getattr(klass, n)))
+        return BenchmarkSuite(klass(name, **params)
+                for params in klass.params for name in names)
+
+    def load_from_module(self, module):
+        suite = BenchmarkSuite()
+        for obj in vars(module).values():
+            if isinstance(obj, type) and issubclass(obj, BenchmarkCase) \
+                    and obj.__module__ == module.__name__:
+                suite.cases.extend(self.load_from_case(obj))
+        return suite
+
+    def discover(self, start_dir, package=__name__):
+        """\
+        Import benchmark modules in ``start_dir`` and load their cases.
+
+        :param start_dir: The directory of the benchmarks package.
+        :param package: The package name of ``start_dir``.
+        """
+        suite = BenchmarkSuite()
+        for fname in sorted(os.listdir(start_dir)):
+            if fname.startswith(self.pattern) and fname.endswith('.py'):
+                module = importlib.import_module(
+                        '.{0}'.format(fname[:-3]), package=package)
+                suite.cases.extend(self.load_from_module(module))
+        return suite
+
+def _metadata():
+    return {
+            'version': VERSION_STRING,
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            }
+
+def save_results(results, path):
+    """\
+    Save benchmark results as JSON.
+    """
+    with open(path, 'wb') as fd:
+        fd.write(jsonapi.dumps(results, indent=2, sort_keys=True,
+            separators=(',', ': ')))
+
+def load_results(path):
+    """\
+    Load benchmark results saved by :func:`save_results`.
+    """
+    with open(path, 'rb') as fd:
+        return jsonapi.loads(fd.read())
+
+def compare(results, baseline, threshold=0.1, key='median_ns'):
+    """\
+    Compare benchmark results against a baseline.
+
+    :param results: The current results.
+    :param baseline: The baseline results.
+    :param threshold: The relative slowdown above which a benchmark is
+        considered a regression (default: 10%).
+    :param key: The timing to compare.
+    :returns: A list of ``(name, baseline ns, current ns, ratio)`` for every
+        benchmark found in both, sorted by ratio, and a list of the names of
+        the regressions among them.
+    """
+    base = baseline['results']
+    rows = []
+    for name, res in results['results'].items():
+        if name in base and base[name][key] > 0:
+            rows.append((name, base[name][key], res[key],
+                res[key] / base[name][key]))
+    rows.sort(key=lambda x: -x[3])
+    return rows, [r[0] for r in rows if r[3] > 1 + threshold]
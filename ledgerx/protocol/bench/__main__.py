@@ -0,0 +1,51 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.bench.__main__
+:synopsis: Run the benchmark suite from the command line.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import sys
+import argparse
+
+from ledgerx.protocol.tester import load_benchmark_suite
+from ledgerx.protocol.bench import save_results, load_results, compare
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog='python -m ledgerx.protocol.bench',
+            description='Run the protocol microbenchmarks.')
+    ap.add_argument('-k', '--filter', default='',
+            help='only run benchmarks whose name contains this string')
+    ap.add_argument('-t', '--min-time', type=float, default=0.2,
+            help='minimum duration of a single run in seconds')
+    ap.add_argument('-o', '--save', metavar='PATH',
+            help='save the results as JSON to PATH')
+    ap.add_argument('-b', '--baseline', metavar='PATH',
+            help='compare the results against a saved baseline')
+    ap.add_argument('--threshold', type=float, default=0.1,
+            help='relative slowdown reported as a regression (default: 0.1)')
+    args = ap.parse_args(argv)
+
+    suite = load_benchmark_suite().filter(args.filter)
+    results = suite.run(args.min_time, stream=sys.stdout)
+    if args.save:
+        save_results(results, args.save)
+
+    if args.baseline:
+        rows, regressions = compare(results, load_results(args.baseline),
+                args.threshold)
+        print()
+        for name, base, cur, ratio in rows:
+            print('{0:<72} {1:>12.1f} -> {2:>12.1f} ns  {3:+7.1%}{4}'.format(
+                name, base, cur, ratio - 1,
+                '  REGRESSION' if name in regressions else ''))
+        if regressions:
+            print('\n{0} regression(s) above {1:.0%}'.format(
+                len(regressions), args.threshold))
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
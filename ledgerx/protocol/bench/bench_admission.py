@@ -0,0 +1,50 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.bench.bench_admission
+:synopsis: Admission and load shedding benchmarks.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+from ledgerx.protocol.admission import Admission
+from ledgerx.protocol.bench import BenchmarkCase
+from ledgerx.protocol.bench import messages
+
+class AdmissionBench(BenchmarkCase):
+    params = [{'serializer': 'json'}, {'serializer': 'msgpack'}]
+
+    def setUp(self):
+        self.parser = messages.parser(self.serializer)
+        self.order = messages.order(self.serializer).dumps()
+        self.book = messages.book_state(self.serializer, 10).dumps()
+        self.admission = Admission(self.parser, {'order': 0,
+            'book_state': 1})
+        # Shedding every book state
+        self.shedding = Admission(self.parser, {'order': 0,
+            'book_state': 1}, shed_depth=0)
+        self.shedding.offer(self.order)
+        self.sharing = Admission(self.parser, {'order': 0,
+            'book_state': 1}, shed_depth=0, share_reply=True)
+        self.sharing.offer(self.order)
+
+    def bench_classify(self):
+        self.admission.classify(self.book)
+
+    def bench_offer_take(self):
+        self.admission.offer(self.order)
+        self.admission.take()
+
+    def bench_parse(self):
+        # The baseline: parse everything as it arrives
+        self.parser.parse(self.order)
+
+    def bench_shed(self):
+        self.shedding.offer(self.book).dumps()
+
+    def bench_shed_shared(self):
+        self.sharing.offer(self.book).dumps()
+
+    def bench_parse_shed(self):
+        # What a shed frame would have cost to parse
+        self.parser.parse(self.book)
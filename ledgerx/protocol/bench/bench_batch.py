@@ -0,0 +1,57 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.bench.bench_batch
+:synopsis: Throughput and latency of batched versus individual sends.
+:author: Amr Ali <amr@ledgerx.com>
+
+``bench_burst`` sends a burst of serialized orders over inproc PUSH/PULL and
+receives them; divide by ``BURST`` for the per-message cost. ``bench_idle``
+sends a single message to an idle sender, which is the latency batching
+adds when traffic is light.
+"""
+
+import zmq
+
+from ledgerx.protocol import sockets
+from ledgerx.protocol.bench import BenchmarkCase
+from ledgerx.protocol.bench import messages
+from ledgerx.protocol.sockets.batch import BatchSender, unpack_batch
+
+BURST = 1000
+
+class BatchBench(BenchmarkCase):
+    params = [{'max_count': 1}, {'max_count': 16}, {'max_count': 64},
+            {'max_count': 256}]
+
+    def setUp(self):
+        self.ctx = zmq.Context()
+        self.pull = sockets.pull_socket(self.ctx, rtimeo=-1, recv_hwm=0)
+        self.pull.bind('inproc://bench_batch')
+        self.push = sockets.push_socket(self.ctx, send_hwm=0)
+        self.push.connect('inproc://bench_batch')
+        # A max_count of one sends every message individually
+        self.sender = BatchSender(self.push, max_count=self.max_count,
+                max_bytes=1 << 20, max_delay=1.0)
+        self.data = messages.order('msgpack').dumps()
+
+    def tearDown(self):
+        self.push.close(0)
+        self.pull.close(0)
+        self.ctx.term()
+
+    def bench_burst(self):
+        send = self.sender.send
+        data = self.data
+        for _ in range(BURST):
+            send(data)
+        self.sender.flush()
+        received = 0
+        while received < BURST:
+            received += len(unpack_batch(self.pull.recv()))
+
+    def bench_idle(self):
+        self.sender._last_send = float('-inf') # Idle for ever
+        self.sender.send(self.data)
+        unpack_batch(self.pull.recv())
@@ -0,0 +1,60 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.bench.bench_broker
+:synopsis: Request throughput through the broker by number of workers.
+:author: Amr Ali <amr@ledgerx.com>
+
+Each call pipelines a batch of requests from a DEALER client through the
+broker to worker processes; compare the ``workers`` params to see how
+throughput scales with the number of cores available.
+"""
+
+import time
+import threading
+
+import zmq
+
+from ledgerx.protocol import sockets
+from ledgerx.protocol.bench import BenchmarkCase
+from ledgerx.protocol.bench import messages
+from ledgerx.protocol.bench.bench_rpc import endpoint
+from ledgerx.protocol.sockets.broker import Broker, Worker, start_workers
+
+BATCH = 200
+
+class BrokerBench(BenchmarkCase):
+    params = [{'workers': 1}, {'workers': 2}, {'workers': 4}]
+    repeat = 3
+
+    def setUp(self):
+        self.ctx = zmq.Context()
+        self.parser = messages.parser('msgpack')
+        frontend = endpoint('inproc', 'broker')
+        backend = endpoint('ipc', 'workers')
+        self.broker = Broker(self.ctx, frontend, backend)
+        self.procs = start_workers(Worker(self.parser), backend, self.workers)
+        self.thread = threading.Thread(target=self.broker.run, daemon=True)
+        self.thread.start()
+        self.client = sockets.dealer_socket(self.ctx, rtimeo=-1)
+        self.client.connect(frontend)
+        self.requests = [messages.order('msgpack', mpid=i).dumps()
+                for i in range(BATCH)]
+        while self.broker.workers < self.workers:
+            time.sleep(0.01)
+
+    def tearDown(self):
+        self.broker.stop()
+        self.thread.join()
+        self.broker.close()
+        for proc in self.procs:
+            proc.join(5)
+        self.client.close(0)
+        self.ctx.term()
+
+    def bench_pipelined(self):
+        for data in self.requests:
+            self.client.send(data)
+        for _ in self.requests:
+            self.parser.parse(self.client.recv())
@@ -0,0 +1,34 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.bench.bench_dedup
+:synopsis: Duplicate suppression benchmarks.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import itertools
+
+from ledgerx.protocol.bench import BenchmarkCase
+from ledgerx.protocol.dedup import Deduplicator
+from ledgerx.protocol.messages import _uuid4_hex
+
+class DedupBench(BenchmarkCase):
+    params = [dict(compact=compact, window=window)
+            for compact in (False, True) for window in (None, 60)]
+
+    def setUp(self):
+        self.dedup = Deduplicator(capacity=65536, window=self.window,
+                compact=self.compact)
+        # Enough distinct IDs to keep the ring full and evicting
+        self.mids = itertools.cycle([_uuid4_hex() for _ in range(100000)])
+        self.plain = {}
+
+    def bench_seen(self):
+        self.dedup.seen(next(self.mids))
+
+    def bench_dict(self):
+        # The unbounded baseline
+        mid = next(self.mids)
+        if mid not in self.plain:
+            self.plain[mid] = True
@@ -0,0 +1,55 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.bench.bench_inproc
+:synopsis: Inproc message hand-off with and without serialization.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import zmq
+
+from ledgerx.protocol import sockets
+from ledgerx.protocol.bench import BenchmarkCase
+from ledgerx.protocol.bench import messages
+from ledgerx.protocol.sockets.message import MessageSocket
+
+class InprocBench(BenchmarkCase):
+    params = [dict(serializer=serializer, depth=depth)
+            for serializer in ('json', 'msgpack') for depth in (0, 10)]
+
+    def setUp(self):
+        self.ctx = zmq.Context()
+        parser = messages.parser(self.serializer)
+        pull = sockets.pull_socket(self.ctx, rtimeo=-1)
+        pull.bind('inproc://bench_inproc')
+        push = sockets.push_socket(self.ctx)
+        push.connect('inproc://bench_inproc')
+        self.receiver = MessageSocket(pull, parser, accept_passthrough=True)
+        self.sender = MessageSocket(push, parser)
+        self.passthrough = MessageSocket(push, parser, passthrough=True)
+        if self.depth:
+            self.msg = messages.book_state(self.serializer, self.depth)
+            self.frozen = messages.book_state(self.serializer, self.depth)
+        else:
+            self.msg = messages.order(self.serializer)
+            self.frozen = messages.order(self.serializer)
+        self.frozen.freeze()
+
+    def tearDown(self):
+        self.sender.close(0)
+        self.receiver.close(0)
+        self.ctx.term()
+
+    def bench_serialized(self):
+        self.sender.send_message(self.msg)
+        self.receiver.recv_message()
+
+    def bench_passthrough(self):
+        # The message is copied before it is frozen
+        self.passthrough.send_message(self.msg)
+        self.receiver.recv_message()
+
+    def bench_passthrough_frozen(self):
+        self.passthrough.send_message(self.frozen)
+        self.receiver.recv_message()
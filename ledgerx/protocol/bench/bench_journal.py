@@ -0,0 +1,100 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.bench.bench_journal
+:synopsis: Journal append and replay benchmarks.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import pickle
+import shutil
+import tempfile
+
+from ledgerx.protocol.bench import BenchmarkCase
+from ledgerx.protocol.bench import messages
+from ledgerx.protocol.journal import (Journal, JournalReader, build_index,
+        INBOUND)
+
+class JournalBench(BenchmarkCase):
+    params = [dict(serializer=serializer, sync=sync)
+            for serializer in ('json', 'msgpack') for sync in ('never', 'batch')]
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.journal = Journal(self.dir, sync=self.sync)
+        self.msg = messages.order(self.serializer)
+        self.frame = self.msg.dumps()
+        self.log = open(tempfile.mktemp(dir=self.dir), 'wb')
+
+    def tearDown(self):
+        self.journal.close()
+        self.log.close()
+        shutil.rmtree(self.dir)
+
+    def bench_record(self):
+        self.journal.record(self.frame, self.msg, INBOUND)
+
+    def bench_pickle(self):
+        # The baseline: pickling each message to a buffered file
+        pickle.dump(self.msg, self.log, pickle.HIGHEST_PROTOCOL)
+
+class ReplayBench(BenchmarkCase):
+    params = [{'serializer': 'json'}, {'serializer': 'msgpack'}]
+    number = 1
+    count = 10000
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        journal = Journal(self.dir)
+        msg = messages.order(self.serializer)
+        frame = msg.dumps()
+        for _ in range(self.count):
+            journal.record(frame, msg, INBOUND)
+        journal.close()
+        self.reader = JournalReader(self.dir)
+        self.parser = messages.parser(self.serializer)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def bench_records_10k(self):
+        for _ in self.reader.records():
+            pass
+
+    def bench_replay_10k(self):
+        for _ in self.reader.replay(self.parser):
+            pass
+
+class LookupBench(BenchmarkCase):
+    params = [{'index': False}, {'index': True}]
+    repeat = 3
+    count = 100000
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        journal = Journal(self.dir, segment_size=4 * 1024 * 1024)
+        msg = messages.order('msgpack')
+        frame = msg.dumps()
+        for i in range(self.count):
+            mid = msg.generate_mid()
+            journal.append(frame, INBOUND, mid=mid, ts=i)
+            if i == self.count // 2:
+                self.mid = mid
+        journal.close()
+        if self.index:
+            build_index(self.dir)
+        self.reader = JournalReader(self.dir)
+        self.parser = messages.parser('msgpack')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def bench_find_100k(self):
+        for _ in self.reader.find(self.mid, self.parser):
+            pass
+
+    def bench_window_100_of_100k(self):
+        start = self.count // 2
+        for _ in self.reader.window(start, start + 100, self.parser):
+            pass
@@ -0,0 +1,93 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.bench.bench_messages
+:synopsis: Benchmarks for message encoding, decoding and parsing.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import logging
+
+from ledgerx.protocol.bench import BenchmarkCase
+from ledgerx.protocol.bench import messages
+from ledgerx.protocol.metrics import MessageMetrics
+
+# A flat order and book states of increasing depth (nested complex fields)
+SHAPES = [('order', 0), ('book', 1), ('book', 10), ('book', 100)]
+
+def _build(serializer, shape, depth):
+    if shape == 'order':
+        return messages.order(serializer)
+    return messages.book_state(serializer, depth)
+
+class MessageBench(BenchmarkCase):
+    params = [{'serializer': s, 'shape': shape, 'depth': depth}
+            for s in ('json', 'msgpack') for shape, depth in SHAPES]
+
+    def setUp(self):
+        self.parser = messages.parser(self.serializer)
+        self.msg = _build(self.serializer, self.shape, self.depth)
+        self.data = self.msg.dumps()
+
+    def bench_dumps(self):
+        self.msg.dumps()
+
+    def bench_loads(self):
+        self.parser.ParentMessage().loads(self.data)
+
+    def bench_parse(self):
+        self.parser.parse(self.data)
+
+    def bench_generate_mid(self):
+        self.msg.generate_mid()
+
+class InvalidMessageBench(BenchmarkCase):
+    params = [{'serializer': 'json'}, {'serializer': 'msgpack'}]
+
+    def setUp(self):
+        self.parser = messages.parser(self.serializer)
+        # Counts its own failures and logs every one, as parsers used to
+        self.logging_parser = type('LoggingParser', (self.parser,),
+                {'FailureLogInterval': 0})
+        self.valid = messages.order(self.serializer).dumps()
+        msg = messages.order(self.serializer)
+        msg.type = 'unknown'
+        self.data = msg.dumps()
+        msg.mid = None
+        self.data_no_mid = msg.dumps()
+        self.garbage = b'\x00' + self.valid[1:]
+        # Keep the logged failures off stderr
+        self.logger = logging.getLogger('ledgerx.protocol')
+        self.handler = logging.NullHandler()
+        self.logger.addHandler(self.handler)
+        self.propagate, self.logger.propagate = self.logger.propagate, False
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.logger.propagate = self.propagate
+
+    def bench_parse_valid(self):
+        self.parser.parse(self.valid)
+
+    def bench_parse_unsupported_type(self):
+        self.parser.parse(self.data)
+
+    def bench_parse_unsupported_type_no_mid(self):
+        self.parser.parse(self.data_no_mid)
+
+    def bench_parse_garbage(self):
+        self.parser.parse(self.garbage)
+
+    def bench_parse_garbage_logged(self):
+        self.logging_parser.parse(self.garbage)
+
+class InstrumentedMessageBench(MessageBench):
+    params = [{'serializer': s, 'shape': 'order', 'depth': 0}
+            for s in ('json', 'msgpack')]
+
+    def setUp(self):
+        super().setUp()
+        metrics = MessageMetrics()
+        self.parser = type('_Parser', (self.parser,), {'Metrics': metrics})
+        self.msg.Metrics = metrics
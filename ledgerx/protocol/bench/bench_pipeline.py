@@ -0,0 +1,48 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.bench.bench_pipeline
+:synopsis: Sharded multi-process parsing versus parsing in process.
+:author: Amr Ali <amr@ledgerx.com>
+
+Scaling needs as many free CPUs as shards; compare with ``os.cpu_count()``.
+"""
+
+from ledgerx.protocol.bench import BenchmarkCase
+from ledgerx.protocol.bench import messages
+from ledgerx.protocol.pipeline import ShardedParser
+
+def _discard(msg):
+    pass
+
+class PipelineBench(BenchmarkCase):
+    # No shards parses in this process
+    params = [dict(serializer=serializer, shards=shards)
+            for serializer in ('json', 'msgpack') for shards in (0, 1, 2, 4)]
+    number = 1
+    repeat = 3
+    count = 5000
+
+    def setUp(self):
+        self.parser = messages.parser(self.serializer)
+        self.frames = [messages.order(self.serializer, mpid=i % 100).dumps()
+                for i in range(self.count)]
+        if self.shards:
+            self.pipeline = ShardedParser(self.parser, self.shards,
+                    handler=_discard)
+
+    def tearDown(self):
+        if self.shards:
+            self.pipeline.close()
+
+    def bench_parse_5k(self):
+        if not self.shards:
+            parse = self.parser.parse
+            for frame in self.frames:
+                parse(frame)
+            return
+        submit = self.pipeline.submit
+        for frame in self.frames:
+            submit(frame)
+        self.pipeline.join()
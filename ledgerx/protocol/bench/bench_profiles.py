@@ -0,0 +1,72 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.bench.bench_profiles
+:synopsis: Latency and throughput of the socket tuning profiles.
+:author: Amr Ali <amr@ledgerx.com>
+
+``bench_round_trip`` is the latency of a single message bounced between two
+DEALER sockets; ``bench_stream`` pushes ``STREAM`` 1 KiB messages through
+PUSH/PULL, so divide by it for the per-message cost. ``profile=default`` is
+the factories' defaults.
+"""
+
+import zmq
+
+from ledgerx.protocol import sockets
+from ledgerx.protocol.bench import BenchmarkCase
+from ledgerx.protocol.bench.bench_rpc import endpoint
+from ledgerx.protocol.sockets.profiles import create_context
+
+STREAM = 1000
+
+class ProfileBench(BenchmarkCase):
+    params = [dict(profile=profile, transport=transport)
+            for transport in ('ipc', 'tcp')
+            for profile in ('default', 'low_latency', 'high_throughput',
+                'market_data')]
+    repeat = 3
+
+    def setUp(self):
+        profile = None if self.profile == 'default' else self.profile
+        self.ctx = create_context(profile)
+        self.socks = []
+        self.ping, self.pong = self.pair(zmq.DEALER, zmq.DEALER, profile)
+        self.push, self.pull = self.pair(zmq.PUSH, zmq.PULL, profile)
+        self.data = b'x' * 1024
+        self.bench_round_trip()
+
+    def pair(self, bind_type, connect_type, profile):
+        a = sockets.create_socket(self.ctx, bind_type, rtimeo=-1,
+                profile=profile)
+        b = sockets.create_socket(self.ctx, connect_type, rtimeo=-1,
+                profile=profile)
+        if self.transport == 'tcp':
+            port = a.bind_to_random_port('tcp://127.0.0.1')
+            b.connect('tcp://127.0.0.1:{0}'.format(port))
+        else:
+            addr = endpoint('ipc', 'profile')
+            a.bind(addr)
+            b.connect(addr)
+        self.socks.extend((a, b))
+        return a, b
+
+    def tearDown(self):
+        for s in self.socks:
+            s.close(0)
+        self.ctx.term()
+
+    def bench_round_trip(self):
+        self.ping.send(self.data)
+        self.pong.send(self.pong.recv())
+        self.ping.recv()
+
+    def bench_stream(self):
+        send = self.push.send
+        data = self.data
+        for _ in range(STREAM):
+            send(data)
+        recv = self.pull.recv
+        for _ in range(STREAM):
+            recv()
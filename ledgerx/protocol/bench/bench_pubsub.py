@@ -0,0 +1,71 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.bench.bench_pubsub
+:synopsis: Subscriber cost of topic filtering versus filtering after parsing.
+:author: Amr Ali <amr@ledgerx.com>
+
+Each call publishes a feed of book states in which one message in ten is an
+order, and receives the orders on a subscriber.
+"""
+
+import time
+
+import zmq
+
+from ledgerx.protocol import sockets
+from ledgerx.protocol.bench import BenchmarkCase
+from ledgerx.protocol.bench import messages
+from ledgerx.protocol.sockets import pubsub
+
+FEED = 100
+
+class SubscriberBench(BenchmarkCase):
+    params = [{'serializer': 'json'}, {'serializer': 'msgpack'}]
+    repeat = 3
+
+    def setUp(self):
+        self.ctx = zmq.Context()
+        self.parser = messages.parser(self.serializer)
+        self.pub = sockets.pub_socket(self.ctx)
+        self.pub.bind('inproc://bench_pubsub')
+        self.sub_all = sockets.sub_socket(self.ctx, rtimeo=-1)
+        self.sub_all.connect('inproc://bench_pubsub')
+        pubsub.subscribe(self.sub_all)
+        self.sub_topic = sockets.sub_socket(self.ctx, rtimeo=-1)
+        self.sub_topic.connect('inproc://bench_pubsub')
+        pubsub.subscribe(self.sub_topic, 'order')
+        self.feed = [messages.order(self.serializer) if i % 10 == 0 else
+                messages.book_state(self.serializer) for i in range(FEED)]
+        self.frames = [[pubsub.message_topic(msg), msg.dumps()]
+                for msg in self.feed]
+        time.sleep(0.05)
+
+    def tearDown(self):
+        self.pub.close(0)
+        self.sub_all.close(0)
+        self.sub_topic.close(0)
+        self.ctx.term()
+
+    def publish(self):
+        for frames in self.frames:
+            self.pub.send_multipart(frames)
+
+    def bench_parse_and_filter(self):
+        self.publish()
+        self.sub_topic.recv_multipart() # Keep its queue empty
+        orders = []
+        for _ in self.frames:
+            msg = self.parser.parse(self.sub_all.recv_multipart()[-1])
+            if msg.type == 'order':
+                orders.append(msg)
+        for _ in range(len(orders) - 1):
+            self.sub_topic.recv_multipart()
+
+    def bench_topic_filter(self):
+        self.publish()
+        for _ in self.frames:
+            self.sub_all.recv_multipart() # Keep its queue empty
+        for _ in range(FEED // 10):
+            pubsub.recv_message(self.sub_topic, self.parser)
@@ -0,0 +1,96 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.bench.bench_rpc
+:synopsis: Request throughput of REQ lockstep versus the pipelined RPC client.
+:author: Amr Ali <amr@ledgerx.com>
+
+Each call sends a batch of requests to a stand-in ROUTER server running in
+a thread, which parses every request and sends back its status reply.
+"""
+
+import os
+import asyncio
+import tempfile
+import threading
+
+import zmq
+
+from ledgerx.protocol import sockets
+from ledgerx.protocol.bench import BenchmarkCase
+from ledgerx.protocol.bench import messages
+from ledgerx.protocol.sockets.rpc import RPCClient
+
+BATCH = 100
+
+class EchoServer(threading.Thread):
+    """\
+    A ROUTER server replying to every request with its status reply.
+    """
+
+    def __init__(self, ctx, endpoint, parser):
+        super().__init__(daemon=True)
+        self.socket = sockets.router_socket(ctx, rtimeo=-1)
+        self.socket.bind(endpoint)
+        self.parser = parser
+        self._done = threading.Event()
+
+    def run(self):
+        poller = zmq.Poller()
+        poller.register(self.socket, zmq.POLLIN)
+        while not self._done.is_set():
+            if not poller.poll(50):
+                continue
+            while self.socket.getsockopt(zmq.EVENTS) & zmq.POLLIN:
+                frames = self.socket.recv_multipart()
+                reply = self.parser.parse(frames[-1]).reply()
+                self.socket.send_multipart(frames[:-1] + [reply.dumps()])
+        self.socket.close(0)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+def endpoint(transport, name):
+    """\
+    :returns: A unique inproc or ipc endpoint.
+    """
+    if transport == 'inproc':
+        return 'inproc://{0}-{1}'.format(name, id(object()))
+    return 'ipc://{0}'.format(os.path.join(tempfile.mkdtemp(), name))
+
+class RPCBench(BenchmarkCase):
+    params = [{'transport': 'inproc'}, {'transport': 'ipc'}]
+    repeat = 3
+
+    def setUp(self):
+        self.ctx = zmq.Context()
+        self.parser = messages.parser('msgpack')
+        addr = endpoint(self.transport, 'rpc')
+        self.server = EchoServer(self.ctx, addr, self.parser)
+        self.server.start()
+        self.req = sockets.req_socket(self.ctx, rtimeo=-1)
+        self.req.connect(addr)
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.client = RPCClient(self.ctx, addr, self.parser)
+        self.requests = [messages.order('msgpack', mpid=i) for i in range(BATCH)]
+
+    def tearDown(self):
+        self.client.close(0)
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.req.close(0)
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        self.server.stop()
+        self.ctx.term()
+
+    def bench_req_lockstep(self):
+        for msg in self.requests:
+            self.req.send(msg.dumps())
+            self.parser.parse(self.req.recv())
+
+    def bench_dealer_pipelined(self):
+        self.loop.run_until_complete(asyncio.gather(
+            *[self.client.request(msg) for msg in self.requests]))
@@ -0,0 +1,153 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.bench.bench_shm
+:synopsis: Shared memory ring versus ipc socket benchmarks.
+:author: Amr Ali <amr@ledgerx.com>
+
+The benchmark cases send and receive within one process. Run
+``python -m ledgerx.protocol.bench.bench_shm`` for one-way latency
+percentiles between two processes.
+"""
+
+import os
+import time
+import struct
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+
+import zmq
+
+from ledgerx.protocol import sockets
+from ledgerx.protocol.bench import BenchmarkCase
+from ledgerx.protocol.bench import messages
+from ledgerx.protocol.metrics import Histogram
+from ledgerx.protocol.shm import RingProducer, RingConsumer, ring_path
+from ledgerx.protocol.system import monotonic
+
+_stamp = struct.Struct('<Q')
+
+class ShmBench(BenchmarkCase):
+    params = [{'serializer': 'json'}, {'serializer': 'msgpack'}]
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.ctx = zmq.Context()
+        self.pull = sockets.pull_socket(self.ctx, rtimeo=-1)
+        self.pull.bind('ipc://{0}'.format(os.path.join(self.dir, 'ipc')))
+        self.push = sockets.push_socket(self.ctx)
+        self.push.connect(self.pull.LAST_ENDPOINT)
+        path = ring_path('bench', self.dir)
+        self.producer = RingProducer(path)
+        self.consumer = RingConsumer(path)
+        self.parser = messages.parser(self.serializer)
+        self.msg = messages.order(self.serializer)
+
+    def tearDown(self):
+        self.consumer.close()
+        self.producer.close(unlink=True)
+        self.push.close(0)
+        self.pull.close(0)
+        self.ctx.term()
+        shutil.rmtree(self.dir)
+
+    def bench_ipc(self):
+        self.push.send(self.msg.dumps())
+        self.parser.parse(self.pull.recv())
+
+    def bench_shm(self):
+        self.producer.send(self.msg.dumps())
+        self.parser.parse(self.consumer.recv())
+
+def _consume_ipc(endpoint, count, queue):
+    ctx = zmq.Context()
+    pull = sockets.pull_socket(ctx, rtimeo=-1)
+    pull.connect(endpoint)
+    queue.put(None)
+    hist = Histogram()
+    for _ in range(count):
+        data = pull.recv()
+        hist.record(int(monotonic() * 1e9) - _stamp.unpack_from(data)[0])
+    pull.close(0)
+    ctx.term()
+    queue.put(hist.snapshot())
+
+def _consume_shm(path, count, queue, spin):
+    consumer = RingConsumer(path, spin=spin)
+    queue.put(None)
+    hist = Histogram()
+    for _ in range(count):
+        data = consumer.recv()
+        hist.record(int(monotonic() * 1e9) - _stamp.unpack_from(data)[0])
+    queue.put(dict(hist.snapshot(), **consumer.stats))
+    consumer.close()
+
+def one_way(transport, count=10000, interval=0.0001, size=256, spin=1000):
+    """\
+    Measure the one-way latency of ``count`` messages of ``size`` bytes sent
+    every ``interval`` seconds to a consumer process.
+
+    :param transport: ``ipc`` or ``shm``.
+    :param spin: The consumer's spin count for ``shm``.
+    :returns: A :meth:`Histogram.snapshot` of the latencies in nanoseconds.
+    """
+    tmp = tempfile.mkdtemp()
+    queue = multiprocessing.Queue()
+    padding = b'\x00' * (size - _stamp.size)
+    ctx = None
+    try:
+        if transport == 'shm':
+            path = ring_path('bench', tmp)
+            producer = RingProducer(path)
+            send = producer.send
+            args = (path, count, queue, spin)
+            target = _consume_shm
+        else:
+            endpoint = 'ipc://{0}'.format(os.path.join(tmp, 'ipc'))
+            ctx = zmq.Context()
+            push = sockets.push_socket(ctx)
+            push.bind(endpoint)
+            send = push.send
+            args = (endpoint, count, queue)
+            target = _consume_ipc
+        proc = multiprocessing.Process(target=target, args=args)
+        proc.start()
+        queue.get()
+        time.sleep(0.1) # Let the consumer connect
+        for _ in range(count):
+            send(_stamp.pack(int(monotonic() * 1e9)) + padding)
+            time.sleep(interval)
+        res = queue.get()
+        proc.join()
+        return res
+    finally:
+        if ctx is not None:
+            push.close(0)
+            ctx.term()
+        else:
+            producer.close()
+        shutil.rmtree(tmp)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    ap.add_argument('-n', '--count', type=int, default=10000,
+            help='number of messages per measurement')
+    ap.add_argument('-i', '--interval', type=float, default=0.0001,
+            help='seconds between messages')
+    ap.add_argument('-s', '--size', type=int, default=256,
+            help='message size in bytes')
+    args = ap.parse_args(argv)
+
+    runs = [('ipc', 'ipc', None), ('shm', 'shm', 1000),
+            ('shm busy-poll', 'shm', None)]
+    for label, transport, spin in runs:
+        res = one_way(transport, args.count, args.interval, args.size, spin)
+        print('{0:<14} {1}'.format(label, '  '.join(
+            '{0} {1:>8.1f} us'.format(key, res[key] / 1e3)
+            for key in ('min', 'p50', 'p90', 'p99', 'p99.9', 'max'))))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.bench.bench_startup
+:synopsis: Import-time and cold-start benchmarks.
+:author: Amr Ali <amr@ledgerx.com>
+
+Every measurement runs in a fresh interpreter, the way a forked worker
+starts up. Run it with ``python -m ledgerx.protocol.bench.bench_startup``.
+Import times need Python 3.7+ (``-X importtime``).
+"""
+
+import sys
+import argparse
+import subprocess
+
+from statistics import median
+
+from ledgerx.protocol.detail import jsonapi
+
+MODULE = 'ledgerx.protocol.messages'
+
+_COLD_START = """\
+import time
+t0 = time.perf_counter()
+from ledgerx.protocol.bench import messages
+t1 = time.perf_counter()
+msg = messages.order({serializer!r})
+data = msg.dumps()
+t2 = time.perf_counter()
+messages.parser({serializer!r}).parse(data)
+t3 = time.perf_counter()
+msg.dumps()
+t4 = time.perf_counter()
+messages.parser({serializer!r}).parse(data)
+t5 = time.perf_counter()
+print('[%d, %d, %d, %d, %d]' % tuple(int(x * 1e9) for x in (
+    t1 - t0, t2 - t1, t3 - t2, t4 - t3, t5 - t4)))
+"""
+
+_COLD_START_KEYS = ('import', 'first_dumps', 'first_parse', 'dumps', 'parse')
+
+def import_times(module=MODULE, python=sys.executable):
+    """\
+    Import ``module`` in a fresh interpreter with ``-X importtime``.
+
+    :param module: The module to import.
+    :param python: The interpreter to use.
+    :returns: A list of ``(module, self us, cumulative us)`` in import order.
+    """
+    proc = subprocess.run([python, '-X', 'importtime', '-c',
+        'import {0}'.format(module)], stderr=subprocess.PIPE, check=True)
+    res = []
+    for line in proc.stderr.decode('utf8').splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            res.append((fields[2].strip(), int(fields[0]), int(fields[1])))
+        except ValueError: # The header line
+            pass
+    return res
+
+def cold_start(serializer='json', python=sys.executable):
+    """\
+    Time importing the message modules and encoding and parsing the first
+    message in a fresh interpreter.
+
+    :param serializer: ``json`` or ``msgpack``.
+    :param python: The interpreter to use.
+    :returns: A dictionary of timings in nanoseconds, including a second
+        ``dumps``/``parse`` for comparison with the first ones.
+    """
+    proc = subprocess.run([python, '-c',
+        _COLD_START.format(serializer=serializer)],
+        stdout=subprocess.PIPE, check=True)
+    return dict(zip(_COLD_START_KEYS, jsonapi.loads(proc.stdout)))
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    ap.add_argument('-n', '--runs', type=int, default=10,
+            help='number of fresh interpreters per measurement')
+    ap.add_argument('-t', '--top', type=int, default=15,
+            help='number of most expensive imports to list')
+    args = ap.parse_args(argv)
+
+    runs = [import_times() for _ in range(args.runs)]
+    total = median(r[-1][2] for r in runs)
+    print('import {0}: {1:.1f} ms (median of {2})'.format(
+        MODULE, total / 1e3, args.runs))
+    for name, self_us, cum_us in sorted(runs[-1], key=lambda x: -x[1])[:args.top]:
+        print('  {0:<48} self {1:>7} us  cumulative {2:>7} us'.format(
+            name, self_us, cum_us))
+
+    for serializer in ('json', 'msgpack'):
+        runs = [cold_start(serializer) for _ in range(args.runs)]
+        print('cold start ({0}):'.format(serializer))
+        for key in _COLD_START_KEYS:
+            print('  {0:<12} {1:>10.1f} us'.format(
+                key, median(r[key] for r in runs) / 1e3))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.bench.bench_system
+:synopsis: Benchmarks for the system module.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+from ledgerx.protocol.bench import BenchmarkCase
+from ledgerx.protocol.system import realtime, monotonic
+
+class ClockBench(BenchmarkCase):
+
+    def bench_realtime(self):
+        realtime()
+
+    def bench_monotonic(self):
+        monotonic()
@@ -0,0 +1,206 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.bench.messages
+:synopsis: A sample protocol with realistic message shapes for benchmarks.
+:author: Amr Ali <amr@ledgerx.com>
+
+The same messages are declared once per serializer so that nested
+``MessageComplexField`` values are encoded with the serializer of their
+parent.
+"""
+
+from types import SimpleNamespace
+
+from ledgerx.protocol.messages import (
+        Version,
+        MessageField,
+        MessageComplexField,
+        MessageMeta,
+        BaseMessageParser,
+        BaseMessageStatus,
+        JsonMessage,
+        MsgPackMessage,
+        MessageIDMixin,
+        MessageMPIDMixin,
+        MessageCIDMixin,
+        MessageVersionMixin,
+        MessageTypeMixin,
+        MessageTimeMixin)
+
+VERSION = '1.0.0'
+
+class _Message(MessageTypeMixin, MessageVersionMixin, MessageIDMixin,
+        MessageTimeMixin):
+    Version = Version(VERSION)
+    StatusMessage = None
+
+    def reply(self):
+        status = self.StatusMessage()
+        status.mid = self.mid
+        return status
+
+class _Status(BaseMessageStatus):
+    Type = 'status'
+
+    def set(self, code, message, data):
+        self.status = code
+        self.message = message
+        self.data = data
+        return self
+
+    def client_error(self, message):
+        return self.set(400, message, None)
+
+    def server_error(self, message):
+        return self.set(500, message, None)
+
+class _Order(MessageMPIDMixin, MessageCIDMixin):
+    Type = 'order'
+
+    @MessageField
+    def contract_id(self):
+        return self._contract_id
+
+    @contract_id.setter
+    def contract_id(self, val):
+        self._contract_id = val
+
+    @MessageField
+    def price(self):
+        return self._price
+
+    @price.setter
+    def price(self, val):
+        self._price = val
+
+    @MessageField
+    def size(self):
+        return self._size
+
+    @size.setter
+    def size(self, val):
+        self._size = val
+
+    @MessageField
+    def is_ask(self):
+        return self._is_ask
+
+    @is_ask.setter
+    def is_ask(self, val):
+        self._is_ask = val
+
+class _BookEntry(object, metaclass=MessageMeta):
+    Type = 'book_entry'
+
+    @MessageField
+    def price(self):
+        return self._price
+
+    @price.setter
+    def price(self, val):
+        self._price = val
+
+    @MessageField
+    def size(self):
+        return self._size
+
+    @size.setter
+    def size(self, val):
+        self._size = val
+
+class _BookState(object, metaclass=MessageMeta):
+    Type = 'book_state'
+
+    @MessageField
+    def contract_id(self):
+        return self._contract_id
+
+    @contract_id.setter
+    def contract_id(self, val):
+        self._contract_id = val
+
+    @MessageComplexField
+    def entries(self):
+        if self._entries is None:
+            self._entries = []
+        return self._entries
+
+    @entries.setter
+    def entries(self, val):
+        self._entries = val
+
+class JsonStatus(_Status, _Message, JsonMessage): pass
+class JsonOrder(_Order, _Message, JsonMessage): pass
+class JsonBookEntry(_BookEntry, _Message, JsonMessage): pass
+class JsonBookState(_BookState, _Message, JsonMessage): pass
+
+class MsgPackStatus(_Status, _Message, MsgPackMessage): pass
+class MsgPackOrder(_Order, _Message, MsgPackMessage): pass
+class MsgPackBookEntry(_BookEntry, _Message, MsgPackMessage): pass
+class MsgPackBookState(_BookState, _Message, MsgPackMessage): pass
+
+class JsonRoot(_Message, JsonMessage):
+    StatusMessage = JsonStatus
+
+class MsgPackRoot(_Message, MsgPackMessage):
+    StatusMessage = MsgPackStatus
+
+for _klass in (JsonStatus, JsonOrder, JsonBookEntry, JsonBookState):
+    _klass.StatusMessage = JsonStatus
+for _klass in (MsgPackStatus, MsgPackOrder, MsgPackBookEntry, MsgPackBookState):
+    _klass.StatusMessage = MsgPackStatus
+
+class JsonParser(BaseMessageParser):
+    ParentMessage = JsonRoot
+    MessageStatus = JsonStatus
+    MessageVersions = {VERSION: SimpleNamespace(MessageTypes={
+        k.Type: k for k in (JsonStatus, JsonOrder, JsonBookEntry, JsonBookState)})}
+
+class MsgPackParser(BaseMessageParser):
+    ParentMessage = MsgPackRoot
+    MessageStatus = MsgPackStatus
+    MessageVersions = {VERSION: SimpleNamespace(MessageTypes={
+        k.Type: k for k in (MsgPackStatus, MsgPackOrder, MsgPackBookEntry,
+            MsgPackBookState)})}
+
+SERIALIZERS = {
+        'json': (JsonParser, JsonOrder, JsonBookState, JsonBookEntry),
+        'msgpack': (MsgPackParser, MsgPackOrder, MsgPackBookState, MsgPackBookEntry),
+        }
+
+def order(serializer='json', mpid=1, contract_id=22200001):
+    """\
+    Build a new-order message.
+    """
+    msg = SERIALIZERS[serializer][1]()
+    msg.generate_mid()
+    msg.mpid = mpid
+    msg.cid = 4815162342
+    msg.contract_id = contract_id
+    msg.price = 125000
+    msg.size = 10
+    msg.is_ask = False
+    return msg
+
+def book_state(serializer='json', depth=10, contract_id=22200001):
+    """\
+    Build a book state message with ``depth`` nested book entries.
+    """
+    _, _, book_klass, entry_klass = SERIALIZERS[serializer]
+    msg = book_klass()
+    msg.generate_mid()
+    msg.contract_id = contract_id
+    for i in range(depth):
+        entry = entry_klass()
+        entry.price = 125000 + i * 100
+        entry.size = 10 + i
+        msg.entries.append(entry)
+    return msg
+
+def parser(serializer='json'):
+    """\
+    :returns: The parser class of ``serializer``.
+    """
+    return SERIALIZERS[serializer][0]
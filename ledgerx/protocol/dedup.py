@@ -0,0 +1,152 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.dedup
+:synopsis: Duplicate message suppression in fixed memory.
+:author: Amr Ali <amr@ledgerx.com>
+
+Retried requests keep their message ID, and a DEALER that reconnects may
+deliver a message twice. A :class:`Deduplicator` remembers the last
+``capacity`` message IDs, and optionally only those seen in the last
+``window`` seconds, in a ring: remembering an ID evicts the oldest one once
+the ring is full, so memory stays fixed and every operation is O(1).
+
+>>> dedup = Deduplicator(capacity=100000, window=60)
+>>> reactor = Reactor(dedup=dedup)
+
+IDs are kept as 16 bytes rather than 32 hex characters unless ``compact``
+is off. A reply carries the ID of its request, so a process that receives
+both should deduplicate each direction separately.
+"""
+
+import array
+
+from binascii import unhexlify as _unhexlify
+
+from ledgerx.protocol.system import monotonic
+
+class Deduplicator(object):
+    """\
+    A set of the most recently seen message IDs.
+    """
+
+    def __init__(self, capacity=65536, window=None, compact=True):
+        """\
+        :param capacity: The number of IDs remembered.
+        :param window: Forget IDs seen more than this many seconds ago
+            (default: only forget them when the ring is full).
+        :param compact: Store IDs as bytes; IDs that are not hex are stored
+            as they are.
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.window = window
+        self.compact = compact
+        self.stats = {'checked': 0, 'duplicates': 0, 'evicted': 0,
+                'expired': 0}
+        self._seen = set()
+        self._ring = [None] * capacity
+        self._times = array.array('d', bytes(8 * capacity)) \
+                if window is not None else None
+        self._head = 0 # The next position to write
+        self._tail = 0 # The oldest position, with the window
+
+    def __len__(self):
+        return len(self._seen)
+
+    def __contains__(self, mid):
+        if self.window is not None:
+            self._expire(monotonic())
+        return self._key(mid) in self._seen
+
+    def _key(self, mid):
+        if not self.compact:
+            return mid
+        try:
+            return _unhexlify(mid)
+        except (ValueError, TypeError):
+            return mid
+
+    def _expire(self, now):
+        seen = self._seen
+        ring = self._ring
+        times = self._times
+        limit = now - self.window
+        tail = self._tail
+        while seen:
+            key = ring[tail]
+            if key is None or times[tail] > limit:
+                break
+            seen.remove(key)
+            ring[tail] = None
+            self.stats['expired'] += 1
+            tail = (tail + 1) % self.capacity
+        self._tail = tail
+
+    def seen(self, mid):
+        """\
+        Check and remember a message ID.
+
+        :returns: True if the ID was seen before, i.e., the message is a
+            duplicate.
+        """
+        stats = self.stats
+        stats['checked'] += 1
+        key = mid
+        if self.compact:
+            try:
+                key = _unhexlify(mid)
+            except (ValueError, TypeError):
+                pass
+        seen = self._seen
+        ring = self._ring
+        window = self.window
+        if window is not None:
+            now = monotonic()
+            tail = self._tail
+            if ring[tail] is not None and self._times[tail] <= now - window:
+                self._expire(now)
+        if key in seen:
+            stats['duplicates'] += 1
+            return True
+        head = self._head
+        old = ring[head]
+        if old is not None:
+            seen.remove(old)
+            stats['evicted'] += 1
+            self._tail = (head + 1) % self.capacity
+        ring[head] = key
+        seen.add(key)
+        if window is not None:
+            self._times[head] = now
+        self._head = (head + 1) % self.capacity
+        return False
+
+    def check(self, msg):
+        """\
+        Check and remember the ID of a message.
+
+        :returns: True if the message is a duplicate; messages without an
+            ID never are.
+        """
+        mid = getattr(msg, 'mid', None)
+        if mid is None:
+            return False
+        return self.seen(mid)
+
+    def filter(self, msgs):
+        """\
+        :returns: An iterator of the messages that are not duplicates.
+        """
+        check = self.check
+        return (msg for msg in msgs if not check(msg))
+
+    def clear(self):
+        """\
+        Forget every ID.
+        """
+        self._seen.clear()
+        self._ring = [None] * self.capacity
+        self._head = self._tail = 0
@@ -41,10 +41,10 @@ def loads(s, **kwargs):
     Load object from JSON bytes (utf-8).
     See :func:`jsonapi.jsonmod.loads` for details on kwargs.
 
-    :param s: A JSON string of bytes.
+    :param s: A JSON string of bytes (or any bytes-like object).
     :returns: A Python object.
     """
-    if isinstance(s, bytes):
-        s = s.decode('utf8')
+    if isinstance(s, (bytes, bytearray, memoryview)):
+        s = str(s, 'utf8')
     return _jsonmod.loads(s, **kwargs)
 
@@ -0,0 +1,622 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.journal
+:synopsis: An append-only memory-mapped message journal with replay.
+:author: Amr Ali <amr@ledgerx.com>
+
+A :class:`Journal` appends serialized messages to preallocated segment files
+in a directory. Every record is the frame exactly as it was sent or
+received, after a small header of its length, direction, type ID, MID and
+wall clock timestamp in nanoseconds, so recording costs a copy into the
+mapped segment and no serialization:
+
+>>> journal = Journal('/var/lib/ledgerx/journal')
+>>> journal.record(frame, msg, INBOUND)
+
+A :class:`JournalReader` replays the records, e.g., through a parser:
+
+>>> for ts, flags, tid, mid, msg in JournalReader(path).replay(JsonParser):
+...     pass
+
+Records are flushed to disk according to the sync policy:
+
+* :data:`SYNC_ALWAYS` flushes every record before :meth:`Journal.append`
+  returns.
+* :data:`SYNC_BATCH` flushes every ``sync_count`` records or
+  ``sync_interval`` seconds, whichever comes first, amortizing the flush.
+  The interval is checked on append, so when writes stop the last records
+  wait for :meth:`Journal.flush_due` to be called, e.g., from a timer:
+
+  >>> reactor.call_every(journal.sync_interval, journal.flush_due)
+* :data:`SYNC_NEVER` leaves writing back to the kernel, which survives a
+  crash of the process but not of the host.
+
+A record is complete once its length is written, which is done last; a
+journal reopened after a crash resumes after its last complete record.
+
+Every segment can have two sidecar indexes, written by the journal when a
+segment is complete or closed (``index=True``) or by :func:`build_index`:
+a sorted timestamp index and a hash table of MIDs. Only the records they
+match are decoded:
+
+>>> reader = JournalReader(path)
+>>> list(reader.find(mid, JsonParser))
+>>> list(reader.window(start_ns, end_ns))
+
+Records appended after an index was written are found by scanning their
+headers.
+"""
+
+import os
+import mmap
+import array
+import struct
+import binascii
+
+from ledgerx.protocol.registry import registry_of
+from ledgerx.protocol.system import realtime, monotonic
+
+MAGIC = b'LXJ1'
+
+INBOUND = 1
+OUTBOUND = 2
+
+SYNC_ALWAYS = 'always'
+SYNC_BATCH = 'batch'
+SYNC_NEVER = 'never'
+
+SYNC_POLICIES = (SYNC_ALWAYS, SYNC_BATCH, SYNC_NEVER)
+
+# magic, segment number
+_segment = struct.Struct('<4sQ')
+_SEGMENT_HEADER_SIZE = 64
+# length, flags, type ID, timestamp, MID
+_record = struct.Struct('<IIIQ16s')
+_length = struct.Struct('<I')
+# The length of a segment's last record: continue in the next segment
+_SEALED = 0xffffffff
+_NO_MID = b'\x00' * 16
+_NO_TID = 0xffffffff
+
+TS_INDEX_MAGIC = b'LXT1'
+MID_INDEX_MAGIC = b'LXM1'
+
+# magic, end of the records indexed, number of entries or slots
+_index = struct.Struct('<4sQQ')
+_INDEX_HEADER_SIZE = 64
+# timestamp, offset
+_ts_entry = struct.Struct('<QQ')
+# MID, offset + 1 (0: empty)
+_mid_entry = struct.Struct('<16sQ')
+
+def segment_path(directory, number):
+    """\
+    :returns: The path of segment ``number`` of the journal in ``directory``.
+    """
+    return os.path.join(directory, '{0:010d}.journal'.format(number))
+
+def ts_index_path(directory, number):
+    """\
+    :returns: The path of the timestamp index of segment ``number``.
+    """
+    return os.path.join(directory, '{0:010d}.tsidx'.format(number))
+
+def mid_index_path(directory, number):
+    """\
+    :returns: The path of the MID index of segment ``number``.
+    """
+    return os.path.join(directory, '{0:010d}.mididx'.format(number))
+
+def segments(directory):
+    """\
+    :returns: The segment numbers of the journal in ``directory`` in order.
+    """
+    res = []
+    for name in os.listdir(directory):
+        base, ext = os.path.splitext(name)
+        if ext == '.journal' and base.isdigit():
+            res.append(int(base))
+    return sorted(res)
+
+def _map(path, size=None):
+    # Map a segment, creating it with ``size`` bytes if it is given
+    if size is None:
+        fd = os.open(path, os.O_RDONLY)
+    else:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_RDWR, 0o644)
+    try:
+        if size is None:
+            return mmap.mmap(fd, os.fstat(fd).st_size, access=mmap.ACCESS_READ)
+        try:
+            # Allocate the blocks up front rather than on first touch
+            os.posix_fallocate(fd, 0, size)
+        except (AttributeError, OSError):
+            os.ftruncate(fd, size)
+        return mmap.mmap(fd, size)
+    finally:
+        os.close(fd)
+
+def _scan(buf, pos=_SEGMENT_HEADER_SIZE):
+    """\
+    :returns: The offset of the end of the complete records of a segment and
+        whether it is sealed.
+    """
+    size = len(buf)
+    while pos + _length.size <= size:
+        length = _length.unpack_from(buf, pos)[0]
+        if length == _SEALED:
+            return pos, True
+        end = pos + _record.size + length
+        if length == 0 or end > size:
+            break
+        pos = end
+    return pos, False
+
+def _headers(buf, pos=_SEGMENT_HEADER_SIZE):
+    """\
+    Iterate over the complete records of a segment from ``pos``.
+
+    :returns: An iterator of ``(offset, length, flags, tid, ts, mid)``.
+    """
+    unpack = _record.unpack_from
+    header = _record.size
+    size = len(buf)
+    while pos + header <= size:
+        length, flags, tid, ts, mid = unpack(buf, pos)
+        if length == 0 or length == _SEALED or pos + header + length > size:
+            return
+        yield pos, length, flags, tid, ts, mid
+        pos += header + length
+
+def _read(buf, pos, parser=None):
+    # The record at ``pos`` as yielded by JournalReader.records()
+    length, flags, tid, ts, mid = _record.unpack_from(buf, pos)
+    start = pos + _record.size
+    data = buf[start:start + length]
+    return (ts, flags, None if tid == _NO_TID else tid, _unpack_mid(mid),
+            data if parser is None else parser.parse(data))
+
+def _replace(path, data):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as fd:
+        fd.write(data)
+    os.replace(tmp, path)
+
+def _write_indexes(directory, number, end, stamps, offsets, mids):
+    """\
+    Write the indexes of the records of a segment up to ``end``.
+
+    :param stamps: The timestamps of the records.
+    :param offsets: The offsets of the records.
+    :param mids: The packed MIDs of the records concatenated.
+    """
+    count = len(offsets)
+    order = sorted(range(count), key=lambda i: (stamps[i], offsets[i]))
+    data = bytearray(_INDEX_HEADER_SIZE + count * _ts_entry.size)
+    _index.pack_into(data, 0, TS_INDEX_MAGIC, end, count)
+    pos = _INDEX_HEADER_SIZE
+    for i in order:
+        _ts_entry.pack_into(data, pos, stamps[i], offsets[i])
+        pos += _ts_entry.size
+    _replace(ts_index_path(directory, number), data)
+
+    # Open addressing with linear probing at a load factor of at most 1/2;
+    # MIDs are random, so their first bytes are a good hash
+    slots = 8
+    while slots < count * 2:
+        slots *= 2
+    mask = slots - 1
+    data = bytearray(_INDEX_HEADER_SIZE + slots * _mid_entry.size)
+    _index.pack_into(data, 0, MID_INDEX_MAGIC, end, slots)
+    for i in range(count):
+        mid = mids[i * 16:i * 16 + 16]
+        if mid == _NO_MID:
+            continue
+        slot = int.from_bytes(mid[:8], 'little') & mask
+        while _mid_entry.unpack_from(data,
+                _INDEX_HEADER_SIZE + slot * _mid_entry.size)[1]:
+            slot = (slot + 1) & mask
+        _mid_entry.pack_into(data, _INDEX_HEADER_SIZE +
+                slot * _mid_entry.size, mid, offsets[i] + 1)
+    _replace(mid_index_path(directory, number), data)
+
+def _load_index(path, magic):
+    """\
+    :returns: ``(buffer, end, count)`` of an index or None if it does not
+        exist.
+    """
+    try:
+        buf = memoryview(_map(path))
+    except FileNotFoundError:
+        return None
+    if len(buf) < _INDEX_HEADER_SIZE or \
+            _index.unpack_from(buf, 0)[0] != magic:
+        raise ValueError("{0} is not a journal index".format(path))
+    _, end, count = _index.unpack_from(buf, 0)
+    return buf, end, count
+
+def _bisect(entries, count, ts):
+    """\
+    :returns: The position of the first entry of a timestamp index at or
+        after ``ts``, without loading the entries.
+    """
+    lo, hi = 0, count
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if _ts_entry.unpack_from(entries,
+                _INDEX_HEADER_SIZE + mid * _ts_entry.size)[0] < ts:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+def build_index(directory, numbers=None):
+    """\
+    Write the indexes of segments that have none or an outdated one.
+
+    :param directory: The journal directory.
+    :param numbers: The segment numbers (default: all of them).
+    :returns: The numbers of the segments indexed.
+    """
+    res = []
+    for number in segments(directory) if numbers is None else numbers:
+        path = segment_path(directory, number)
+        buf = _map(path)
+        try:
+            if _segment.unpack_from(buf, 0)[0] != MAGIC:
+                raise ValueError("{0} is not a journal segment".format(path))
+            end = _scan(buf)[0]
+            index = _load_index(ts_index_path(directory, number),
+                    TS_INDEX_MAGIC)
+            if index is not None and index[1] == end and os.path.exists(
+                    mid_index_path(directory, number)):
+                continue
+            stamps, offsets, mids = array.array('Q'), array.array('Q'), \
+                    bytearray()
+            for pos, _, _, _, ts, mid in _headers(buf):
+                stamps.append(ts)
+                offsets.append(pos)
+                mids += mid
+            _write_indexes(directory, number, end, stamps, offsets, mids)
+            res.append(number)
+        finally:
+            buf.close()
+    return res
+
+def _pack_mid(mid):
+    # IDs that are not 16 bytes of hex are not recorded; MessageIDMixin
+    # only checks their length
+    if not mid or len(mid) != 32:
+        return _NO_MID
+    try:
+        return binascii.unhexlify(mid)
+    except (ValueError, TypeError): # binascii.Error is a ValueError
+        return _NO_MID
+
+def _unpack_mid(mid):
+    if mid == _NO_MID:
+        return None
+    return binascii.hexlify(mid).decode('ascii')
+
+class Journal(object):
+    """\
+    The writer of a journal; there must be only one per directory.
+    """
+
+    def __init__(self, directory, segment_size=64 * 1024 * 1024,
+            sync=SYNC_BATCH, sync_count=1024, sync_interval=0.1, index=False):
+        """\
+        :param directory: The journal directory; it is created if needed and
+            an existing journal is appended to.
+        :param segment_size: The size of each segment file in bytes, which
+            bounds the size of a record.
+        :param sync: One of :data:`SYNC_POLICIES`.
+        :param sync_count: The number of records per flush with
+            :data:`SYNC_BATCH`.
+        :param sync_interval: The longest time between flushes with
+            :data:`SYNC_BATCH`, in seconds, provided :meth:`flush_due` is
+            called while no records are appended.
+        :param index: Write the indexes of every segment when it is complete
+            and when the journal is closed.
+        """
+        if sync not in SYNC_POLICIES:
+            raise ValueError("unknown sync policy {0!r}".format(sync))
+        self.directory = directory
+        self.segment_size = segment_size
+        self.sync = sync
+        self.sync_count = sync_count
+        self.sync_interval = sync_interval
+        self.index = index
+        self.stats = {'records': 0, 'bytes': 0, 'syncs': 0, 'segments': 0}
+        self._mmap = None
+        os.makedirs(directory, exist_ok=True)
+        existing = segments(directory)
+        if existing:
+            self._resume(existing[-1])
+        else:
+            self._open(0)
+
+    def _open(self, number):
+        self._mmap = _map(segment_path(self.directory, number),
+                self.segment_size)
+        _segment.pack_into(self._mmap, 0, MAGIC, number)
+        self.segment = number
+        self._pos = self._synced = _SEGMENT_HEADER_SIZE
+        self._unsynced = 0
+        self._last_sync = monotonic()
+        self._clear_index()
+        self.stats['segments'] += 1
+
+    def _clear_index(self):
+        self._stamps = array.array('Q')
+        self._offsets = array.array('Q')
+        self._mids = bytearray()
+
+    def _resume(self, number):
+        path = segment_path(self.directory, number)
+        fd = os.open(path, os.O_RDWR)
+        try:
+            buf = mmap.mmap(fd, os.fstat(fd).st_size)
+        finally:
+            os.close(fd)
+        magic, _ = _segment.unpack_from(buf, 0)
+        if magic != MAGIC:
+            buf.close()
+            raise ValueError("{0} is not a journal segment".format(path))
+        pos, sealed = _scan(buf)
+        if sealed or len(buf) != self.segment_size:
+            buf.close()
+            self._open(number + 1)
+            return
+        # Clear what remains of a record torn by a crash
+        buf[pos:pos + _length.size] = b'\x00' * _length.size
+        self._mmap = buf
+        self.segment = number
+        self._pos = self._synced = pos
+        self._unsynced = 0
+        self._last_sync = monotonic()
+        self._clear_index()
+        if self.index:
+            for pos, _, _, _, ts, mid in _headers(buf):
+                self._stamps.append(ts)
+                self._offsets.append(pos)
+                self._mids += mid
+
+    def append(self, data, flags=0, tid=None, mid=None, ts=None):
+        """\
+        Append a record.
+
+        :param data: The serialized message, a non-empty bytes-like object.
+        :param flags: :data:`INBOUND`, :data:`OUTBOUND` or any other bits.
+        :param tid: The message type ID (default: unknown).
+        :param mid: The message ID as 32 hex digits (default: none); other
+            IDs are recorded as none.
+        :param ts: The timestamp in nanoseconds (default: now).
+        """
+        length = len(data)
+        if not length:
+            # A zero length marks the end of the records
+            raise ValueError("cannot append an empty record")
+        pos = self._pos
+        end = pos + _record.size + length
+        # Leave room to seal the segment
+        if end + _length.size > self.segment_size:
+            if _SEGMENT_HEADER_SIZE + _record.size + length + _length.size \
+                    > self.segment_size:
+                raise ValueError("record of {0} bytes exceeds the segment "
+                        "size of {1}".format(length, self.segment_size))
+            self._roll()
+            pos = self._pos
+            end = pos + _record.size + length
+        if ts is None:
+            ts = int(realtime() * 1e9)
+        if tid is None:
+            tid = _NO_TID
+        mid = _pack_mid(mid)
+        buf = self._mmap
+        buf[pos + _record.size:end] = data
+        _record.pack_into(buf, pos, 0, flags, tid, ts, mid)
+        _length.pack_into(buf, pos, length)
+        self._pos = end
+        if self.index:
+            self._stamps.append(ts)
+            self._offsets.append(pos)
+            self._mids += mid
+        stats = self.stats
+        stats['records'] += 1
+        stats['bytes'] += length
+        sync = self.sync
+        if sync == SYNC_NEVER:
+            return
+        self._unsynced += 1
+        if sync == SYNC_ALWAYS or self._unsynced >= self.sync_count or \
+                monotonic() - self._last_sync >= self.sync_interval:
+            self.flush()
+
+    def record(self, frame, msg, flags=0):
+        """\
+        Append a message as it was sent or received.
+
+        :param frame: The serialized message; None serializes ``msg``.
+        :param msg: The message, for the header fields.
+        :param flags: :data:`INBOUND` or :data:`OUTBOUND`.
+        """
+        if frame is None:
+            frame = msg.dumps()
+        tid = getattr(msg, 'tid', None)
+        if tid is None:
+            klass = getattr(msg, '_thawed_class', msg.__class__)
+            tid = registry_of(klass).type_id(klass)
+        self.append(frame, flags, tid, getattr(msg, 'mid', None))
+
+    def flush(self):
+        """\
+        Write the records appended since the last flush to disk.
+        """
+        start = self._synced - self._synced % mmap.ALLOCATIONGRANULARITY
+        if self._pos > start:
+            self._mmap.flush(start, self._pos - start)
+            self.stats['syncs'] += 1
+        self._synced = self._pos
+        self._unsynced = 0
+        self._last_sync = monotonic()
+
+    def flush_due(self):
+        """\
+        Flush if records were appended since the last flush and the sync
+        policy is :data:`SYNC_BATCH` and ``sync_interval`` has passed.
+
+        :returns: True if the journal was flushed.
+        """
+        if self.sync != SYNC_BATCH or not self._unsynced or \
+                monotonic() - self._last_sync < self.sync_interval:
+            return False
+        self.flush()
+        return True
+
+    def write_index(self):
+        """\
+        Write the indexes of the current segment.
+        """
+        _write_indexes(self.directory, self.segment, self._pos, self._stamps,
+                self._offsets, self._mids)
+
+    def _roll(self):
+        _length.pack_into(self._mmap, self._pos, _SEALED)
+        if self.sync != SYNC_NEVER:
+            self.flush()
+        if self.index:
+            self.write_index()
+        self._mmap.close()
+        self._open(self.segment + 1)
+
+    def close(self):
+        """\
+        Flush, unless the sync policy is :data:`SYNC_NEVER`, write the
+        indexes if enabled, and unmap the current segment.
+        """
+        if self._mmap is None:
+            return
+        if self.sync != SYNC_NEVER:
+            self.flush()
+        if self.index:
+            self.write_index()
+        self._mmap.close()
+        self._mmap = None
+
+class JournalReader(object):
+    """\
+    Replay the records of a journal, including one that is being written.
+    """
+
+    def __init__(self, directory):
+        """\
+        :param directory: The journal directory.
+        """
+        self.directory = directory
+
+    def _segments(self, start=None):
+        for number in segments(self.directory):
+            if start is not None and number < start:
+                continue
+            path = segment_path(self.directory, number)
+            buf = memoryview(_map(path))
+            if _segment.unpack_from(buf, 0)[0] != MAGIC:
+                raise ValueError("{0} is not a journal segment".format(path))
+            yield number, buf
+
+    def records(self, start=None, flags=None):
+        """\
+        Iterate over the records.
+
+        :param start: The first segment number (default: the oldest).
+        :param flags: Only yield records with any of these flags.
+        :returns: An iterator of ``(ts, flags, tid, mid, data)``, where
+            ``data`` is a memoryview into the segment and ``tid`` and ``mid``
+            (hex) are None if unknown.
+        """
+        header = _record.size
+        for _, buf in self._segments(start):
+            for pos, length, rflags, tid, ts, mid in _headers(buf):
+                if flags is None or rflags & flags:
+                    yield (ts, rflags, None if tid == _NO_TID else tid,
+                            _unpack_mid(mid),
+                            buf[pos + header:pos + header + length])
+
+    def replay(self, parser, start=None, flags=None):
+        """\
+        Iterate over the records, parsed.
+
+        :param parser: A :class:`BaseMessageParser` class.
+        :returns: An iterator of ``(ts, flags, tid, mid, msg)``; see
+            :meth:`records`.
+        """
+        parse = parser.parse
+        for ts, rflags, tid, mid, data in self.records(start, flags):
+            yield ts, rflags, tid, mid, parse(data)
+
+    def find(self, mid, parser=None):
+        """\
+        Iterate over the records of a message ID, e.g., a request and its
+        replies.
+
+        :param mid: The message ID as hex.
+        :param parser: A :class:`BaseMessageParser` class to parse the
+            records with (default: none).
+        :returns: An iterator of records; see :meth:`records` and
+            :meth:`replay`.
+        """
+        key = _pack_mid(mid)
+        if key == _NO_MID:
+            return
+        slot_size = _mid_entry.size
+        for number, buf in self._segments():
+            end = _SEGMENT_HEADER_SIZE
+            index = _load_index(mid_index_path(self.directory, number),
+                    MID_INDEX_MAGIC)
+            if index is not None:
+                table, end, slots = index
+                mask = slots - 1
+                slot = int.from_bytes(key[:8], 'little') & mask
+                while True:
+                    entry, offset = _mid_entry.unpack_from(table,
+                            _INDEX_HEADER_SIZE + slot * slot_size)
+                    if not offset:
+                        break
+                    if entry == key:
+                        yield _read(buf, offset - 1, parser)
+                    slot = (slot + 1) & mask
+            for pos, _, _, _, _, rmid in _headers(buf, end):
+                if rmid == key:
+                    yield _read(buf, pos, parser)
+
+    def window(self, start, end, parser=None):
+        """\
+        Iterate over the records in a time window, in timestamp order
+        within each segment.
+
+        :param start: The first timestamp in nanoseconds.
+        :param end: The timestamp in nanoseconds the window ends before.
+        :param parser: A :class:`BaseMessageParser` class to parse the
+            records with (default: none).
+        :returns: An iterator of records; see :meth:`records` and
+            :meth:`replay`.
+        """
+        entry_size = _ts_entry.size
+        for number, buf in self._segments():
+            tail = _SEGMENT_HEADER_SIZE
+            index = _load_index(ts_index_path(self.directory, number),
+                    TS_INDEX_MAGIC)
+            if index is not None:
+                entries, tail, count = index
+                for i in range(_bisect(entries, count, start), count):
+                    ts, offset = _ts_entry.unpack_from(entries,
+                            _INDEX_HEADER_SIZE + i * entry_size)
+                    if ts >= end:
+                        break
+                    yield _read(buf, offset, parser)
+            for pos, _, _, _, ts, _ in _headers(buf, tail):
+                if start <= ts < end:
+                    yield _read(buf, pos, parser)
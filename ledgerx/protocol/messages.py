@@ -7,11 +7,10 @@
 :author: Amr Ali <amr@ledgerx.com>
 """
 
+import os
 import sys
 import abc
-import logging
 
-from uuid import uuid4
 from types import MethodType
 from functools import partial
 from collections import Iterable
@@ -19,12 +18,30 @@ from semantic_version import Version
 
 from ledgerx.protocol.system import realtime, monotonic
 from ledgerx.protocol.detail import msgpack, jsonapi
+from ledgerx.protocol.registry import registry_of
 
 _asstr = lambda x: x.decode('utf8') if isinstance(x, bytes) else x
 
+def _logger():
+    # Only the error paths log, so don't pay for importing logging up front.
+    import logging
+    return logging.getLogger('ledgerx.protocol')
+
+def _uuid4_hex():
+    """\
+    Same as ``uuid.uuid4().hex`` without importing :mod:`uuid` or building
+    a :class:`uuid.UUID` object.
+    """
+    b = bytearray(os.urandom(16))
+    b[6] = b[6] & 0x0f | 0x40 # version 4
+    b[8] = b[8] & 0x3f | 0x80 # RFC-4122 variant
+    return b.hex()
+
 def record_message_type(klass):
     """\
-    A decorator to append a message to the source module's MessageTypes dictionary.
+    A decorator to append a message to the source module's MessageTypes dictionary
+    and assign it an integer type ID in the registry of its protocol family
+    (see :func:`registry.registry_of`).
 
     :param klass: The message class to be appended to MessageTypes.
     :returns: ``klass``
@@ -33,6 +50,7 @@ def record_message_type(klass):
     if not hasattr(module, 'MessageTypes'):
         module.MessageTypes = {}
     module.MessageTypes.update({klass.Type: klass})
+    registry_of(klass).register(klass)
     return klass
 
 class MessageField(property):
@@ -113,7 +131,7 @@ class MessageIDMixin(object, metaclass=MessageMeta):
     """\
     A message that includes a UUID field according to RFC-4122.
     """
-    FIELD_LENGTH = len(uuid4().hex)
+    FIELD_LENGTH = 32 # len(uuid4().hex)
 
     @MessageField
     def mid(self):
@@ -134,7 +152,7 @@ class MessageIDMixin(object, metaclass=MessageMeta):
 
         :returns: The newly generated ID.
         """
-        self._mid = uuid4().hex
+        self._mid = _uuid4_hex()
         for field in self.__complex__fields__:
             complex_vs = getattr(self, field)
             for v in complex_vs:
@@ -205,43 +223,114 @@ class MessageTypeMixin(object, metaclass=MessageMeta):
     def type(self, val):
         self._type = val
 
+class MessageTypeIDMixin(object, metaclass=MessageMeta):
+    """\
+    A message that can carry its registered integer type ID so parsers can
+    dispatch it with a table lookup.
+    """
+    Registry = None # The registry.TypeRegistry (default: the family's)
+
+    @MessageField
+    def tid(self):
+        return self._tid
+
+    @tid.setter
+    def tid(self, val):
+        if val is not None and not isinstance(val, int):
+            raise ValueError("type ID field must be an integer")
+        self._tid = val
+
+    def assign_tid(self):
+        """\
+        Set the ``tid`` field from the type registry.
+
+        :returns: The type ID or None if this message type is not registered.
+        """
+        klass = getattr(self, '_thawed_class', self.__class__)
+        self._tid = registry_of(klass).type_id(klass)
+        return self._tid
+
 class MessageTimeMixin(object, metaclass=MessageMeta):
     """\
-    A message that includes timer fields.
+    A message that includes timer fields (in nanoseconds).
     """
 
     @MessageField
     def timestamp(self):
         if not self._timestamp:
-            self._timestamp = realtime()
-        return int(self._timestamp * 1e9)
+            self._timestamp = int(realtime() * 1e9)
+        return self._timestamp
 
     @timestamp.setter
     def timestamp(self, val):
-        pass
+        if val is not None and not isinstance(val, int):
+            raise ValueError("timestamp field must be an integer")
+        self._timestamp = val
 
     @MessageField
     def ticks(self):
         if not self._ticks:
-            self._ticks = monotonic()
-        return int(self._ticks * 1e9)
+            self._ticks = int(monotonic() * 1e9)
+        return self._ticks
 
     @ticks.setter
     def ticks(self, val):
-        pass
+        if val is not None and not isinstance(val, int):
+            raise ValueError("ticks field must be an integer")
+        self._ticks = val
 
     def refresh_timers(self):
         """\
         Update both the ``timestamp`` and ``ticks`` fields.
         """
-        self._timestamp = realtime()
-        self._ticks = monotonic()
+        self._timestamp = int(realtime() * 1e9)
+        self._ticks = int(monotonic() * 1e9)
+
+class MessageTraceMixin(object, metaclass=MessageMeta):
+    """\
+    A message that carries a bounded trace of ``[hop, timestamp]`` stamps,
+    one per component it passed through. Timestamps are wall clock
+    nanoseconds so hops on different hosts can be compared.
+    """
+    MaxHops = 16
+
+    @MessageField
+    def trace(self):
+        return self._trace
+
+    @trace.setter
+    def trace(self, val):
+        if val is not None:
+            try:
+                val = [[_asstr(hop), int(ts)] for hop, ts in val]
+            except (TypeError, ValueError) as ex:
+                raise ValueError("trace field must be a list of [hop, timestamp]") from ex
+        self._trace = val
+
+    def stamp(self, hop, ts=None):
+        """\
+        Append a stamp to the trace. When the trace is full the oldest stamp
+        after the origin is dropped, so end-to-end latency is preserved.
+
+        :param hop: The name of the component stamping the message.
+        :param ts: The stamp in nanoseconds (default: now).
+        :returns: The stamp.
+        """
+        if ts is None:
+            ts = int(realtime() * 1e9)
+        if self._trace is None:
+            self._trace = []
+        if len(self._trace) >= self.MaxHops:
+            del self._trace[1 if self.MaxHops > 1 else 0]
+        self._trace.append([hop, ts])
+        return ts
 
 class BaseMessage(object, metaclass=MessageMeta):
     """\
     Base message contract to enforce a certain interface on all messages.
     """
     Serializer = None # must support pickle's interface
+    Metrics = None # e.g., metrics.MessageMetrics()
 
     def __setattr__(self, key, val):
         """\
@@ -256,6 +345,36 @@ class BaseMessage(object, metaclass=MessageMeta):
         """
         raise NotImplementedError("reply method is not implemented")
 
+    @property
+    def frozen(self):
+        """\
+        Whether :meth:`freeze` was called on this message.
+        """
+        return isinstance(self, _FrozenMessage)
+
+    def freeze(self):
+        """\
+        Make the fields of this message and of its nested messages read-only,
+        so it can be shared between threads without copying. The message is
+        finalized first and serialized only once. Lists (e.g., of nested
+        messages) remain mutable, but changing them after the message was
+        serialized does not change what :meth:`dumps` returns. Setting a
+        field or calling a method that changes one, e.g.,
+        :meth:`~MessageIDMixin.generate_mid`, raises AttributeError.
+
+        :returns: ``self``
+        """
+        if isinstance(self, _FrozenMessage):
+            return self
+        self.finalize()
+        for name in self.__complex__fields__:
+            val = getattr(self, name)
+            for item in val if isinstance(val, Iterable) else (val,):
+                if isinstance(item, BaseMessage):
+                    item.freeze()
+        self.__class__ = _frozen_class(self.__class__)
+        return self
+
     def finalize(self):
         """\
         A final operation to be made before serializing this message.
@@ -282,6 +401,10 @@ class BaseMessage(object, metaclass=MessageMeta):
         """\
         A method to serialize members of this instance to a particular format.
         """
+        metrics = self.Metrics
+        if metrics is not None:
+            t0 = monotonic()
+
         self.finalize()
         obj = {k: v for k, v in map(lambda x: (x, getattr(self, x)), self.__fields__) if v != None}
 
@@ -295,7 +418,10 @@ class BaseMessage(object, metaclass=MessageMeta):
             else: # Complex field contains a single complex object
                 obj[k] = v.dumps()
 
-        return self.Serializer.dumps(obj)
+        data = self.Serializer.dumps(obj)
+        if metrics is not None:
+            metrics.record('dumps', self, len(data), monotonic() - t0)
+        return data
 
     def dumps_custom(self, serializer):
         """\
@@ -312,11 +438,18 @@ class BaseMessage(object, metaclass=MessageMeta):
 
         :param data: A specially formatted string.
         """
+        metrics = self.Metrics
+        if metrics is not None:
+            t0 = monotonic()
+
         obj = self.Serializer.loads(data)
         [setattr(self, k, v)
                 for k, v in map(lambda x: (_asstr(x[0]), x[1]), obj.items())
                 if not k.startswith('_')]
 
+        if metrics is not None:
+            metrics.record('loads', self, len(data), monotonic() - t0)
+
     def loads_custom(self, serializer, data):
         """\
         A method to deserialize a message into this object using a supplied serializer.
@@ -335,6 +468,107 @@ class BaseMessage(object, metaclass=MessageMeta):
         finally:
             self.Serializer = bck
 
+class _FrozenMessage(object):
+    """\
+    The base of frozen message classes; see :meth:`BaseMessage.freeze`.
+    """
+
+    def __setattr__(self, key, val):
+        # Private attributes hold caches, e.g., of the lazy mversion field
+        if not key.startswith('_'):
+            raise AttributeError("cannot set '{0}' of a frozen message".format(key))
+        super().__setattr__(key, val)
+
+    def finalize(self):
+        pass # Done when frozen
+
+    def dumps(self):
+        # The fields cannot change, so neither can the serialized form
+        data = self.__dict__.get('_dumps')
+        if data is None:
+            data = super().dumps()
+            # Bypass the decoding of bytes fields by BaseMessage.__setattr__
+            object.__setattr__(self, '_dumps', data)
+        return data
+
+    def __reduce_ex__(self, protocol):
+        # Frozen classes are made on the fly and cannot be found by name
+        return (_unpickle_frozen, (self._thawed_class, self.__dict__))
+
+def _unpickle_frozen(klass, state):
+    obj = klass.__new__(klass)
+    obj.__dict__.update(state)
+    obj.__class__ = _frozen_class(klass)
+    return obj
+
+# The methods that change fields through their private attributes, which
+# _FrozenMessage.__setattr__ lets through
+_MUTATORS = ('generate_mid', 'refresh_timers', 'stamp')
+
+def _frozen_mutator(name):
+    def mutator(self, *args, **kwargs):
+        raise AttributeError("cannot call {0}() on a frozen message".format(
+            name))
+    mutator.__name__ = mutator.__qualname__ = name
+    return mutator
+
+_frozen_classes = {}
+
+def _frozen_class(klass):
+    frozen = _frozen_classes.get(klass)
+    if frozen is None:
+        namespace = {name: _frozen_mutator(name) for name in _MUTATORS
+                if hasattr(klass, name)}
+        namespace.update({
+            '__module__': klass.__module__,
+            '__qualname__': klass.__qualname__,
+            '_thawed_class': klass,
+            })
+        frozen = type(klass)(klass.__name__, (_FrozenMessage, klass),
+                namespace)
+        frozen = _frozen_classes.setdefault(klass, frozen)
+    return frozen
+
+class _ParseFailures(object):
+    """\
+    The failure counters, logging state and prebuilt replies of a parser.
+    """
+
+    @staticmethod
+    def of(parser):
+        # Not inherited, so that every parser counts its own failures
+        res = parser.__dict__.get('_failures')
+        if res is None:
+            res = _ParseFailures()
+            setattr(parser, '_failures', res)
+        return res
+
+    def __init__(self):
+        self.counts = {}
+        self.replies = {}
+        self._logged = {} # Reason -> (last logged, suppressed since)
+
+    def count(self, reason, message, exc_info, interval):
+        """\
+        Count a failure and log it, with its traceback if ``exc_info``, unless
+        a failure of the same reason was logged less than ``interval``
+        seconds ago; those are only counted and reported with the next one
+        logged. A client sending garbage thus costs a counter increment per
+        frame rather than a formatted traceback.
+        """
+        self.counts[reason] = self.counts.get(reason, 0) + 1
+        now = monotonic()
+        last, suppressed = self._logged.get(reason, (None, 0))
+        if last is not None and now - last < interval:
+            self._logged[reason] = (last, suppressed + 1)
+            return
+        self._logged[reason] = (now, 0)
+        if suppressed:
+            _logger().error("%s (%d more since last logged)", message,
+                    suppressed, exc_info=exc_info)
+        else:
+            _logger().error("%s", message, exc_info=exc_info)
+
 class BaseMessageParser(object):
     """\
     An abstract message parser to determine message type and version.
@@ -342,6 +576,60 @@ class BaseMessageParser(object):
     ParentMessage = None
     MessageStatus = None
     MessageVersions = {} # e.g., {version: <module>}
+    Metrics = None # e.g., metrics.MessageMetrics()
+    FailureLogInterval = 1.0 # Seconds between logged failures of a reason
+
+    @classmethod
+    def failures(cls):
+        """\
+        Get the parse failures of this parser (not of its subclasses).
+
+        :returns: A dictionary of failure reasons, e.g., ``unparsable``, to
+            counts.
+        """
+        return dict(_ParseFailures.of(cls).counts)
+
+    @staticmethod
+    def failure(msg):
+        """\
+        :returns: The failure reason if a message is the status reply that
+            :meth:`parse` returned for a frame it could not parse, otherwise
+            None.
+        """
+        return msg.__dict__.get('_failure')
+
+    @classmethod
+    def _fail(cls, reason, message, obj=None, server=False, exc_info=False):
+        """\
+        Count and maybe log a parse failure.
+
+        :param obj: The deserialized message, unless ``data`` was not even
+            that.
+        :returns: A new status reply, with the message ID of ``obj`` if it
+            has one. Frames that could not be deserialized all share one
+            frozen reply that serializes once; it cannot be changed and
+            carries the timestamp of the first of them.
+        """
+        failures = _ParseFailures.of(cls)
+        failures.count(reason, message, exc_info, cls.FailureLogInterval)
+        if obj is None:
+            reply = failures.replies.get(reason)
+            if reply is None:
+                reply = cls._fail_reply(reason, message, server)
+                reply = failures.replies[reason] = reply.freeze()
+            return reply
+        status = obj.reply() if getattr(obj, 'mid', None) is not None else \
+                None
+        return cls._fail_reply(reason, message, server, status)
+
+    @classmethod
+    def _fail_reply(cls, reason, message, server, status=None):
+        if status is None:
+            status = cls.MessageStatus()
+        status = status.server_error(message) if server else \
+                status.client_error(message)
+        status._failure = reason # See failure()
+        return status
 
     @classmethod
     def parse(cls, data, serializer=None):
@@ -354,8 +642,34 @@ class BaseMessageParser(object):
         :returns:
             A new object of the supplied message type.
         """
-        logger = logging.getLogger('ledgerx.protocol')
+        metrics = cls.Metrics
+        if metrics is None:
+            return cls._parse(data, serializer)
+        t0 = monotonic()
+        mobj = cls._parse(data, serializer)
+        metrics.record('parse', mobj, len(data), monotonic() - t0)
+        return mobj
 
+    @classmethod
+    def _learn_tid(cls, tid, version, mclass):
+        """\
+        Add a type of this parser to its type ID table, if ``tid`` is the ID
+        it is registered under. The table only ever holds the types of this
+        parser and is filled in as they are seen, so version modules that
+        are imported lazily need not be imported up front.
+        """
+        registry = registry_of(mclass)
+        if registry.lookup(tid) is not mclass or \
+                registry.key(tid) != (version, mclass.Type):
+            return
+        # Replace rather than change the table, so _parse needs no lock
+        tids = list(cls.__dict__.get('_tids', ()))
+        tids.extend([None] * (tid + 1 - len(tids)))
+        tids[tid] = (version, mclass.Type, mclass)
+        cls._tids = tuple(tids)
+
+    @classmethod
+    def _parse(cls, data, serializer):
         # Deserialize message
         try:
             obj = cls.ParentMessage()
@@ -364,25 +678,38 @@ class BaseMessageParser(object):
             else:
                 obj.loads_custom(serializer, data)
         except:
-            logger.exception("unable to parse a message")
-            return cls.MessageStatus().client_error("unable to parse message")
+            return cls._fail('unparsable', "unable to parse message",
+                    exc_info=True)
 
         # Determine message version
         try:
             if obj.mversion not in cls.MessageVersions:
-                return obj.reply().client_error("unsupported message version")
+                return cls._fail('unsupported_version',
+                        "unsupported message version", obj)
         except ValueError:
-            return obj.reply().client_error("invalid message version")
+            return cls._fail('invalid_version', "invalid message version", obj)
         except:
-            logger.exception("error occurred while parsing message version")
-            return obj.reply().server_error(
-                    "error occurred while parsing message version")
-
-        # Determine message type
-        mtypes = cls.MessageVersions[obj.mversion].MessageTypes
-        if obj.type not in mtypes:
-            return obj.reply().client_error("unsupported message type")
-        mobj = mtypes[obj.type]()
+            return cls._fail('version_error',
+                    "error occurred while parsing message version", obj,
+                    server=True, exc_info=True)
+
+        # Determine message type, preferring the integer type ID if present
+        tid = getattr(obj, 'tid', None)
+        tids = cls.__dict__.get('_tids', ())
+        entry = tids[tid] if isinstance(tid, int) and 0 <= tid < len(tids) \
+                else None
+        if entry is not None and entry[0] == obj.mversion and \
+                entry[1] == obj.type:
+            mclass = entry[2]
+        else:
+            mtypes = cls.MessageVersions[obj.mversion].MessageTypes
+            if obj.type not in mtypes:
+                return cls._fail('unsupported_type',
+                        "unsupported message type", obj)
+            mclass = mtypes[obj.type]
+            if tid is not None:
+                cls._learn_tid(tid, obj.mversion, mclass)
+        mobj = mclass()
 
         # Resolve complex fields
         for field in mobj.__complex__fields__:
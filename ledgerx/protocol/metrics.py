@@ -0,0 +1,230 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.metrics
+:synopsis: Lightweight histograms and message instrumentation.
+:author: Amr Ali <amr@ledgerx.com>
+
+Recording is lock-free and therefore approximate when several threads
+record into the same histogram at once, which is an acceptable trade for
+staying off the hot path.
+"""
+
+import threading
+
+class Histogram(object):
+    """\
+    A log-linear (HDR style) histogram of non-negative integers.
+
+    Values below ``2 ** precision`` are counted exactly; above that every
+    power of two is split into ``2 ** (precision - 1)`` linear buckets, so
+    the relative error of any reported value is below ``2 ** (1 - precision)``.
+    """
+    Percentiles = (50, 90, 99, 99.9)
+
+    def __init__(self, precision=5, max_bits=64):
+        self.precision = precision
+        self._max_bits = max_bits
+        self._counts = [0] * (self._index((1 << max_bits) - 1) + 1)
+        self.reset()
+
+    def reset(self):
+        """\
+        Clear all recorded values.
+        """
+        for i in range(len(self._counts)):
+            self._counts[i] = 0
+        self.count = 0
+        self.total = 0
+        self._min = 1 << self._max_bits
+        self._max = -1
+
+    @property
+    def min(self):
+        return self._min if self.count else None
+
+    @property
+    def max(self):
+        return self._max if self.count else None
+
+    def _index(self, val):
+        shift = val.bit_length() - self.precision
+        if shift <= 0:
+            return val
+        return (shift << (self.precision - 1)) + (val >> shift)
+
+    def _bounds(self, idx):
+        shift = (idx >> (self.precision - 1)) - 1
+        if shift <= 0:
+            return idx, idx
+        low = (idx - (shift << (self.precision - 1))) << shift
+        return low, low + (1 << shift) - 1
+
+    def record(self, val, count=1):
+        """\
+        Record ``val`` ``count`` times.
+
+        :param val: A non-negative integer; anything else is truncated or
+            clamped to zero.
+        """
+        val = int(val) if val > 0 else 0
+        # Same as self._index(val), inlined as this is the hot path
+        shift = val.bit_length() - self.precision
+        self._counts[val if shift <= 0 else
+                (shift << (self.precision - 1)) + (val >> shift)] += count
+        self.count += count
+        self.total += val * count
+        if val < self._min:
+            self._min = val
+        if val > self._max:
+            self._max = val
+
+    def merge(self, other):
+        """\
+        Add the values recorded in ``other`` to this histogram.
+        """
+        if other.precision != self.precision:
+            raise ValueError("cannot merge histograms of different precision")
+        for i, c in enumerate(other._counts):
+            if c:
+                self._counts[i] += c
+        self.count += other.count
+        self.total += other.total
+        self._min = min(self._min, other._min)
+        self._max = max(self._max, other._max)
+
+    def percentile(self, pct):
+        """\
+        :param pct: The percentile in the range [0, 100].
+        :returns: The highest value equivalent to the value at ``pct``, or
+            None if nothing has been recorded.
+        """
+        if not self.count:
+            return None
+        rank = max(1, int(round(pct / 100.0 * self.count)))
+        seen = 0
+        for i, c in enumerate(self._counts):
+            seen += c
+            if seen >= rank:
+                return min(self._bounds(i)[1], self._max)
+        return self._max
+
+    def buckets(self):
+        """\
+        :returns: A list of ``(low, high, count)`` for non-empty buckets.
+        """
+        return [self._bounds(i) + (c,) for i, c in enumerate(self._counts) if c]
+
+    def snapshot(self):
+        """\
+        :returns: A dictionary summary of this histogram.
+        """
+        res = {
+                'count': self.count,
+                'sum': self.total,
+                'min': self.min,
+                'max': self.max,
+                'mean': self.total / self.count if self.count else None,
+                }
+        for pct in self.Percentiles:
+            res['p{0:g}'.format(pct)] = self.percentile(pct)
+        return res
+
+def _copy(hist):
+    res = Histogram(hist.precision, hist._max_bits)
+    res.merge(hist)
+    return res
+
+class MessageMetrics(object):
+    """\
+    Per-message-type counters, byte sizes and latency histograms.
+
+    Assign an instance to ``BaseMessage.Metrics`` and/or
+    ``BaseMessageParser.Metrics`` (or to a subclass) to enable it.
+    Operations are ``dumps``, ``loads`` and ``parse``. Nested messages of
+    ``MessageComplexField`` fields are recorded on their own as well as
+    part of their parent.
+    """
+
+    def __init__(self, precision=5):
+        self.precision = precision
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, op, msg, nbytes, seconds):
+        """\
+        Record a single operation.
+
+        :param op: ``dumps``, ``loads`` or ``parse``.
+        :param msg: The message that was encoded or decoded.
+        :param nbytes: The size of the serialized message.
+        :param seconds: The duration of the operation.
+        """
+        # Key on the raw field values; the mversion getter is too slow here
+        fields = msg.__dict__
+        key = (op, fields.get('_type'), fields.get('_mversion'))
+        stats = self._stats.get(key)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(key, (
+                    Histogram(self.precision), Histogram(self.precision)))
+        stats[0].record(seconds * 1e9)
+        stats[1].record(nbytes)
+
+    def snapshot(self, reset=False):
+        """\
+        Get the recorded metrics.
+
+        :param reset: Start over after taking the snapshot.
+        :returns: A list of dictionaries with ``op``, ``type``, ``mversion``,
+            ``count``, ``bytes``, ``latency_ns`` and ``size`` entries; the
+            last two are :meth:`Histogram.snapshot` summaries.
+        """
+        with self._lock:
+            stats = self._stats
+            if reset:
+                self._stats = {}
+        merged = {}
+        for (op, mtype, mversion), (latency, size) in list(stats.items()):
+            key = (op, mtype, str(mversion) if mversion is not None else None)
+            if key in merged:
+                merged[key][0].merge(latency)
+                merged[key][1].merge(size)
+            else:
+                merged[key] = (_copy(latency), _copy(size))
+
+        res = []
+        for (op, mtype, mversion), (latency, size) in sorted(
+                merged.items(), key=lambda x: tuple(map(str, x[0]))):
+            res.append({
+                'op': op,
+                'type': mtype,
+                'mversion': mversion,
+                'count': latency.count,
+                'bytes': size.total,
+                'latency_ns': latency.snapshot(),
+                'size': size.snapshot(),
+                })
+        return res
+
+    def histograms(self, op, mtype, mversion):
+        """\
+        :returns: The ``(latency, size)`` histograms of a key or None.
+        """
+        res = None
+        for (kop, kmtype, kmversion), hists in list(self._stats.items()):
+            if (kop, kmtype) == (op, mtype) and str(kmversion) == str(mversion):
+                if res is None:
+                    res = (_copy(hists[0]), _copy(hists[1]))
+                else:
+                    res[0].merge(hists[0])
+                    res[1].merge(hists[1])
+        return res
+
+    def reset(self):
+        """\
+        Discard all recorded metrics.
+        """
+        with self._lock:
+            self._stats = {}
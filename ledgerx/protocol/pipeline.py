@@ -0,0 +1,366 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.pipeline
+:synopsis: Parse messages in parallel processes, in order per key.
+:author: Amr Ali <amr@ledgerx.com>
+
+A :class:`ShardedParser` hands each frame to one of ``shards`` worker
+processes chosen by hashing a key peeked from the frame without parsing it,
+the market participant ID by default. A shard parses its frames in the order
+they were submitted, so the messages of a key are parsed, handled and
+delivered in order, while different keys proceed in parallel:
+
+>>> pipeline = ShardedParser(JsonParser, shards=4, handler=on_message)
+>>> for frame in feed:
+...     pipeline.submit(frame)
+...     for result in pipeline.results():
+...         pass
+>>> pipeline.close()
+
+``handler`` runs in the worker, next to the parser. Whatever it returns,
+unless None, is pickled back to the submitting process; returning the
+messages themselves costs about as much to unpickle as parsing did, so do
+the work in the worker and return little.
+
+Every shard holds at most ``max_pending`` frames that it has not finished;
+:meth:`ShardedParser.submit` waits for room in the shard of a frame. A hot
+key therefore shows up as one shard with a high ``pending`` count; see
+:meth:`ShardedParser.snapshot` for the load and skew of the shards.
+"""
+
+import os
+import re
+import zlib
+import pickle
+import shutil
+import tempfile
+import multiprocessing
+
+from collections import deque
+
+import zmq
+
+from ledgerx.protocol import sockets
+from ledgerx.protocol.detail import msgpack
+from ledgerx.protocol.messages import _logger
+from ledgerx.protocol.system import monotonic
+
+# The frame that stops a shard
+_STOP = b''
+
+# How often to check that the workers are alive while waiting on them
+_LIVENESS_IVL = 0.1
+
+def json_field(field):
+    """\
+    Make a key function that peeks at a top level field of JSON frames.
+
+    :param field: The field name.
+    :returns: A function of a frame returning the serialized value of the
+        field, or None if it is missing.
+    """
+    pattern = re.compile(rb'"' + re.escape(field.encode('utf8')) +
+            rb'"\s*:\s*("(?:[^"\\]|\\.)*"|[^,}\s]+)')
+    def key(frame):
+        # Nested messages are escaped strings, so only top level fields match
+        match = pattern.search(frame)
+        return None if match is None else match.group(1)
+    return key
+
+def msgpack_field(field):
+    """\
+    Make a key function that peeks at a top level field of msgpack frames.
+
+    :param field: The field name.
+    :returns: A function of a frame returning the value of the field,
+        or None if it is missing or the frame is not a msgpack map.
+    """
+    name = field.encode('utf8')
+    def key(frame):
+        unpacker = msgpack.Unpacker()
+        unpacker.feed(frame)
+        try:
+            for _ in range(unpacker.read_map_header()):
+                # Keys are bytes or str depending on the msgpack version
+                k = unpacker.unpack()
+                if k == name or k == field:
+                    return unpacker.unpack()
+                unpacker.skip()
+        except Exception: # Truncated or not a map; the parser will say so
+            pass
+        return None
+    return key
+
+def field_key(parser, field='mpid'):
+    """\
+    Make a key function for the frames of a parser.
+
+    :param parser: A :class:`BaseMessageParser` class of JSON or msgpack
+        messages.
+    :param field: The field name.
+    """
+    if parser.ParentMessage.Serializer is msgpack:
+        return msgpack_field(field)
+    return json_field(field)
+
+def shard_of(key, shards):
+    """\
+    :returns: The shard of a key peeked from a frame; the same in every
+        process, unlike :func:`hash`.
+    """
+    if key is None:
+        return 0
+    if not isinstance(key, (bytes, bytearray, memoryview)):
+        key = str(key).encode('utf8')
+    return zlib.crc32(key) % shards
+
+def _work(parser, handler, endpoint, results, shard, batch):
+    ctx = zmq.Context()
+    pull = sockets.pull_socket(ctx, rtimeo=-1, recv_hwm=0)
+    pull.connect(endpoint)
+    push = sockets.push_socket(ctx, linger=-1, send_hwm=0)
+    push.connect(results)
+    parse = parser.parse
+    running = True
+    try:
+        while running:
+            frames = [pull.recv(copy=False)]
+            while len(frames) < batch:
+                try:
+                    frames.append(pull.recv(zmq.NOBLOCK, copy=False))
+                except zmq.Again:
+                    break
+            t0 = monotonic()
+            count = errors = 0
+            res = []
+            for frame in frames:
+                data = frame.buffer
+                if len(data) == 0:
+                    running = False
+                    break
+                count += 1
+                try:
+                    msg = parse(data)
+                    if handler is not None:
+                        msg = handler(msg)
+                except Exception:
+                    errors += 1
+                    _logger().exception("shard %d failed to process a frame",
+                            shard)
+                    continue
+                if msg is not None:
+                    res.append(msg)
+            push.send(pickle.dumps((shard, count, errors,
+                int((monotonic() - t0) * 1e9), res), pickle.HIGHEST_PROTOCOL))
+    finally:
+        pull.close(0)
+        push.close()
+        ctx.term()
+
+class ShardedParser(object):
+    """\
+    Parse frames in worker processes, sharded by key.
+    """
+
+    def __init__(self, parser, shards=None, key='mpid', handler=None,
+            max_pending=1000, batch=64):
+        """\
+        :param parser: A :class:`BaseMessageParser` class.
+        :param shards: The number of worker processes (default: one per
+            CPU).
+        :param key: A field name (see :func:`field_key`) or a function of a
+            frame returning its key; frames of a key are processed in order.
+        :param handler: A function of a parsed message called in the worker;
+            it returns the result to deliver, if any (default: the message).
+        :param max_pending: The most frames a shard holds unfinished.
+        :param batch: The most frames a worker processes between reports.
+        """
+        if shards is None:
+            shards = os.cpu_count() or 1
+        self.parser = parser
+        self.shards = shards
+        self.key = field_key(parser, key) if isinstance(key, str) else key
+        self.max_pending = max_pending
+        self.stats = [{'submitted': 0, 'bytes': 0, 'completed': 0,
+            'errors': 0, 'busy_ns': 0, 'waited': 0} for _ in range(shards)]
+        self._results = deque()
+        self._dir = tempfile.mkdtemp()
+        endpoint = 'ipc://' + os.path.join(self._dir, '{0}')
+        # Start the workers before creating a context in this process, as
+        # 0MQ contexts do not survive a fork
+        self._procs = []
+        for shard in range(shards):
+            proc = multiprocessing.Process(target=_work, args=(parser,
+                handler, endpoint.format(shard), endpoint.format('results'),
+                shard, batch), daemon=True)
+            proc.start()
+            self._procs.append(proc)
+        self._ctx = zmq.Context()
+        # Flow is controlled by counting pending frames, not by the HWMs
+        self._pull = sockets.pull_socket(self._ctx, rtimeo=-1, recv_hwm=0)
+        self._pull.bind(endpoint.format('results'))
+        self._push = []
+        for shard in range(shards):
+            push = sockets.push_socket(self._ctx, send_hwm=0)
+            push.bind(endpoint.format(shard))
+            self._push.append(push)
+
+    def pending(self, shard):
+        """\
+        :returns: The number of frames submitted to ``shard`` and not yet
+            processed.
+        """
+        stats = self.stats[shard]
+        return stats['submitted'] - stats['completed']
+
+    def submit(self, frame, timeout=None):
+        """\
+        Queue a frame for parsing.
+
+        :param frame: A serialized message.
+        :param timeout: How long to wait for room in its shard in seconds
+            (default: forever).
+        :returns: The shard of the frame.
+        :raises zmq.Again: If the shard had no room within ``timeout``.
+        :raises RuntimeError: If a worker exited while waiting.
+        """
+        if not len(frame):
+            raise ValueError("cannot submit an empty frame")
+        shard = shard_of(self.key(frame), self.shards)
+        stats = self.stats[shard]
+        if stats['submitted'] - stats['completed'] >= self.max_pending:
+            stats['waited'] += 1
+            deadline = None if timeout is None else monotonic() + timeout
+            while stats['submitted'] - stats['completed'] >= self.max_pending:
+                wait = None if deadline is None else deadline - monotonic()
+                if not self._collect(wait):
+                    raise zmq.Again()
+        self._push[shard].send(frame, copy=False)
+        stats['submitted'] += 1
+        stats['bytes'] += len(frame)
+        return shard
+
+    def _collect(self, timeout=0):
+        """\
+        Take in the reports of the workers.
+
+        :param timeout: How long to wait for the first one in seconds (None:
+            forever).
+        :returns: True if a report arrived.
+        :raises RuntimeError: If a worker exited while waiting.
+        """
+        pull = self._pull
+        if timeout is None or timeout > 0:
+            deadline = None if timeout is None else monotonic() + timeout
+            # Poll in slices, as a dead worker never reports
+            while True:
+                wait = _LIVENESS_IVL if deadline is None else \
+                        max(0, min(_LIVENESS_IVL, deadline - monotonic()))
+                if pull.poll(wait * 1000):
+                    break
+                self._check()
+                if deadline is not None and monotonic() >= deadline:
+                    return False
+        res = False
+        while True:
+            try:
+                report = pull.recv(zmq.NOBLOCK)
+            except zmq.Again:
+                return res
+            shard, count, errors, busy, results = pickle.loads(report)
+            stats = self.stats[shard]
+            stats['completed'] += count
+            stats['errors'] += errors
+            stats['busy_ns'] += busy
+            self._results.extend(results)
+            res = True
+
+    def _check(self):
+        """\
+        :raises RuntimeError: If a worker has exited; the frames pending in
+            its shard are lost.
+        """
+        for shard, proc in enumerate(self._procs):
+            if proc.exitcode is not None:
+                raise RuntimeError("shard {0} worker exited with code {1} "
+                        "and {2} frames pending".format(shard, proc.exitcode,
+                        self.pending(shard)))
+
+    def results(self, timeout=0):
+        """\
+        Take the results delivered so far. The results of each key are in
+        submission order.
+
+        :param timeout: How long to wait for a result if there is none, in
+            seconds (None: forever).
+        :returns: A list of results.
+        :raises RuntimeError: If a worker exited while waiting.
+        """
+        self._collect(0)
+        if not self._results and timeout != 0:
+            deadline = None if timeout is None else monotonic() + timeout
+            while not self._results:
+                wait = None if deadline is None else deadline - monotonic()
+                if (wait is not None and wait <= 0) or not self._collect(wait):
+                    break
+        res = list(self._results)
+        self._results.clear()
+        return res
+
+    def join(self, timeout=None):
+        """\
+        Wait until every submitted frame is processed.
+
+        :param timeout: How long to wait in seconds (default: forever).
+        :returns: True if nothing is pending.
+        :raises RuntimeError: If a worker exited while waiting.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        while any(self.pending(shard) for shard in range(self.shards)):
+            wait = None if deadline is None else deadline - monotonic()
+            if (wait is not None and wait <= 0) or not self._collect(wait):
+                return False
+        return True
+
+    def snapshot(self):
+        """\
+        Get the load of the shards.
+
+        :returns: A dictionary of ``shards``, a list of every shard's
+            counters and ``pending`` frames, and ``skew``, the ratio of the
+            most frames submitted to a shard to the mean (1.0 is an even
+            spread; ``shards`` means a single shard got everything).
+        """
+        self._collect(0)
+        res = [dict(stats, pending=self.pending(shard))
+                for shard, stats in enumerate(self.stats)]
+        total = sum(s['submitted'] for s in res)
+        skew = max(s['submitted'] for s in res) * self.shards / total \
+                if total else 1.0
+        return {'shards': res, 'skew': skew}
+
+    def close(self, timeout=None):
+        """\
+        Stop the workers once they have processed what was submitted.
+
+        :param timeout: How long to wait for them in seconds (default:
+            forever); those still running afterwards are terminated.
+        """
+        for push, proc in zip(self._push, self._procs):
+            # Sending to a dead worker would block forever
+            if proc.exitcode is None:
+                push.send(_STOP)
+        deadline = None if timeout is None else monotonic() + timeout
+        for proc in self._procs:
+            proc.join(None if deadline is None else
+                    max(0, deadline - monotonic()))
+            if proc.is_alive():
+                proc.terminate()
+        self._collect(0)
+        for push in self._push:
+            push.close(0)
+        self._pull.close(0)
+        self._ctx.term()
+        shutil.rmtree(self._dir, ignore_errors=True)
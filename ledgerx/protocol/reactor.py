@@ -0,0 +1,296 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.reactor
+:synopsis: A poller-driven event loop dispatching messages by class.
+:author: Amr Ali <amr@ledgerx.com>
+
+A :class:`Reactor` polls any number of sockets. Each ready socket is
+drained of up to ``budget`` messages per iteration, so a busy socket cannot
+starve the others. Messages are parsed with the socket's parser (batches
+and :class:`~ledgerx.protocol.sockets.message.MessageSocket` headers are
+understood, as are passthrough messages on the sockets added with
+``passthrough=True``) and passed to the handler registered for the nearest
+class in the message's MRO:
+
+>>> reactor = Reactor()
+>>> reactor.add_socket(router, JsonParser)
+>>> @reactor.handler(BaseMessageStatus)
+... def on_status(sock, routing, msg):
+...     pass
+>>> reactor.call_every(1.0, publish_stats)
+>>> reactor.run()
+
+Pass a :class:`~ledgerx.protocol.dedup.Deduplicator` as ``dedup`` to drop
+messages whose ID was seen before they reach a handler. The status replies
+to frames that failed to parse are never dropped, nor do they count as
+seen, so a corrected retry with the same ID gets through.
+
+Loop lag is the delay between when a timer was due and when it ran; it
+grows with slow handlers. It is recorded along with the time spent in each
+handler class, see :meth:`Reactor.snapshot`.
+"""
+
+import heapq
+import itertools
+
+from time import monotonic
+
+import zmq
+
+from ledgerx.protocol.messages import BaseMessageParser, _logger
+from ledgerx.protocol.metrics import Histogram
+from ledgerx.protocol.sockets.batch import unpack_batch
+from ledgerx.protocol.sockets.message import take_passthrough, unpack_header
+
+class Timer(object):
+    """\
+    A scheduled callback; see :meth:`Reactor.call_later`.
+    """
+    __slots__ = ('when', 'interval', 'callback', 'args', 'cancelled')
+
+    def __init__(self, when, interval, callback, args):
+        self.when = when
+        self.interval = interval
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """\
+        Prevent the callback from running (again).
+        """
+        self.cancelled = True
+
+class Reactor(object):
+    """\
+    A single threaded multi-socket event loop.
+    """
+
+    def __init__(self, budget=64, precision=5, dedup=None):
+        """\
+        :param budget: The maximum number of messages taken from a socket
+            per iteration.
+        :param precision: The precision of the lag and handler histograms.
+        :param dedup: A :class:`~ledgerx.protocol.dedup.Deduplicator` to
+            drop duplicate messages with (default: none).
+        """
+        self.budget = budget
+        self.precision = precision
+        self.dedup = dedup
+        self.stats = {'iterations': 0, 'messages': 0, 'unhandled': 0,
+                'duplicates': 0, 'errors': 0, 'timers': 0}
+        self.lag = Histogram(precision)
+        self._poller = zmq.Poller()
+        self._sockets = {}
+        self._handlers = {}
+        self._resolved = {}
+        self._durations = {}
+        self._timers = []
+        self._seq = itertools.count()
+        self._running = False
+
+    def add_socket(self, sock, parser, passthrough=False):
+        """\
+        Dispatch the messages received on ``sock``.
+
+        :param sock: A 0MQ socket, e.g., from the socket factories.
+        :param parser: A :class:`BaseMessageParser` class.
+        :param passthrough: Take the messages of passthrough peers; all
+            peers must be in this process.
+        """
+        self._sockets[sock] = (parser, passthrough)
+        self._poller.register(sock, zmq.POLLIN)
+
+    def remove_socket(self, sock):
+        """\
+        Stop dispatching the messages of ``sock``.
+        """
+        del self._sockets[sock]
+        self._poller.unregister(sock)
+
+    def add_handler(self, mclass, func):
+        """\
+        Register the handler of a message class and its subclasses.
+
+        :param mclass: A message class; ``object`` catches all messages.
+        :param func: A callable of ``(sock, routing, msg)``, where ``routing``
+            is the list of routing frames (e.g., the peer identity on a
+            ROUTER socket).
+        """
+        self._handlers[mclass] = func
+        self._resolved.clear()
+
+    def handler(self, mclass):
+        """\
+        A decorator form of :meth:`add_handler`.
+        """
+        def register(func):
+            self.add_handler(mclass, func)
+            return func
+        return register
+
+    def _resolve(self, klass):
+        try:
+            return self._resolved[klass]
+        except KeyError:
+            pass
+        res = None
+        for base in klass.__mro__:
+            if base in self._handlers:
+                res = (base, self._handlers[base])
+                break
+        self._resolved[klass] = res
+        return res
+
+    def call_later(self, delay, callback, *args):
+        """\
+        Run ``callback(*args)`` in ``delay`` seconds.
+
+        :returns: A :class:`Timer`.
+        """
+        return self._schedule(Timer(monotonic() + delay, None, callback, args))
+
+    def call_every(self, interval, callback, *args):
+        """\
+        Run ``callback(*args)`` every ``interval`` seconds.
+
+        :returns: A :class:`Timer`.
+        """
+        return self._schedule(Timer(monotonic() + interval, interval,
+            callback, args))
+
+    def _schedule(self, timer):
+        heapq.heappush(self._timers, (timer.when, next(self._seq), timer))
+        return timer
+
+    def _run_timers(self):
+        timers = self._timers
+        now = monotonic()
+        while timers and timers[0][0] <= now:
+            when, _, timer = heapq.heappop(timers)
+            if timer.cancelled:
+                continue
+            self.lag.record(int((now - when) * 1e9))
+            self.stats['timers'] += 1
+            self._call(timer.callback, *timer.args)
+            if timer.interval is not None and not timer.cancelled:
+                # Skip the missed runs of a timer delayed by more than an
+                # interval rather than running it back to back
+                timer.when = max(when + timer.interval, now)
+                self._schedule(timer)
+            now = monotonic()
+
+    def _timeout(self):
+        timers = self._timers
+        while timers and timers[0][2].cancelled:
+            heapq.heappop(timers)
+        if not timers:
+            return None
+        return max(0, (timers[0][0] - monotonic()) * 1000)
+
+    def _call(self, func, *args):
+        try:
+            func(*args)
+        except Exception:
+            self.stats['errors'] += 1
+            _logger().exception("reactor callback %r failed", func)
+
+    def _drain(self, sock, parser, passthrough):
+        for _ in range(self.budget):
+            try:
+                frames = sock.recv_multipart(zmq.NOBLOCK)
+            except zmq.Again:
+                return
+            try:
+                routing = frames[:-1]
+                if routing and unpack_header(routing[-1]) is not None:
+                    routing = routing[:-1]
+                msg = take_passthrough(frames[-1]) if passthrough else None
+                bodies = () if msg is not None else unpack_batch(frames[-1])
+            except ValueError as e:
+                # A truncated batch or a stale passthrough handle; any peer
+                # can send one, so it must not stop the loop
+                self.stats['errors'] += 1
+                _logger().warning("reactor dropped a malformed frame: %s", e)
+                continue
+            if msg is not None:
+                self.dispatch(sock, routing, msg)
+                continue
+            for body in bodies:
+                self.dispatch(sock, routing, parser.parse(body))
+
+    def dispatch(self, sock, routing, msg):
+        """\
+        Pass a message to its handler, unless it is a duplicate.
+        """
+        self.stats['messages'] += 1
+        if self.dedup is not None and BaseMessageParser.failure(msg) is None \
+                and self.dedup.check(msg):
+            self.stats['duplicates'] += 1
+            return
+        resolved = self._resolve(type(msg))
+        if resolved is None:
+            self.stats['unhandled'] += 1
+            return
+        mclass, func = resolved
+        t0 = monotonic()
+        self._call(func, sock, routing, msg)
+        hist = self._durations.get(mclass)
+        if hist is None:
+            hist = self._durations[mclass] = Histogram(self.precision)
+        hist.record(int((monotonic() - t0) * 1e9))
+
+    def run_once(self, timeout=None):
+        """\
+        Run a single iteration: wait for sockets or the next timer, then
+        drain ready sockets and run due timers.
+
+        :param timeout: The maximum time to wait in seconds (default: until
+            the next timer, or forever if there is none).
+        """
+        wait = self._timeout()
+        if timeout is not None:
+            wait = timeout * 1000 if wait is None else min(wait, timeout * 1000)
+        sockets = self._sockets
+        for sock, _ in self._poller.poll(wait):
+            self._drain(sock, *sockets[sock])
+        self._run_timers()
+        self.stats['iterations'] += 1
+
+    def run(self):
+        """\
+        Run until :meth:`stop` is called.
+        """
+        self._running = True
+        while self._running:
+            self.run_once()
+
+    def stop(self):
+        """\
+        Make :meth:`run` return after the current iteration. When called
+        from another thread, this takes effect once the reactor wakes up;
+        a :meth:`call_every` timer bounds how long that takes.
+        """
+        self._running = False
+
+    def snapshot(self, reset=False):
+        """\
+        Get the reactor metrics.
+
+        :param reset: Start over after taking the snapshot.
+        :returns: A dictionary of the counters in ``stats``, the loop
+            ``lag_ns`` and the ``handlers_ns`` durations by message class
+            name; the last two are :meth:`Histogram.snapshot` summaries.
+        """
+        res = dict(self.stats)
+        res['lag_ns'] = self.lag.snapshot()
+        res['handlers_ns'] = {mclass.__name__: hist.snapshot()
+                for mclass, hist in self._durations.items()}
+        if reset:
+            self.lag.reset()
+            self._durations = {}
+            for k in self.stats:
+                self.stats[k] = 0
+        return res
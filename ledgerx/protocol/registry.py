@@ -0,0 +1,212 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.registry
+:synopsis: Per protocol family registries of integer message type IDs.
+:author: Amr Ali <amr@ledgerx.com>
+
+Every ``(version, type)`` pair recorded through
+:func:`ledgerx.protocol.messages.record_message_type` is given a small
+integer ID which indexes a dense table of message classes. IDs are handed
+out in registration order unless the message class declares a ``TypeID``
+attribute or the table was pinned beforehand with :meth:`TypeRegistry.load`,
+which is how a persisted table is kept stable across processes.
+
+A protocol family, the version modules of a package, has a registry of its
+own (see :func:`family_registry`), so two families may both define, e.g., a
+``status`` type of version ``1.0.0``. A message class may name another
+registry in its ``Registry`` attribute; see :func:`registry_of`.
+
+The classes of a module for which :meth:`TypeRegistry.reserve` was called
+get their IDs from a block of the table set aside for the module, so they
+get the same IDs whether the module is imported first or last; see
+:func:`ledgerx.protocol.utils.lazy_import_versions`.
+"""
+
+import threading
+
+class TypeRegistry(object):
+    """\
+    A dense ``type ID -> message class`` dispatch table.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = {}      # {(version, type): tid}
+        self._classes = {}  # {klass: tid}
+        self._keys = []     # [(version, type)] indexed by tid
+        self._table = []    # [klass] indexed by tid
+        self._blocks = {}   # {module name: (first tid, end tid)}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        """\
+        Iterate over ``(tid, version, type, klass)`` entries in ID order.
+        """
+        for tid, key in enumerate(list(self._keys)):
+            if key is not None:
+                yield (tid, key[0], key[1], self._table[tid])
+
+    def register(self, klass, version=None):
+        """\
+        Assign an ID to ``klass`` or return the one it already has.
+
+        :param klass: A message class with a ``Type`` attribute.
+        :param version: The message version (default: ``klass.Version``).
+        :returns: The integer type ID.
+        :raises ValueError: If another class is registered under the same
+            ``(version, type)`` pair.
+        """
+        if version is None:
+            version = getattr(klass, 'Version', None)
+        key = (str(version) if version is not None else None, klass.Type)
+        wanted = getattr(klass, 'TypeID', None)
+
+        with self._lock:
+            tid = self._ids.get(key)
+            if wanted is not None:
+                if tid is not None and tid != wanted:
+                    raise ValueError(
+                            "type ID mismatch for {0!r}: {1} != {2}".format(
+                                key, wanted, tid))
+                tid = wanted
+            if tid is None:
+                tid = self._next(getattr(klass, '__module__', None))
+            elif tid < len(self._table) and \
+                    self._table[tid] not in (None, klass):
+                raise ValueError("{0!r} is already registered by {1!r}".format(
+                    key, self._table[tid]))
+            self._reserve(key, tid)
+            self._table[tid] = klass
+            self._classes[klass] = tid
+        return tid
+
+    def reserve(self, module, size=256):
+        """\
+        Set aside a block of IDs for the message classes of a module that is
+        not imported yet; does nothing if the module already has one.
+
+        :param module: The full name of the module.
+        :param size: The most message types the module may define.
+        :returns: The first ID of the block.
+        """
+        with self._lock:
+            block = self._blocks.get(module)
+            if block is None:
+                first = len(self._keys)
+                self._grow(first + size)
+                block = self._blocks[module] = (first, first + size)
+            return block[0]
+
+    def _next(self, module):
+        block = self._blocks.get(module)
+        if block is None:
+            return len(self._keys)
+        tid, end = block
+        while tid < end and self._keys[tid] is not None:
+            tid += 1
+        if tid == end:
+            raise ValueError("no type IDs left in the block of {0}".format(
+                module))
+        return tid
+
+    def load(self, entries):
+        """\
+        Pin type IDs from a previously exported table.
+
+        :param entries: An iterable of ``(tid, version, type)`` entries, as
+            returned by :meth:`export`.
+        """
+        with self._lock:
+            for tid, version, mtype in entries:
+                self._reserve((version, mtype), int(tid))
+
+    def export(self):
+        """\
+        Export the table in a form suitable for persistence (e.g., JSON).
+
+        :returns: A list of ``[tid, version, type]`` entries.
+        """
+        return [[tid, version, mtype] for tid, version, mtype, _ in self]
+
+    def lookup(self, tid):
+        """\
+        Get the message class registered under ``tid``.
+
+        :returns: The message class or None.
+        """
+        try:
+            return self._table[tid] if tid >= 0 else None
+        except (IndexError, TypeError):
+            return None
+
+    def type_id(self, klass_or_key):
+        """\
+        Get the ID of a message class or a ``(version, type)`` pair.
+
+        :returns: The integer type ID or None.
+        """
+        if isinstance(klass_or_key, tuple):
+            return self._ids.get(klass_or_key)
+        return self._classes.get(klass_or_key)
+
+    def key(self, tid):
+        """\
+        Get the ``(version, type)`` pair of ``tid``.
+
+        :returns: A ``(version, type)`` tuple or None.
+        """
+        try:
+            return self._keys[tid] if tid >= 0 else None
+        except (IndexError, TypeError):
+            return None
+
+    def _reserve(self, key, tid):
+        if tid < 0:
+            raise ValueError("type ID must not be negative")
+        if tid < len(self._keys) and self._keys[tid] not in (None, key):
+            raise ValueError("type ID {0} is already taken by {1!r}".format(
+                tid, self._keys[tid]))
+        if self._ids.get(key, tid) != tid:
+            raise ValueError("{0!r} is already pinned to type ID {1}".format(
+                key, self._ids[key]))
+        self._grow(tid + 1)
+        self._keys[tid] = key
+        self._ids[key] = tid
+
+    def _grow(self, size):
+        if size > len(self._keys):
+            grow = size - len(self._keys)
+            self._keys.extend([None] * grow)
+            self._table.extend([None] * grow)
+
+_families = {}
+_families_lock = threading.Lock()
+
+def family_registry(package):
+    """\
+    Get the registry of a protocol family, creating it on first use.
+
+    :param package: The name of the package of the family's version modules.
+    :returns: A :class:`TypeRegistry`.
+    """
+    registry = _families.get(package)
+    if registry is None:
+        with _families_lock:
+            registry = _families.setdefault(package, TypeRegistry())
+    return registry
+
+def registry_of(klass):
+    """\
+    Get the registry a message class is registered in: its ``Registry``
+    attribute if set, otherwise the registry of the package of its module.
+
+    :returns: A :class:`TypeRegistry`.
+    """
+    registry = getattr(klass, 'Registry', None)
+    if registry is None:
+        registry = family_registry(klass.__module__.rpartition('.')[0])
+    return registry
@@ -0,0 +1,307 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.shm
+:synopsis: A shared memory ring buffer for processes on the same host.
+:author: Amr Ali <amr@ledgerx.com>
+
+A single :class:`RingProducer` writes serialized messages into a ring of
+fixed-size slots in a memory-mapped file (under ``/dev/shm`` by default) and
+any number of :class:`RingConsumer` processes read them, without a syscall
+or a copy through the kernel per message.
+
+Every message gets a sequence number. A slot holds the sequence number of
+its message, which the producer clears before writing the slot and sets
+after, so a consumer detects both a slot that is being rewritten under it
+and a producer that has lapped it (an overrun). Consumers never hold the
+producer back: a consumer that falls more than a ring behind skips to the
+oldest message still available and counts what it lost.
+
+Publication relies on stores becoming visible in program order, which holds
+on x86.
+
+A producer never truncates a ring that consumers may have mapped: it builds
+a new file and renames it over the old one, and numbers it with the next
+generation. Consumers notice the new file while waiting for messages, map
+it and start over from its first message; ``restarts`` counts how often.
+"""
+
+import os
+import mmap
+import time
+import struct
+
+import zmq
+
+from ledgerx.protocol.system import monotonic
+
+MAGIC = b'LXR1'
+DEFAULT_DIR = '/dev/shm'
+
+# magic, slot size, slot count, next sequence number, generation
+_header = struct.Struct('<4sIQQQ')
+_HEADER_SIZE = 64
+_SEQ_OFFSET = 16
+# How often a waiting consumer looks for a restarted producer, in seconds
+_RESTART_CHECK_IVL = 0.01
+# sequence number + 1 (0 while being written), length
+_slot = struct.Struct('<QI')
+_SLOT_HEADER_SIZE = 16
+_seq = struct.Struct('<Q')
+
+def ring_path(name, directory=DEFAULT_DIR):
+    """\
+    :returns: The path of the ring named ``name``.
+    """
+    return os.path.join(directory, 'ledgerx-ring-{0}'.format(name))
+
+class _Ring(object):
+
+    def _map(self, fd, size):
+        self._mmap = mmap.mmap(fd, size)
+        self._buf = memoryview(self._mmap)
+
+    @staticmethod
+    def _generation(path):
+        """\
+        :returns: The generation of the ring at ``path``, or 0 if there is
+            none.
+        """
+        try:
+            with open(path, 'rb') as fd:
+                magic, _, _, _, generation = _header.unpack(
+                        fd.read(_header.size))
+        except (OSError, struct.error):
+            return 0
+        return generation if magic == MAGIC else 0
+
+    def _stride(self):
+        return _SLOT_HEADER_SIZE + self.slot_size
+
+    def close(self):
+        """\
+        Unmap the ring.
+        """
+        self._buf.release()
+        self._mmap.close()
+
+class RingProducer(_Ring):
+    """\
+    The writing end of a ring; there must be only one per ring.
+    """
+
+    def __init__(self, path, slot_size=4096, slot_count=1024):
+        """\
+        :param path: The file backing the ring; see :func:`ring_path`. A
+            ring left there is replaced, not overwritten, so its consumers
+            move over to this one.
+        :param slot_size: The maximum message size in bytes.
+        :param slot_count: The number of messages the ring holds.
+        """
+        self.path = path
+        self.slot_size = slot_size
+        self.slot_count = slot_count
+        self.generation = self._generation(path) + 1
+        size = _HEADER_SIZE + slot_count * (_SLOT_HEADER_SIZE + slot_size)
+        tmp = '{0}.{1}.tmp'.format(path, os.getpid())
+        fd = os.open(tmp, os.O_CREAT | os.O_RDWR | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, size)
+            self._map(fd, size)
+            _header.pack_into(self._buf, 0, MAGIC, slot_size, slot_count, 0,
+                    self.generation)
+            os.rename(tmp, path)
+        except:
+            os.unlink(tmp)
+            raise
+        finally:
+            os.close(fd)
+        self._seq = 0
+
+    def send(self, data, flags=0):
+        """\
+        Write a serialized message. Never blocks.
+
+        :param data: A bytes-like object of at most ``slot_size`` bytes.
+        :param flags: Accepted for compatibility with socket ``send``.
+        :returns: The sequence number of the message.
+        """
+        length = len(data)
+        if length > self.slot_size:
+            raise ValueError("message of {0} bytes exceeds the slot size of "
+                    "{1}".format(length, self.slot_size))
+        buf = self._buf
+        seq = self._seq
+        off = _HEADER_SIZE + (seq % self.slot_count) * self._stride()
+        _slot.pack_into(buf, off, 0, length)
+        start = off + _SLOT_HEADER_SIZE
+        buf[start:start + length] = data
+        _seq.pack_into(buf, off, seq + 1)
+        self._seq = seq + 1
+        _seq.pack_into(buf, _SEQ_OFFSET, seq + 1)
+        return seq
+
+    def send_message(self, msg, flags=0):
+        """\
+        Serialize and write a message.
+
+        :returns: The sequence number of the message.
+        """
+        return self.send(msg.dumps(), flags)
+
+    def close(self, unlink=False):
+        """\
+        Unmap the ring.
+
+        :param unlink: Remove the backing file as well.
+        """
+        super().close()
+        if unlink:
+            os.unlink(self.path)
+
+class RingConsumer(_Ring):
+    """\
+    A reading end of a ring.
+    """
+
+    def __init__(self, path, parser=None, oldest=False, rtimeo=-1, spin=1000,
+            max_sleep=0.001):
+        """\
+        :param path: The file backing the ring, created by a producer.
+        :param parser: A :class:`BaseMessageParser` class for
+            :meth:`recv_message`.
+        :param oldest: Start from the oldest message in the ring instead of
+            the next one written.
+        :param rtimeo: The receive timeout in milliseconds (-1: forever), as
+            with :func:`ledgerx.protocol.sockets.create_socket`.
+        :param spin: How many times to poll before sleeping while waiting;
+            None busy-polls without ever sleeping.
+        :param max_sleep: The longest sleep between polls in seconds; sleeps
+            double from 1us up to it.
+        """
+        self.path = path
+        self.parser = parser
+        self.rtimeo = rtimeo
+        self.spin = spin
+        self.max_sleep = max_sleep
+        head = self._open()
+        self._seq = max(0, head - self.slot_count) if oldest else head
+        self.stats = {'received': 0, 'overruns': 0, 'lost': 0, 'restarts': 0}
+
+    def _open(self):
+        """\
+        Map the ring at ``path``.
+
+        :returns: The next sequence number of the ring.
+        """
+        fd = os.open(self.path, os.O_RDWR)
+        try:
+            st = os.fstat(fd)
+            self._map(fd, st.st_size)
+        finally:
+            os.close(fd)
+        magic, self.slot_size, self.slot_count, head, self.generation = \
+                _header.unpack_from(self._buf, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("{0} is not a ring buffer".format(self.path))
+        self._inode = (st.st_dev, st.st_ino)
+        self._next_check = monotonic() + _RESTART_CHECK_IVL
+        return head
+
+    def _restarted(self):
+        """\
+        Switch to the ring of a restarted producer, if there is one.
+
+        :returns: True if the consumer switched.
+        """
+        now = monotonic()
+        if now < self._next_check:
+            return False
+        self._next_check = now + _RESTART_CHECK_IVL
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False # Between producers
+        if (st.st_dev, st.st_ino) == self._inode:
+            return False
+        self.close()
+        self._open()
+        # Everything the new producer wrote is new to this consumer
+        self._seq = 0
+        self.stats['restarts'] += 1
+        return True
+
+    @property
+    def lag(self):
+        """\
+        The number of messages written but not yet received.
+        """
+        return _seq.unpack_from(self._buf, _SEQ_OFFSET)[0] - self._seq
+
+    def _poll(self):
+        """\
+        :returns: The next message as bytes, or None if it is not written yet.
+        """
+        while True:
+            buf = self._buf # Replaced by a restart
+            seq = self._seq
+            off = _HEADER_SIZE + (seq % self.slot_count) * self._stride()
+            # Read the head before the slot: a slot being written while the
+            # head is already past it is being written for a later lap
+            head = _seq.unpack_from(buf, _SEQ_OFFSET)[0]
+            stamp, length = _slot.unpack_from(buf, off)
+            if stamp == seq + 1:
+                start = off + _SLOT_HEADER_SIZE
+                data = bytes(buf[start:start + length])
+                if _seq.unpack_from(buf, off)[0] == stamp:
+                    self._seq = seq + 1
+                    self.stats['received'] += 1
+                    return data
+            elif stamp <= seq and stamp != 0 or stamp == 0 and head <= seq:
+                # Not written yet, or being written
+                if self._restarted():
+                    continue
+                return None
+            # Lapped by the producer: skip to the oldest message left
+            head = _seq.unpack_from(buf, _SEQ_OFFSET)[0]
+            oldest = max(seq + 1, head - self.slot_count + 1)
+            self.stats['overruns'] += 1
+            self.stats['lost'] += oldest - seq
+            self._seq = oldest
+
+    def recv(self, flags=0):
+        """\
+        Read the next serialized message.
+
+        :param flags: ``zmq.NOBLOCK`` to fail at once if there is none.
+        :returns: The message as bytes.
+        :raises zmq.Again: If no message arrived within ``rtimeo``.
+        """
+        data = self._poll()
+        if data is not None:
+            return data
+        if flags & zmq.NOBLOCK or self.rtimeo == 0:
+            raise zmq.Again()
+        deadline = None if self.rtimeo < 0 else monotonic() + self.rtimeo / 1000
+        polls = 0
+        sleep = 1e-6
+        while True:
+            data = self._poll()
+            if data is not None:
+                return data
+            if deadline is not None and monotonic() >= deadline:
+                raise zmq.Again()
+            polls += 1
+            if self.spin is not None and polls > self.spin:
+                time.sleep(sleep)
+                sleep = min(sleep * 2, self.max_sleep)
+
+    def recv_message(self, flags=0):
+        """\
+        Read and parse the next message.
+
+        :returns: The parsed message.
+        """
+        return self.parser.parse(self.recv(flags))
@@ -9,28 +9,64 @@
 
 import zmq
 
-def create_socket(ctx, stype, rtimeo=1000, reconn_ivl=1, reconn_ivl_max=1000,
-        linger=1000, send_hwm=0, recv_hwm=0):
+from ledgerx.protocol.sockets.profiles import get_profile
+
+# Queues are bounded so that a slow peer cannot make a process grow until it
+# runs out of memory; see :mod:`ledgerx.protocol.sockets.backpressure`
+DEFAULT_HWM = 10000
+
+_DEFAULT_OPTIONS = {
+        zmq.RCVTIMEO: 1000,
+        zmq.RECONNECT_IVL: 1,
+        zmq.RECONNECT_IVL_MAX: 1000,
+        zmq.LINGER: 1000,
+        zmq.SNDHWM: DEFAULT_HWM,
+        zmq.RCVHWM: DEFAULT_HWM,
+        }
+
+def create_socket(ctx, stype, rtimeo=None, reconn_ivl=None,
+        reconn_ivl_max=None, linger=None, send_hwm=None, recv_hwm=None,
+        monitor=None, profile=None):
     """\
-    Create a 0MQ socket.
+    Create a 0MQ socket. Options are taken from the arguments that are not
+    None, then from ``profile``, then from the defaults.
 
     :param ctx: The 0MQ context which this socket will belong to.
     :param stype: The 0MQ socket type.
-    :param rtimeo: the 0MQ socket receive timeout in milliseconds.
-    :param reconn_ivl: The 0MQ socket reconnection interval in milliseconds.
-    :param reconn_ivl_max: The max reconnection interval in milliseconds.
-    :param linger: The 0MQ socket linger period in milliseconds.
-    :param send_hwm: The 0MQ socket send queue HWM. (Number of messages)
-    :param recv_hwm: The 0MQ socket receive queue HWM. (Number of messages)
+    :param rtimeo: the 0MQ socket receive timeout in milliseconds
+        (default: 1000).
+    :param reconn_ivl: The 0MQ socket reconnection interval in milliseconds
+        (default: 1).
+    :param reconn_ivl_max: The max reconnection interval in milliseconds
+        (default: 1000).
+    :param linger: The 0MQ socket linger period in milliseconds
+        (default: 1000).
+    :param send_hwm: The 0MQ socket send queue HWM. (Number of messages;
+        0 means unlimited; default: :data:`DEFAULT_HWM`)
+    :param recv_hwm: The 0MQ socket receive queue HWM. (Number of messages;
+        0 means unlimited; default: :data:`DEFAULT_HWM`)
+    :param monitor: A :class:`ledgerx.protocol.sockets.monitor.SocketMonitor`
+        to count this socket's connection events with.
+    :param profile: The name of a tuning profile, or a
+        :class:`ledgerx.protocol.sockets.profiles.Profile`; its options take
+        precedence over the defaults of the arguments above, but not over
+        the arguments given.
     :returns: A 0MQ socket.
     """
+    options = dict(_DEFAULT_OPTIONS)
+    if profile is not None:
+        options.update(get_profile(profile).socket_options)
+    for option, value in ((zmq.RCVTIMEO, rtimeo),
+            (zmq.RECONNECT_IVL, reconn_ivl),
+            (zmq.RECONNECT_IVL_MAX, reconn_ivl_max), (zmq.LINGER, linger),
+            (zmq.SNDHWM, send_hwm), (zmq.RCVHWM, recv_hwm)):
+        if value is not None:
+            options[option] = value
     s = ctx.socket(stype)
-    s.rcvtimeo = rtimeo
-    s.reconnect_ivl = reconn_ivl
-    s.reconnect_ivl_max = reconn_ivl_max
-    s.linger = linger
-    s.sndhwm = send_hwm
-    s.rcvhwm = recv_hwm
+    for option, value in options.items():
+        s.setsockopt(option, value)
+    if monitor is not None:
+        monitor.watch(s)
     return s
 
 def dealer_socket(ctx, *args, **kwargs):
@@ -0,0 +1,223 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.sockets.aio
+:synopsis: asyncio socket patterns and message helpers.
+:author: Amr Ali <amr@ledgerx.com>
+
+The factories mirror :mod:`ledgerx.protocol.sockets` and apply the same
+options, but return :mod:`zmq.asyncio` sockets. A regular :class:`zmq.Context`
+may be passed; it is shadowed by an asyncio context sharing the same
+underlying 0MQ context so inproc endpoints keep working across both.
+"""
+
+import weakref
+import asyncio
+
+from collections import deque
+
+import zmq
+import zmq.asyncio
+
+from ledgerx.protocol import sockets
+from ledgerx.protocol.sockets.batch import parse_batch
+
+# The messages of a batch not returned by recv_message yet, by socket
+_pending = weakref.WeakKeyDictionary()
+
+def async_context(ctx):
+    """\
+    Get an asyncio 0MQ context for ``ctx``.
+
+    :param ctx: A :class:`zmq.Context` or :class:`zmq.asyncio.Context`.
+    :returns: A :class:`zmq.asyncio.Context` sharing ``ctx``'s 0MQ context.
+    """
+    if isinstance(ctx, zmq.asyncio.Context):
+        return ctx
+    return zmq.asyncio.Context.shadow(ctx.underlying)
+
+def create_socket(ctx, stype, *args, **kwargs):
+    """\
+    Create an asyncio 0MQ socket.
+    See :func:`ledgerx.protocol.sockets.create_socket` for details on args.
+
+    :param ctx: The 0MQ context which this socket will belong to.
+    :param stype: The 0MQ socket type.
+    :returns: A :class:`zmq.asyncio.Socket`.
+    """
+    return sockets.create_socket(async_context(ctx), stype, *args, **kwargs)
+
+def dealer_socket(ctx, *args, **kwargs):
+    """\
+    Create an asyncio 0MQ DEALER socket.
+
+    :param ctx: The 0MQ context which this socket will belong to.
+    :returns: A :class:`zmq.asyncio.Socket`.
+    """
+    return create_socket(ctx, zmq.DEALER, *args, **kwargs)
+
+def router_socket(ctx, *args, **kwargs):
+    """\
+    Create an asyncio 0MQ ROUTER socket.
+
+    :param ctx: The 0MQ context which this socket will belong to.
+    :returns: A :class:`zmq.asyncio.Socket`.
+    """
+    return create_socket(ctx, zmq.ROUTER, *args, **kwargs)
+
+def req_socket(ctx, *args, **kwargs):
+    """\
+    Create an asyncio 0MQ REQ socket.
+
+    :param ctx: The 0MQ context which this socket will belong to.
+    :returns: A :class:`zmq.asyncio.Socket`.
+    """
+    return create_socket(ctx, zmq.REQ, *args, **kwargs)
+
+def rep_socket(ctx, *args, **kwargs):
+    """\
+    Create an asyncio 0MQ REP socket.
+
+    :param ctx: The 0MQ context which this socket will belong to.
+    :returns: A :class:`zmq.asyncio.Socket`.
+    """
+    return create_socket(ctx, zmq.REP, *args, **kwargs)
+
+def sub_socket(ctx, *args, **kwargs):
+    """\
+    Create an asyncio 0MQ SUB socket.
+
+    :param ctx: The 0MQ context which this socket will belong to.
+    :returns: A :class:`zmq.asyncio.Socket`.
+    """
+    return create_socket(ctx, zmq.SUB, *args, **kwargs)
+
+def xsub_socket(ctx, *args, **kwargs):
+    """\
+    Create an asyncio 0MQ XSUB socket.
+
+    :param ctx: The 0MQ context which this socket will belong to.
+    :returns: A :class:`zmq.asyncio.Socket`.
+    """
+    return create_socket(ctx, zmq.XSUB, *args, **kwargs)
+
+def xpub_socket(ctx, *args, **kwargs):
+    """\
+    Create an asyncio 0MQ XPUB socket.
+
+    :param ctx: The 0MQ context which this socket will belong to.
+    :returns: A :class:`zmq.asyncio.Socket`.
+    """
+    return create_socket(ctx, zmq.XPUB, *args, **kwargs)
+
+def pub_socket(ctx, *args, **kwargs):
+    """\
+    Create an asyncio 0MQ PUB socket.
+
+    :param ctx: The 0MQ context which this socket will belong to.
+    :returns: A :class:`zmq.asyncio.Socket`.
+    """
+    return create_socket(ctx, zmq.PUB, *args, **kwargs)
+
+def push_socket(ctx, *args, **kwargs):
+    """\
+    Create an asyncio 0MQ PUSH socket.
+
+    :param ctx: The 0MQ context which this socket will belong to.
+    :returns: A :class:`zmq.asyncio.Socket`.
+    """
+    return create_socket(ctx, zmq.PUSH, *args, **kwargs)
+
+def pull_socket(ctx, *args, **kwargs):
+    """\
+    Create an asyncio 0MQ PULL socket.
+
+    :param ctx: The 0MQ context which this socket will belong to.
+    :returns: A :class:`zmq.asyncio.Socket`.
+    """
+    return create_socket(ctx, zmq.PULL, *args, **kwargs)
+
+def pair_socket(ctx, *args, **kwargs):
+    """\
+    Create an asyncio 0MQ PAIR socket.
+
+    :param ctx: The 0MQ context which this socket will belong to.
+    :returns: A :class:`zmq.asyncio.Socket`.
+    """
+    return create_socket(ctx, zmq.PAIR, *args, **kwargs)
+
+async def send_message(sock, msg, routing=()):
+    """\
+    Serialize and send a message.
+
+    :param sock: An asyncio 0MQ socket.
+    :param msg: The message to send.
+    :param routing: Frames to send before the message, e.g., the peer
+        identity on a ROUTER socket.
+    """
+    if routing:
+        await sock.send_multipart(list(routing) + [msg.dumps()])
+    else:
+        await sock.send(msg.dumps())
+
+async def recv_message(sock, parser, routed=False, executor=None,
+        offload_size=None):
+    """\
+    Receive and parse a single message. The other messages of a batch are
+    kept and returned by the next calls on the same socket; with batching
+    senders, :func:`recv_messages` is cheaper.
+
+    :param sock: An asyncio 0MQ socket.
+    :param parser: A :class:`BaseMessageParser` class.
+    :param routed: Return the routing frames along with the message.
+    :param executor: The executor to parse in (default: the loop's default).
+    :param offload_size: Parse messages of at least this many bytes in
+        ``executor`` instead of on the event loop (default: never).
+    :returns: The parsed message, or ``(routing, message)`` if ``routed``.
+    """
+    pending = _pending.get(sock)
+    if pending:
+        routing, msg = pending.popleft()
+    else:
+        res = await recv_messages(sock, parser, 1, True, executor,
+                offload_size)
+        routing, msg = res[0]
+        if len(res) > 1:
+            _pending[sock] = deque(res[1:])
+    return (routing, msg) if routed else msg
+
+async def recv_messages(sock, parser, max_batch=64, routed=False,
+        executor=None, offload_size=None):
+    """\
+    Wait for a message, then drain up to ``max_batch`` messages that are
+    already queued on the socket, so a burst costs a single wakeup. Batches
+    from :class:`ledgerx.protocol.sockets.batch.BatchSender` are unpacked.
+
+    :param max_batch: The maximum number of 0MQ messages to receive.
+    :returns: A list of parsed messages (or ``(routing, message)`` tuples
+        if ``routed``) in the order they were received.
+    See :func:`recv_message` for details on other args.
+    """
+    pending = _pending.pop(sock, None)
+    if pending:
+        # Left over from a batch received by recv_message
+        return list(pending) if routed else [msg for _, msg in pending]
+    batch = [await sock.recv_multipart()]
+    while len(batch) < max_batch and sock.getsockopt(zmq.EVENTS) & zmq.POLLIN:
+        batch.append(await sock.recv_multipart())
+
+    datas = [frames[-1] for frames in batch]
+    if offload_size is not None and sum(map(len, datas)) >= offload_size:
+        loop = asyncio.get_event_loop()
+        msgs = await loop.run_in_executor(executor, _parse_all, parser, datas)
+    else:
+        msgs = _parse_all(parser, datas)
+
+    if routed:
+        return [(frames[:-1], msg) for frames, parsed in zip(batch, msgs)
+                for msg in parsed]
+    return [msg for parsed in msgs for msg in parsed]
+
+def _parse_all(parser, datas):
+    return [parse_batch(parser, data) for data in datas]
@@ -0,0 +1,146 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.sockets.backpressure
+:synopsis: Send policies for when a peer cannot keep up.
+:author: Amr Ali <amr@ledgerx.com>
+
+A socket stops accepting messages once its send queue reaches its high
+water mark (see :data:`ledgerx.protocol.sockets.DEFAULT_HWM`).
+:class:`BoundedSender` decides what happens then:
+
+* :data:`BLOCK` waits up to ``timeout`` for room, then fails.
+* :data:`DROP_OLDEST` keeps up to ``max_pending`` messages aside and drops
+  the oldest one when that is full. With a ``conflate`` key function, a
+  pending message is replaced by a newer one of the same key, so a slow
+  consumer gets the latest value of every key rather than a stale backlog.
+* :data:`FAIL` fails at once.
+
+Failing raises :class:`zmq.Again`, the error 0MQ itself uses for a full
+queue. PUB and XPUB sockets never push back; they drop messages for slow
+subscribers at the high water mark, which no policy can observe.
+"""
+
+import itertools
+
+from collections import OrderedDict
+
+import zmq
+
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+FAIL = 'fail'
+
+POLICIES = (BLOCK, DROP_OLDEST, FAIL)
+
+class BoundedSender(object):
+    """\
+    Send messages on a socket according to a backpressure policy.
+    """
+
+    def __init__(self, sock, policy=BLOCK, timeout=None, max_pending=1000,
+            conflate=None):
+        """\
+        :param sock: A 0MQ socket with a bounded send HWM.
+        :param policy: One of :data:`POLICIES`.
+        :param timeout: How long :data:`BLOCK` waits for room in seconds
+            (default: forever).
+        :param max_pending: How many messages :data:`DROP_OLDEST` keeps aside.
+        :param conflate: A function of the frames returning the key under
+            which :data:`DROP_OLDEST` conflates pending messages, e.g.,
+            ``lambda frames: frames[0]`` for the topic of a published message.
+        """
+        if policy not in POLICIES:
+            raise ValueError("unknown backpressure policy {0!r}".format(policy))
+        self.socket = sock
+        self.policy = policy
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.conflate = conflate
+        self.stats = {'sent': 0, 'pressured': 0, 'blocked': 0, 'dropped': 0,
+                'conflated': 0, 'failed': 0}
+        self._pending = OrderedDict()
+        self._seq = itertools.count()
+
+    @property
+    def pending(self):
+        """\
+        The number of messages waiting for room in the socket's queue.
+        """
+        return len(self._pending)
+
+    def send(self, frames):
+        """\
+        Send a message.
+
+        :param frames: A frame or a list of frames.
+        :returns: True if the message was handed to 0MQ, False if it is
+            pending; i.e., False means the peer is not keeping up.
+        :raises zmq.Again: If the policy gives up on the message.
+        """
+        if not isinstance(frames, list):
+            frames = [frames]
+        # Pending messages go first to preserve ordering
+        if not self._pending or not self.flush():
+            try:
+                self.socket.send_multipart(frames, zmq.NOBLOCK)
+                self.stats['sent'] += 1
+                return True
+            except zmq.Again:
+                pass
+
+        self.stats['pressured'] += 1
+        if self.policy == DROP_OLDEST:
+            self._put(frames)
+            return False
+        if self.policy == BLOCK:
+            self.stats['blocked'] += 1
+            timeout = None if self.timeout is None else self.timeout * 1000
+            if self.socket.poll(timeout, zmq.POLLOUT):
+                self.socket.send_multipart(frames, zmq.NOBLOCK)
+                self.stats['sent'] += 1
+                return True
+        self.stats['failed'] += 1
+        raise zmq.Again()
+
+    def send_message(self, msg):
+        """\
+        Serialize and send a message. See :meth:`send`.
+        """
+        return self.send([msg.dumps()])
+
+    def _put(self, frames):
+        pending = self._pending
+        key = next(self._seq) if self.conflate is None else self.conflate(frames)
+        if key in pending:
+            pending[key] = frames
+            self.stats['conflated'] += 1
+            return
+        if len(pending) >= self.max_pending:
+            pending.popitem(last=False)
+            self.stats['dropped'] += 1
+        pending[key] = frames
+
+    def flush(self, timeout=0):
+        """\
+        Send as many pending messages as the socket accepts.
+
+        :param timeout: How long to wait for room in seconds; None waits
+            until every pending message is sent.
+        :returns: The number of messages still pending.
+        """
+        pending = self._pending
+        sock = self.socket
+        while pending:
+            key, frames = next(iter(pending.items()))
+            try:
+                sock.send_multipart(frames, zmq.NOBLOCK)
+            except zmq.Again:
+                if not sock.poll(None if timeout is None else timeout * 1000,
+                        zmq.POLLOUT):
+                    break
+                continue
+            del pending[key]
+            self.stats['sent'] += 1
+        return len(pending)
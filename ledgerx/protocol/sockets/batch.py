@@ -0,0 +1,189 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.sockets.batch
+:synopsis: Coalescing many small messages into a single 0MQ message.
+:author: Amr Ali <amr@ledgerx.com>
+
+A batch is a single frame made of :data:`BATCH_MAGIC` followed by the
+serialized messages, each prefixed with its length as a little-endian
+32-bit integer. Sending one frame instead of many saves a trip through
+pyzmq and libzmq per message, and the receiver is woken up once per batch.
+
+:func:`unpack_batch` passes frames that are not batches through unchanged,
+so receivers that unpack understand batching and non-batching senders
+alike. Those are :func:`parse_batch`, the asyncio receive functions of
+:mod:`ledgerx.protocol.sockets.aio` and
+:class:`ledgerx.protocol.reactor.Reactor`. ``BaseMessageParser.parse``,
+:class:`~ledgerx.protocol.sockets.message.MessageSocket` and
+:func:`ledgerx.protocol.sockets.pubsub.recv_message` do not: send batches
+only to receivers that unpack them.
+"""
+
+import struct
+
+from time import monotonic
+
+BATCH_MAGIC = b'LXB1'
+
+_length = struct.Struct('<I')
+
+def pack_batch(bodies):
+    """\
+    Build a batch frame.
+
+    :param bodies: Serialized messages.
+    :returns: The batch as bytes.
+    """
+    pack = _length.pack
+    parts = [BATCH_MAGIC]
+    for body in bodies:
+        parts.append(pack(len(body)))
+        parts.append(body)
+    return b''.join(parts)
+
+def unpack_batch(frame):
+    """\
+    Split a batch frame into serialized messages.
+
+    :param frame: A frame as received from a socket.
+    :returns: A list of bytes-like objects; ``[frame]`` if ``frame`` is not
+        a batch.
+    :raises ValueError: If the batch is truncated.
+    """
+    view = memoryview(frame)
+    if view[:len(BATCH_MAGIC)] != BATCH_MAGIC:
+        return [frame]
+    unpack_from = _length.unpack_from
+    size = _length.size
+    bodies = []
+    offset, end = len(BATCH_MAGIC), len(view)
+    while offset < end:
+        if offset + size > end:
+            raise ValueError("truncated batch")
+        length, = unpack_from(view, offset)
+        offset += size
+        if offset + length > end:
+            raise ValueError("truncated batch")
+        bodies.append(view[offset:offset + length])
+        offset += length
+    return bodies
+
+def parse_batch(parser, frame):
+    """\
+    Parse every message of a frame, batched or not.
+
+    :param parser: A :class:`BaseMessageParser` class.
+    :returns: A list of parsed messages.
+    """
+    return [parser.parse(body) for body in unpack_batch(frame)]
+
+class BatchSender(object):
+    """\
+    Queue outgoing messages and send them in batches.
+
+    A queue is flushed when it holds ``max_count`` messages or ``max_bytes``
+    bytes, or once its oldest message has waited ``max_delay`` seconds.
+    Nothing runs in the background: the owner of the socket calls
+    :meth:`flush_due` from its poll loop, using :meth:`timeout` as the poll
+    timeout.
+
+    Batching adapts to the load: a message sent after the sender has been
+    idle for ``max_delay`` goes out at once, so the delay only applies to
+    bursts, where it is amortized over the batch.
+    """
+
+    def __init__(self, sock, max_count=64, max_bytes=65536, max_delay=0.0005,
+            routing=()):
+        """\
+        :param sock: A 0MQ socket.
+        :param max_count: The maximum number of messages in a batch.
+        :param max_bytes: The batch size in bytes that triggers a flush.
+        :param max_delay: The maximum time a message is queued in seconds.
+        :param routing: Frames to send before every batch, e.g., the peer
+            identity on a ROUTER socket.
+        """
+        self.socket = sock
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.routing = list(routing)
+        self.stats = {'messages': 0, 'batches': 0, 'direct': 0}
+        self._queue = []
+        self._bytes = 0
+        self._deadline = None
+        self._last_send = 0.0
+
+    def __len__(self):
+        return len(self._queue)
+
+    def send(self, msg):
+        """\
+        Queue a message, sending the queue if a threshold is reached.
+
+        :param msg: A message, or an already serialized message.
+        """
+        body = msg if isinstance(msg, (bytes, bytearray, memoryview)) \
+                else msg.dumps()
+        self.stats['messages'] += 1
+        now = monotonic()
+        if not self._queue:
+            if now - self._last_send >= self.max_delay:
+                self.stats['direct'] += 1
+                self._send(body, now)
+                return
+            self._deadline = now + self.max_delay
+        self._queue.append(body)
+        self._bytes += len(body)
+        if len(self._queue) >= self.max_count or self._bytes >= self.max_bytes \
+                or now >= self._deadline:
+            self.flush()
+
+    def timeout(self):
+        """\
+        :returns: The number of seconds until the queue is due, or None if
+            it is empty.
+        """
+        if not self._queue:
+            return None
+        return max(0.0, self._deadline - monotonic())
+
+    def flush_due(self):
+        """\
+        Send the queue if its oldest message has waited ``max_delay``.
+
+        :returns: True if a batch was sent.
+        """
+        if self._queue and monotonic() >= self._deadline:
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        """\
+        Send the queued messages now.
+        """
+        queue = self._queue
+        if not queue:
+            return
+        self.stats['batches'] += 1
+        self._send(queue[0] if len(queue) == 1 else pack_batch(queue),
+                monotonic())
+        self._queue = []
+        self._bytes = 0
+        self._deadline = None
+
+    def _send(self, frame, now):
+        if self.routing:
+            self.socket.send_multipart(self.routing + [frame])
+        else:
+            self.socket.send(frame)
+        self._last_send = now
+
+    def close(self, linger=None):
+        """\
+        Send the queued messages and close the underlying socket.
+        """
+        self.flush()
+        self.socket.close(linger)
@@ -0,0 +1,282 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.sockets.broker
+:synopsis: A load-balancing request broker and its workers.
+:author: Amr Ali <amr@ledgerx.com>
+
+Clients talk to the broker's ROUTER front end exactly as they would talk to
+a single server (REQ, DEALER or :class:`RPCClient`). Requests are dispatched
+over a ROUTER back end to the least recently used idle worker; workers
+connect with a DEALER socket and announce themselves with :data:`READY`.
+
+Idle workers and the broker exchange :data:`HEARTBEAT` frames every
+``heartbeat_ivl`` seconds; a worker that has been silent for ``liveness``
+intervals is evicted, and an idle worker that has not heard from the broker
+for as long reconnects. Heartbeats do not change the order in which idle
+workers are used. A request dispatched to a worker that dies is lost, so
+clients should retry (see :class:`RPCClient`).
+"""
+
+import time
+import threading
+import multiprocessing
+
+from collections import OrderedDict
+
+import zmq
+
+from ledgerx.protocol import sockets
+from ledgerx.protocol.messages import _logger
+from ledgerx.protocol.sockets.message import pack_header, unpack_header
+
+READY = b'\x01'
+HEARTBEAT = b'\x02'
+DISCONNECT = b'\x03'
+
+class Broker(object):
+    """\
+    A ROUTER/ROUTER broker with least recently used dispatch.
+    """
+
+    def __init__(self, ctx, frontend, backend, heartbeat_ivl=1.0, liveness=3):
+        """\
+        :param ctx: The 0MQ context which the broker sockets will belong to.
+        :param frontend: The endpoint to bind for clients.
+        :param backend: The endpoint to bind for workers.
+        :param heartbeat_ivl: The heartbeat interval in seconds.
+        :param liveness: The number of missed heartbeats after which a worker
+            is evicted.
+        """
+        self.frontend = sockets.router_socket(ctx, rtimeo=-1)
+        self.frontend.bind(frontend)
+        self.backend = sockets.router_socket(ctx, rtimeo=-1)
+        self.backend.bind(backend)
+        self.heartbeat_ivl = heartbeat_ivl
+        self.liveness = liveness
+        self.stats = {'requests': 0, 'replies': 0, 'evicted': 0}
+        self._idle = OrderedDict() # Worker identity -> expiry, LRU first
+        self._busy = {}
+        self._done = threading.Event()
+
+    @property
+    def workers(self):
+        """\
+        The number of live workers, idle or busy.
+        """
+        return len(self._idle) + len(self._busy)
+
+    def run(self):
+        """\
+        Route requests and replies until :meth:`stop` is called.
+        """
+        backend_only = zmq.Poller()
+        backend_only.register(self.backend, zmq.POLLIN)
+        both = zmq.Poller()
+        both.register(self.backend, zmq.POLLIN)
+        both.register(self.frontend, zmq.POLLIN)
+        ivl = self.heartbeat_ivl
+        next_heartbeat = time.monotonic() + ivl
+
+        while not self._done.is_set():
+            # Requests are only taken off the front end when a worker can
+            # handle them; until then, 0MQ queues them
+            poller = both if self._idle else backend_only
+            timeout = max(0, next_heartbeat - time.monotonic())
+            events = dict(poller.poll(min(timeout, ivl) * 1000))
+
+            if self.backend in events:
+                while self.backend.getsockopt(zmq.EVENTS) & zmq.POLLIN:
+                    self._recv_backend()
+            if self.frontend in events:
+                while self._idle and \
+                        self.frontend.getsockopt(zmq.EVENTS) & zmq.POLLIN:
+                    self._recv_frontend()
+
+            now = time.monotonic()
+            if now >= next_heartbeat:
+                for identity in self._idle:
+                    self.backend.send_multipart([identity, HEARTBEAT])
+                self._evict(now)
+                next_heartbeat = now + ivl
+
+    def _recv_backend(self):
+        frames = self.backend.recv_multipart()
+        identity = frames[0]
+        expiry = time.monotonic() + self.heartbeat_ivl * self.liveness
+        if len(frames) == 2 and frames[1] == HEARTBEAT:
+            # Keep the worker where it is in the LRU order; a heartbeat from
+            # a busy one was sent before the request reached it
+            for workers in (self._busy, self._idle):
+                if identity in workers:
+                    workers[identity] = expiry
+                    return
+        self._busy.pop(identity, None)
+        self._idle.pop(identity, None)
+        if len(frames) == 2 and frames[1] == DISCONNECT:
+            return
+        self._idle[identity] = expiry
+        if len(frames) > 2:
+            self.stats['replies'] += 1
+            self.frontend.send_multipart(frames[1:])
+
+    def _recv_frontend(self):
+        frames = self.frontend.recv_multipart()
+        identity, expiry = self._idle.popitem(last=False)
+        self._busy[identity] = expiry
+        self.stats['requests'] += 1
+        self.backend.send_multipart([identity] + frames)
+
+    def _evict(self, now):
+        for workers in (self._idle, self._busy):
+            for identity in [i for i, exp in workers.items() if exp < now]:
+                del workers[identity]
+                self.stats['evicted'] += 1
+
+    def stop(self):
+        """\
+        Make :meth:`run` return.
+        """
+        self._done.set()
+
+    def close(self, linger=None):
+        """\
+        Tell workers to disconnect and close the broker sockets.
+        """
+        for identity in list(self._idle) + list(self._busy):
+            self.backend.send_multipart([identity, DISCONNECT])
+        self.frontend.close(linger)
+        self.backend.close(linger)
+
+class Worker(object):
+    """\
+    A broker worker. Subclasses implement :meth:`handle`.
+    """
+
+    def __init__(self, parser, heartbeat_ivl=1.0, liveness=3):
+        """\
+        :param parser: A :class:`BaseMessageParser` class for requests.
+        :param heartbeat_ivl: The heartbeat interval in seconds; must match
+            the broker's.
+        :param liveness: The number of missed heartbeats after which the
+            worker reconnects.
+        """
+        self.parser = parser
+        self.heartbeat_ivl = heartbeat_ivl
+        self.liveness = liveness
+        self._done = threading.Event()
+
+    def handle(self, msg):
+        """\
+        Handle a request. An exception is logged and answered with a server
+        error status; the worker keeps serving.
+
+        :param msg: The parsed request.
+        :returns: The reply message, or None to send no reply.
+        """
+        return msg.reply()
+
+    def _handle(self, msg):
+        try:
+            return self.handle(msg)
+        except Exception:
+            _logger().exception("worker failed to handle a message")
+        try:
+            status = msg.reply()
+        except Exception: # e.g., the status of a request that failed to parse
+            status = self.parser.MessageStatus()
+        return status.server_error("error occurred while handling message")
+
+    def run(self, ctx, endpoint):
+        """\
+        Serve requests from the broker at ``endpoint`` until :meth:`stop` is
+        called or the broker disconnects the worker.
+        """
+        while not self._done.is_set():
+            # Linger so that the last reply is not dropped on reconnecting
+            sock = sockets.dealer_socket(ctx, rtimeo=-1,
+                    linger=int(self.heartbeat_ivl * 1000))
+            sock.connect(endpoint)
+            try:
+                if not self._serve(sock):
+                    return
+            finally:
+                sock.close()
+
+    def _serve(self, sock):
+        """\
+        :returns: True to reconnect, False to stop.
+        """
+        poller = zmq.Poller()
+        poller.register(sock, zmq.POLLIN)
+        ivl = self.heartbeat_ivl
+        sock.send(READY)
+        expiry = time.monotonic() + ivl * self.liveness
+        next_heartbeat = time.monotonic() + ivl
+
+        while not self._done.is_set():
+            if poller.poll(ivl * 1000):
+                frames = sock.recv_multipart()
+                if len(frames) > 1:
+                    self._dispatch(sock, frames)
+                elif frames[0] == DISCONNECT:
+                    return False
+                # The broker is only expected to be heard from while idle,
+                # so the time spent handling does not count
+                expiry = time.monotonic() + ivl * self.liveness
+            now = time.monotonic()
+            if now >= expiry:
+                return True
+            if now >= next_heartbeat:
+                sock.send(HEARTBEAT)
+                next_heartbeat = now + ivl
+        sock.send(DISCONNECT)
+        return False
+
+    def _dispatch(self, sock, frames):
+        routing, body = frames[:-1], frames[-1]
+        try:
+            header = unpack_header(routing[-1]) if routing else None
+        except ValueError:
+            # Not a header after all; the reply is routed with the frame
+            header = None
+        if header is not None:
+            routing = routing[:-1]
+        reply = self._handle(self.parser.parse(body))
+        if reply is None:
+            sock.send(READY)
+        elif header is not None:
+            sock.send_multipart(routing + [pack_header(reply), reply.dumps()])
+        else:
+            sock.send_multipart(routing + [reply.dumps()])
+
+    def stop(self):
+        """\
+        Make :meth:`run` return.
+        """
+        self._done.set()
+
+def _run_worker(worker, endpoint):
+    ctx = zmq.Context()
+    try:
+        worker.run(ctx, endpoint)
+    finally:
+        ctx.term()
+
+def start_workers(worker, endpoint, count):
+    """\
+    Run ``count`` copies of ``worker`` in their own processes.
+
+    :param worker: A :class:`Worker`; it is copied into each process.
+    :param endpoint: The broker back end endpoint (ipc or tcp).
+    :param count: The number of processes.
+    :returns: A list of started :class:`multiprocessing.Process` objects.
+    """
+    procs = []
+    for _ in range(count):
+        proc = multiprocessing.Process(target=_run_worker,
+                args=(worker, endpoint), daemon=True)
+        proc.start()
+        procs.append(proc)
+    return procs
@@ -0,0 +1,125 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.sockets.lvc
+:synopsis: A last value cache proxy for published messages.
+:author: Amr Ali <amr@ledgerx.com>
+
+The proxy sits between publishers and subscribers. Its XSUB socket connects
+to the publishers and its XPUB socket serves subscribers. It remembers the
+latest message of every topic (see :mod:`ledgerx.protocol.sockets.pubsub`),
+and when a subscription arrives it sends the cached messages matching it
+right away, so new subscribers get a snapshot without waiting for the next
+update. Publishers are unchanged.
+
+The proxy subscribes to every topic upstream, whatever its subscribers
+want, so it also caches topics that nobody subscribes to yet, and keeps
+them current after their last subscriber leaves. Subscriptions are
+filtered by the XPUB socket and are not forwarded upstream.
+
+XPUB cannot address a single subscriber, so subscribers that already hold
+a matching subscription receive the replayed messages again; consumers
+should treat them as idempotent updates.
+
+XPUB drops what does not fit under the send HWM of a subscriber without
+telling anyone, so the HWM of the XPUB socket is ``max_topics`` more than
+the default: a full snapshot fits on top of a full queue of updates.
+"""
+
+import threading
+
+from collections import OrderedDict
+
+import zmq
+
+from ledgerx.protocol import sockets
+
+class LastValueCache(object):
+    """\
+    An XSUB/XPUB proxy keeping the latest message of every topic.
+    """
+
+    def __init__(self, ctx, frontend, backend, max_topics=65536):
+        """\
+        :param ctx: The 0MQ context which the proxy sockets will belong to.
+        :param frontend: The publisher endpoint(s) to connect to; a string or
+            a list of strings.
+        :param backend: The endpoint to bind for subscribers.
+        :param max_topics: The maximum number of cached topics; the least
+            recently updated topic is evicted first. The send HWM of the
+            subscriber socket is raised by as much.
+        """
+        self.frontend = sockets.xsub_socket(ctx, rtimeo=-1)
+        for endpoint in [frontend] if isinstance(frontend, str) else frontend:
+            self.frontend.connect(endpoint)
+        # Cache every topic, not only those subscribed to downstream
+        self.frontend.send(b'\x01')
+        self.backend = sockets.xpub_socket(ctx, rtimeo=-1,
+                send_hwm=sockets.DEFAULT_HWM + max_topics)
+        # Report every subscription, not just the first one of each topic
+        self.backend.setsockopt(zmq.XPUB_VERBOSE, 1)
+        self.backend.bind(backend)
+        self.max_topics = max_topics
+        self.stats = {'updates': 0, 'replayed': 0, 'evicted': 0}
+        self._cache = OrderedDict() # Topic -> frames, least recent first
+        self._done = threading.Event()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def get(self, topic):
+        """\
+        :returns: The cached frames of ``topic``, or None.
+        """
+        return self._cache.get(topic)
+
+    def run(self):
+        """\
+        Forward messages and subscriptions until :meth:`stop` is called.
+        """
+        poller = zmq.Poller()
+        poller.register(self.frontend, zmq.POLLIN)
+        poller.register(self.backend, zmq.POLLIN)
+        while not self._done.is_set():
+            events = dict(poller.poll(100))
+            if self.frontend in events:
+                while self.frontend.getsockopt(zmq.EVENTS) & zmq.POLLIN:
+                    self._update(self.frontend.recv_multipart())
+            if self.backend in events:
+                while self.backend.getsockopt(zmq.EVENTS) & zmq.POLLIN:
+                    self._subscription(self.backend.recv())
+
+    def _update(self, frames):
+        topic = frames[0]
+        cache = self._cache
+        if topic in cache:
+            cache.move_to_end(topic)
+        elif len(cache) >= self.max_topics:
+            cache.popitem(last=False)
+            self.stats['evicted'] += 1
+        cache[topic] = frames
+        self.stats['updates'] += 1
+        self.backend.send_multipart(frames)
+
+    def _subscription(self, event):
+        if event[:1] != b'\x01':
+            return
+        prefix = event[1:]
+        for topic, frames in list(self._cache.items()):
+            if topic.startswith(prefix):
+                self.backend.send_multipart(frames)
+                self.stats['replayed'] += 1
+
+    def stop(self):
+        """\
+        Make :meth:`run` return.
+        """
+        self._done.set()
+
+    def close(self, linger=None):
+        """\
+        Close the proxy sockets.
+        """
+        self.frontend.close(linger)
+        self.backend.close(linger)
@@ -0,0 +1,273 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.sockets.message
+:synopsis: A message-aware multipart socket wrapper.
+:author: Amr Ali <amr@ledgerx.com>
+
+Messages are sent as (optional routing frames, header, body). The header
+is a small frame holding the message type and ID so that receivers can
+route, filter or deduplicate without parsing the body. Peers that send a
+single body frame (i.e., ``sock.send(msg.dumps())``) are still understood,
+which is why header frames start with :data:`HEADER_MAGIC`; custom socket
+identities must not.
+
+In passthrough mode, meant for threads of one process talking over
+``inproc://``, a frozen copy of the message (see :meth:`BaseMessage.freeze`)
+is kept and only a handle to it is sent; the receiver gets that object and
+nothing is serialized or parsed. The sender's message is left as it is, as
+on the network path; a message frozen by the sender is not copied.
+Receivers opt in with ``accept_passthrough``; others take a passthrough
+frame for a body, so a peer on the network cannot reach messages kept in
+this process.
+
+Handles belong to the sending socket: a frame holds a random ID of the
+sender, only known to its peers, and the number of a message in its table.
+A handle is kept until it is received, the sender is closed or, past
+``max_pending``, newer messages push it out. Passthrough is also limited to
+PAIR, PUSH and DEALER sockets, which deliver every message they accept to
+a single peer or fail the send: a PUB socket drops messages nobody
+subscribes to and a ROUTER socket drops those for unknown peers, which
+would leave their handles behind.
+"""
+
+import copy
+import random
+import struct
+import itertools
+
+from collections import OrderedDict
+
+import zmq
+
+from ledgerx.protocol.messages import _logger
+
+HEADER_MAGIC = b'LXH1'
+HEADER_SEPARATOR = b'\x00'
+PASSTHROUGH_MAGIC = b'LXP1'
+
+_handle = struct.Struct('<QQ') # Sender ID, message number
+_PASSTHROUGH_SIZE = len(PASSTHROUGH_MAGIC) + _handle.size
+_senders = {} # Sender ID -> message number -> message sent in passthrough mode
+_random = random.SystemRandom()
+# Socket types that deliver an accepted message or fail to send it
+_PASSTHROUGH_TYPES = (zmq.PAIR, zmq.PUSH, zmq.DEALER)
+
+def pack_header(msg):
+    """\
+    Build the header frame of a message.
+
+    :returns: ``magic type NUL mid`` as bytes; missing fields are left empty.
+    """
+    return HEADER_MAGIC + HEADER_SEPARATOR.join((
+        (getattr(msg, 'type', None) or '').encode('utf8'),
+        (getattr(msg, 'mid', None) or '').encode('utf8')))
+
+def unpack_header(frame):
+    """\
+    Decode a header frame built by :func:`pack_header`.
+
+    :returns: A ``(type, mid)`` tuple, where missing fields are None, or
+        None if ``frame`` is not a header.
+    """
+    frame = bytes(frame)
+    if not frame.startswith(HEADER_MAGIC):
+        return None
+    mtype, _, mid = frame[len(HEADER_MAGIC):].partition(HEADER_SEPARATOR)
+    return mtype.decode('utf8') or None, mid.decode('utf8') or None
+
+class MessageSocket(object):
+    """\
+    Wrap a socket from :func:`ledgerx.protocol.sockets.create_socket` to send
+    and receive messages.
+
+    Bodies of at least ``copy_threshold`` bytes are sent and received
+    without copying; 0MQ then holds a reference to the serialized bytes
+    until they are on the wire, which ``send_message`` reports through a
+    :class:`zmq.MessageTracker`. Smaller bodies are copied, which is cheaper
+    than the zero-copy bookkeeping.
+    """
+
+    def __init__(self, sock, parser, copy_threshold=65536, passthrough=False,
+            accept_passthrough=False, max_pending=65536):
+        """\
+        :param sock: A 0MQ socket.
+        :param parser: A :class:`BaseMessageParser` class.
+        :param copy_threshold: The body size above which no copies are made.
+        :param passthrough: Send handles to frozen messages instead of
+            serializing them; all peers must be in this process. Implies
+            ``accept_passthrough``.
+        :param accept_passthrough: Take the messages of passthrough peers.
+        :param max_pending: The number of sent messages kept for peers to
+            take; the oldest are dropped first.
+        :raises ValueError: If ``passthrough`` is set on a socket other than
+            PAIR, PUSH or DEALER.
+        """
+        if passthrough and sock.type not in _PASSTHROUGH_TYPES:
+            raise ValueError("passthrough requires a PAIR, PUSH or DEALER "
+                    "socket")
+        self.socket = sock
+        self.parser = parser
+        self.copy_threshold = copy_threshold
+        self.passthrough = passthrough
+        self.accept_passthrough = passthrough or accept_passthrough
+        self.max_pending = max_pending
+        self.stats = {'dropped': 0, 'evicted': 0}
+        self._trackers = []
+        if passthrough:
+            self._handles = OrderedDict()
+            self._next_handle = itertools.count()
+            self._sender = _random.getrandbits(64)
+            while _senders.setdefault(self._sender, self._handles) \
+                    is not self._handles:
+                self._sender = _random.getrandbits(64)
+
+    def send_message(self, msg, routing=(), flags=0):
+        """\
+        Serialize and send a message.
+
+        :param msg: The message to send.
+        :param routing: Frames to send before the header, e.g., the peer
+            identity on a ROUTER socket.
+        :param flags: 0MQ send flags (e.g., ``zmq.NOBLOCK``).
+        :returns: A :class:`zmq.MessageTracker` if the body was sent without
+            copying, None otherwise.
+        """
+        if self.passthrough:
+            self._send_handle(msg, routing, flags)
+            return None
+        body = msg.dumps()
+        sock = self.socket
+        for frame in routing:
+            sock.send(frame, flags | zmq.SNDMORE)
+        sock.send(pack_header(msg), flags | zmq.SNDMORE)
+        if len(body) < self.copy_threshold:
+            sock.send(body, flags)
+            return None
+        tracker = sock.send(body, flags, copy=False, track=True)
+        self._trackers = [t for t in self._trackers if not t.done]
+        self._trackers.append(tracker)
+        return tracker
+
+    def _send_handle(self, msg, routing, flags):
+        if not msg.frozen:
+            msg = copy.deepcopy(msg)
+        handles = self._handles
+        handle = next(self._next_handle)
+        handles[handle] = msg.freeze()
+        try:
+            self.socket.send_multipart(list(routing) +
+                    [PASSTHROUGH_MAGIC + _handle.pack(self._sender, handle)],
+                    flags)
+        except:
+            handles.pop(handle, None)
+            raise
+        # Messages a peer never took, e.g., because it was closed with
+        # them in its queue
+        while len(handles) > self.max_pending:
+            handles.popitem(last=False)
+            self.stats['evicted'] += 1
+
+    @property
+    def in_flight(self):
+        """\
+        The number of zero-copy sends 0MQ still holds a reference to.
+        """
+        self._trackers = [t for t in self._trackers if not t.done]
+        return len(self._trackers)
+
+    def recv_frames(self, flags=0):
+        """\
+        Receive a message without parsing it.
+
+        :param flags: 0MQ receive flags (e.g., ``zmq.NOBLOCK``).
+        :returns: A ``(routing, header, body)`` tuple where ``header`` is
+            the ``(type, mid)`` tuple of :func:`unpack_header` (or None if
+            the peer sent a single frame) and ``body`` is a bytes-like object.
+        """
+        routing, header, body, msg = self._recv(flags)
+        if msg is not None:
+            # Serialize after all to keep the same interface
+            return routing, header, msg.dumps()
+        return routing, header, body
+
+    def _recv(self, flags):
+        while True:
+            frames = self.socket.recv_multipart(flags, copy=False)
+            try:
+                return self._split(frames)
+            except ValueError as e:
+                # A bad header or a stale passthrough handle; any peer can
+                # send one, so it must not fail the receiver
+                self.stats['dropped'] += 1
+                _logger().warning("message socket dropped a malformed frame: "
+                        "%s", e)
+
+    def _split(self, frames):
+        body = frames[-1]
+        msg = take_passthrough(body) if self.accept_passthrough else None
+        if msg is not None:
+            return ([f.bytes for f in frames[:-1]],
+                    (getattr(msg, 'type', None), getattr(msg, 'mid', None)),
+                    None, msg)
+        body = body.buffer if len(body) >= self.copy_threshold else body.bytes
+        header = unpack_header(frames[-2].buffer) if len(frames) > 1 else None
+        if header is None:
+            return [f.bytes for f in frames[:-1]], None, body, None
+        return [f.bytes for f in frames[:-2]], header, body, None
+
+    def recv_routed(self, flags=0):
+        """\
+        Receive and parse a message along with its routing frames.
+
+        :returns: A ``(routing, message)`` tuple; messages sent in
+            passthrough mode are returned as they were sent, i.e., frozen.
+        """
+        routing, _, body, msg = self._recv(flags)
+        if msg is not None:
+            return routing, msg
+        return routing, self.parser.parse(body)
+
+    def recv_message(self, flags=0):
+        """\
+        Receive and parse a message.
+
+        :returns: The parsed message.
+        """
+        return self.recv_routed(flags)[1]
+
+    def close(self, linger=None):
+        """\
+        Close the underlying socket, dropping the passthrough messages no
+        peer has taken.
+        """
+        self.socket.close(linger)
+        if self.passthrough:
+            _senders.pop(self._sender, None)
+            self._handles.clear()
+
+def take_passthrough(frame):
+    """\
+    Get the message a passthrough frame refers to. A message can only be
+    taken once. Only call this for sockets whose peers are all in this
+    process.
+
+    :param frame: A frame as received from a socket.
+    :returns: The frozen message, or None if ``frame`` is not a
+        passthrough frame.
+    :raises ValueError: If the message is no longer kept, or was sent from
+        another process.
+    """
+    if len(frame) != _PASSTHROUGH_SIZE:
+        return None
+    frame = bytes(frame)
+    if not frame.startswith(PASSTHROUGH_MAGIC):
+        return None
+    sender, handle = _handle.unpack_from(frame, len(PASSTHROUGH_MAGIC))
+    try:
+        return _senders[sender].pop(handle)
+    except KeyError:
+        raise ValueError("unknown passthrough handle {0:x}/{1}; was the "
+                "message sent from another process or dropped?".format(
+                    sender, handle)) from None
@@ -0,0 +1,256 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.sockets.monitor
+:synopsis: Connection event counters and rates for 0MQ sockets.
+:author: Amr Ali <amr@ledgerx.com>
+
+A :class:`SocketMonitor` consumes the socket monitor events of any number of
+sockets on a background thread and counts them by kind (see
+:data:`EVENT_KINDS`), per socket and in total. Pass one to the socket
+factories (``monitor=``) or call :meth:`SocketMonitor.watch`.
+
+Rates are events per second over the last ``window`` seconds; a high
+``retried`` or ``handshake_failed`` rate is a reconnect storm or a CURVE key
+mismatch in the making.
+
+A socket is reported under its label until it is closed or
+:meth:`SocketMonitor.unwatch` is called; its events then only count in the
+total, so short-lived sockets do not pile up labels.
+"""
+
+import time
+import queue
+import threading
+import itertools
+
+from collections import deque
+
+import zmq
+
+from zmq.utils.monitor import parse_monitor_message
+
+def _events(*names):
+    # Handshake events are not available with every libzmq
+    return [getattr(zmq, name) for name in names if hasattr(zmq, name)]
+
+# Socket type -> name; pyzmq before 18 reports the type as a plain int
+_SOCKET_TYPES = {int(getattr(zmq, name)): name.lower() for name in (
+    'PAIR', 'PUB', 'SUB', 'REQ', 'REP', 'DEALER', 'ROUTER', 'PULL', 'PUSH',
+    'XPUB', 'XSUB', 'STREAM') if hasattr(zmq, name)}
+
+EVENT_KINDS = {
+        'connected': _events('EVENT_CONNECTED', 'EVENT_ACCEPTED'),
+        'disconnected': _events('EVENT_DISCONNECTED'),
+        'retried': _events('EVENT_CONNECT_RETRIED'),
+        'delayed': _events('EVENT_CONNECT_DELAYED'),
+        'handshake_succeeded': _events('EVENT_HANDSHAKE_SUCCEEDED'),
+        'handshake_failed': _events('EVENT_HANDSHAKE_FAILED_NO_DETAIL',
+            'EVENT_HANDSHAKE_FAILED_PROTOCOL', 'EVENT_HANDSHAKE_FAILED_AUTH'),
+        'failed': _events('EVENT_BIND_FAILED', 'EVENT_ACCEPT_FAILED',
+            'EVENT_CLOSE_FAILED'),
+        }
+
+_KIND_OF = {event: kind for kind, events in EVENT_KINDS.items()
+        for event in events}
+
+_ids = itertools.count()
+
+class _Rate(object):
+    """\
+    Event counts in one second buckets over a sliding window.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._buckets = deque()
+
+    def add(self, now, count=1):
+        second = int(now)
+        buckets = self._buckets
+        if buckets and buckets[-1][0] == second:
+            buckets[-1][1] += count
+        else:
+            buckets.append([second, count])
+        self._expire(second)
+
+    def _expire(self, second):
+        buckets = self._buckets
+        while buckets and buckets[0][0] <= second - self.window:
+            buckets.popleft()
+
+    def rate(self, now):
+        self._expire(int(now))
+        return sum(count for _, count in self._buckets) / self.window
+
+    def merge(self, other):
+        counts = {}
+        for second, count in itertools.chain(self._buckets, other._buckets):
+            counts[second] = counts.get(second, 0) + count
+        self._buckets = deque([second, count]
+                for second, count in sorted(counts.items()))
+
+class SocketMonitor(object):
+    """\
+    Aggregate connection events of sockets on a background thread.
+    """
+
+    def __init__(self, window=10, poll_ivl=0.1):
+        """\
+        :param window: The rate window in seconds.
+        :param poll_ivl: How often newly watched sockets are picked up, in
+            seconds.
+        """
+        self.window = window
+        self.poll_ivl = poll_ivl
+        self._lock = threading.Lock()
+        self._counts = {} # Label -> kind -> count
+        self._rates = {} # Label -> kind -> _Rate
+        self._watched = {} # Label -> number of sockets
+        # Of the sockets no longer watched
+        self._retired_counts = {} # Kind -> count
+        self._retired_rates = {} # Kind -> _Rate
+        self._new = queue.Queue()
+        self._done = threading.Event()
+        self._thread = None
+
+    def watch(self, sock, label=None):
+        """\
+        Start counting the events of ``sock``. Must be called from the
+        thread that owns ``sock``.
+
+        :param sock: A 0MQ socket (asyncio sockets are supported).
+        :param label: The name to report the socket's events under
+            (default: the socket type and a sequence number).
+        :returns: The label.
+        """
+        if label is None:
+            stype = int(sock.type)
+            label = '{0}-{1}'.format(_SOCKET_TYPES.get(stype, stype),
+                    next(_ids))
+        endpoint = 'inproc://ledgerx-monitor-{0}'.format(next(_ids))
+        sock.monitor(endpoint, zmq.EVENT_ALL)
+        # Events are received by the monitor thread on a plain socket,
+        # even if ``sock`` is an asyncio socket
+        ctx = zmq.Context.shadow(sock.context.underlying)
+        pair = ctx.socket(zmq.PAIR)
+        pair.connect(endpoint)
+        with self._lock:
+            self._counts.setdefault(label, {})
+            self._rates.setdefault(label, {})
+            self._watched[label] = self._watched.get(label, 0) + 1
+        self._new.put((pair, label))
+        self.start()
+        return label
+
+    def unwatch(self, sock):
+        """\
+        Stop counting the events of ``sock``; closing it does the same. Must
+        be called from the thread that owns ``sock``. Its events are only
+        counted in the total from then on.
+        """
+        sock.disable_monitor()
+
+    def start(self):
+        """\
+        Start the monitor thread if it is not running.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                    name='SocketMonitor')
+            self._thread.start()
+
+    def _run(self):
+        poller = zmq.Poller()
+        labels = {}
+        try:
+            while not self._done.is_set():
+                while not self._new.empty():
+                    pair, label = self._new.get()
+                    poller.register(pair, zmq.POLLIN)
+                    labels[pair] = label
+                for pair, _ in poller.poll(self.poll_ivl * 1000):
+                    event = parse_monitor_message(pair.recv_multipart())
+                    if event['event'] == zmq.EVENT_MONITOR_STOPPED:
+                        poller.unregister(pair)
+                        self._retire(labels.pop(pair))
+                        pair.close(0)
+                        continue
+                    self._record(labels[pair], event['event'])
+        finally:
+            for pair in labels:
+                pair.close(0)
+            while not self._new.empty():
+                self._new.get()[0].close(0)
+
+    def _record(self, label, event):
+        kind = _KIND_OF.get(event)
+        if kind is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            counts = self._counts[label]
+            counts[kind] = counts.get(kind, 0) + 1
+            rates = self._rates[label]
+            if kind not in rates:
+                rates[kind] = _Rate(self.window)
+            rates[kind].add(now)
+
+    def _retire(self, label):
+        with self._lock:
+            left = self._watched[label] - 1
+            if left:
+                self._watched[label] = left
+                return
+            del self._watched[label]
+            retired = self._retired_counts
+            for kind, count in self._counts.pop(label).items():
+                retired[kind] = retired.get(kind, 0) + count
+            retired = self._retired_rates
+            for kind, rate in self._rates.pop(label).items():
+                if kind in retired:
+                    retired[kind].merge(rate)
+                else:
+                    retired[kind] = rate
+
+    def snapshot(self):
+        """\
+        Get the event counters.
+
+        :returns: A dictionary of ``sockets``, mapping the labels of the
+            watched sockets to counters, and ``total``, which also counts
+            the sockets no longer watched; counters are dictionaries of
+            every kind of :data:`EVENT_KINDS` to
+            ``{'count': n, 'rate': events_per_second}``.
+        """
+        now = time.monotonic()
+        def counters(counts, rates):
+            return {kind: {
+                'count': counts.get(kind, 0),
+                'rate': rates[kind].rate(now) if kind in rates else 0.0,
+                } for kind in EVENT_KINDS}
+        res = {}
+        with self._lock:
+            for label, counts in self._counts.items():
+                res[label] = counters(counts, self._rates[label])
+            retired = counters(self._retired_counts, self._retired_rates)
+        total = {kind: {
+            'count': sum(s[kind]['count'] for s in res.values()) +
+                retired[kind]['count'],
+            'rate': sum(s[kind]['rate'] for s in res.values()) +
+                retired[kind]['rate'],
+            } for kind in EVENT_KINDS}
+        return {'sockets': res, 'total': total}
+
+    def stop(self):
+        """\
+        Stop the monitor thread and close its sockets. Must be called before
+        the sockets' context is terminated.
+        """
+        self._done.set()
+        if self._thread is not None:
+            self._thread.join()
+        else:
+            while not self._new.empty():
+                self._new.get()[0].close(0)
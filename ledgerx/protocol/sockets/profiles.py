@@ -0,0 +1,146 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.sockets.profiles
+:synopsis: Named socket and context tuning profiles.
+:author: Amr Ali <amr@ledgerx.com>
+
+A profile is a set of 0MQ socket options and context options tuned for one
+goal. Pass its name (or a :class:`Profile`) to any socket factory as
+``profile=`` and create the context with :func:`create_context` so that
+every service tunes the same way:
+
+>>> ctx = create_context('high_throughput')
+>>> s = sockets.push_socket(ctx, profile='high_throughput')
+
+Profile socket options replace the defaults of the factory arguments, but
+arguments passed explicitly take precedence over the profile.
+"""
+
+import zmq
+
+class Profile(object):
+    """\
+    A named set of socket and context options.
+    """
+
+    def __init__(self, name, socket_options=None, context_options=None,
+            doc=None):
+        """\
+        :param name: The profile name.
+        :param socket_options: A dictionary of 0MQ socket options (e.g.,
+            ``zmq.SNDBUF``) to values.
+        :param context_options: A dictionary of 0MQ context options (e.g.,
+            ``zmq.IO_THREADS``) to values.
+        :param doc: A description of the profile.
+        """
+        self.name = name
+        self.socket_options = dict(socket_options or {})
+        self.context_options = dict(context_options or {})
+        self.doc = doc
+
+    def __repr__(self):
+        return '<Profile {0!r}>'.format(self.name)
+
+    def apply(self, sock):
+        """\
+        Set the socket options of this profile on ``sock``.
+        """
+        for option, value in self.socket_options.items():
+            sock.setsockopt(option, value)
+
+    def apply_context(self, ctx):
+        """\
+        Set the context options of this profile on ``ctx``. ``IO_THREADS``
+        only takes effect before the first socket of ``ctx`` is created.
+        """
+        for option, value in self.context_options.items():
+            ctx.set(option, value)
+
+PROFILES = {}
+
+def register_profile(profile):
+    """\
+    Make a profile available by name.
+
+    :param profile: A :class:`Profile`.
+    :returns: ``profile``.
+    """
+    if profile.name in PROFILES:
+        raise ValueError("profile {0!r} is already registered".format(
+            profile.name))
+    PROFILES[profile.name] = profile
+    return profile
+
+def get_profile(profile):
+    """\
+    :param profile: A profile name or a :class:`Profile`.
+    :returns: The :class:`Profile`.
+    """
+    if isinstance(profile, Profile):
+        return profile
+    try:
+        return PROFILES[profile]
+    except KeyError:
+        raise ValueError("unknown profile {0!r}".format(profile)) from None
+
+def create_context(profile=None, ctx_class=zmq.Context):
+    """\
+    Create a 0MQ context configured by a profile.
+
+    :param profile: A profile name or a :class:`Profile` (default: none).
+    :param ctx_class: The context class, e.g., :class:`zmq.asyncio.Context`.
+    :returns: A new context.
+    """
+    ctx = ctx_class()
+    if profile is not None:
+        get_profile(profile).apply_context(ctx)
+    return ctx
+
+def _keepalive(options):
+    # Detect dead TCP peers within a minute instead of the system's hours
+    res = {
+            zmq.TCP_KEEPALIVE: 1,
+            zmq.TCP_KEEPALIVE_IDLE: 10,
+            zmq.TCP_KEEPALIVE_INTVL: 5,
+            zmq.TCP_KEEPALIVE_CNT: 3,
+            }
+    res.update(options)
+    return res
+
+LOW_LATENCY = register_profile(Profile('low_latency', _keepalive({
+        # Fail sends instead of queueing them for peers that are not
+        # connected yet, and keep queues short so nothing waits behind
+        # a backlog
+        zmq.IMMEDIATE: 1,
+        zmq.SNDHWM: 1000,
+        zmq.RCVHWM: 1000,
+        zmq.LINGER: 0,
+        # One I/O thread; pin the socket to it
+        zmq.AFFINITY: 1,
+        }), {zmq.IO_THREADS: 1},
+        doc="Request/reply traffic where each message waits for the last."))
+
+HIGH_THROUGHPUT = register_profile(Profile('high_throughput', _keepalive({
+        # Large kernel buffers let the I/O threads move bigger batches
+        zmq.SNDBUF: 4 * 1024 * 1024,
+        zmq.RCVBUF: 4 * 1024 * 1024,
+        zmq.SNDHWM: 100000,
+        zmq.RCVHWM: 100000,
+        }), {zmq.IO_THREADS: 2},
+        doc="Bulk transfers and pipelines where latency is secondary."))
+
+MARKET_DATA = register_profile(Profile('market_data', _keepalive({
+        zmq.SNDBUF: 4 * 1024 * 1024,
+        zmq.RCVBUF: 4 * 1024 * 1024,
+        # A subscriber that falls this far behind loses messages rather
+        # than growing the publisher; late data is worthless anyway
+        zmq.SNDHWM: 10000,
+        zmq.RCVHWM: 10000,
+        zmq.LINGER: 0,
+        }), {zmq.IO_THREADS: 1},
+        doc="Publish/subscribe feeds. ZMQ_CONFLATE is not set since it "
+            "does not support the multipart topic messages of "
+            "ledgerx.protocol.sockets.pubsub; see "
+            "ledgerx.protocol.sockets.lvc and backpressure for conflation."))
@@ -0,0 +1,111 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.sockets.pubsub
+:synopsis: Topic-prefixed publish/subscribe helpers.
+:author: Amr Ali <amr@ledgerx.com>
+
+Messages are published as two frames, a topic and the body. The topic is
+``type|mversion|key|``, so a SUB socket subscribed to a prefix of it (e.g.,
+``order|`` for every order, or ``order|0.0.1|42|`` for the orders of key 42
+in version 0.0.1) is filtered by 0MQ and unwanted bodies are never parsed.
+The trailing separator keeps ``order|`` from matching ``orders|``.
+"""
+
+import zmq
+
+TOPIC_SEPARATOR = '|'
+
+def topic(mtype, mversion=None, key=None):
+    """\
+    Build a topic or topic prefix.
+
+    :param mtype: The message type.
+    :param mversion: The message version; omitted to match all versions.
+    :param key: The message key (e.g., a contract ID); omitted to match all
+        keys. Requires ``mversion``.
+    :returns: The topic as bytes.
+    """
+    parts = [mtype]
+    if mversion is not None:
+        parts.append(str(mversion))
+        if key is not None:
+            parts.append(str(key))
+    elif key is not None:
+        raise ValueError("a topic key requires a message version")
+    return (TOPIC_SEPARATOR.join(parts) + TOPIC_SEPARATOR).encode('utf8')
+
+def message_topic(msg, key=None):
+    """\
+    Build the topic of a message.
+
+    :param msg: The message to publish.
+    :param key: The name of the message field to use as the topic key,
+        e.g., ``'contract_id'``; a message without it gets an empty key.
+    :returns: The topic as bytes.
+    """
+    value = '' if key is None else getattr(msg, key, None)
+    return topic(msg.type, msg.mversion, '' if value is None else value)
+
+def publish(sock, msg, key=None, flags=0):
+    """\
+    Serialize and publish a message.
+
+    :param sock: A PUB or XPUB socket.
+    :param msg: The message to publish.
+    :param key: The name of the message field to use as the topic key.
+    :param flags: 0MQ send flags (e.g., ``zmq.NOBLOCK``).
+    """
+    sock.send_multipart([message_topic(msg, key), msg.dumps()], flags)
+
+def _prefixes(types, keys):
+    for mtype in types:
+        if isinstance(mtype, str):
+            if keys:
+                raise ValueError("keys require message classes, "
+                        "which carry a version")
+            yield topic(mtype)
+            continue
+        mversion = str(mtype.Version)
+        if not keys:
+            yield topic(mtype.Type, mversion)
+        for key in keys:
+            yield topic(mtype.Type, mversion, key)
+
+def subscribe(sock, *types, keys=()):
+    """\
+    Subscribe to messages by type.
+
+    :param sock: A SUB or XSUB socket.
+    :param types: Message types (e.g., ``'order'``), matching all versions,
+        or message classes, matching their ``Version``. Subscribes to
+        everything if empty.
+    :param keys: Restrict the subscriptions of message classes to these
+        topic keys.
+    """
+    if not types:
+        sock.setsockopt(zmq.SUBSCRIBE, b'')
+    for prefix in _prefixes(types, keys):
+        sock.setsockopt(zmq.SUBSCRIBE, prefix)
+
+def unsubscribe(sock, *types, keys=()):
+    """\
+    Undo a :func:`subscribe` call made with the same arguments.
+    """
+    if not types:
+        sock.setsockopt(zmq.UNSUBSCRIBE, b'')
+    for prefix in _prefixes(types, keys):
+        sock.setsockopt(zmq.UNSUBSCRIBE, prefix)
+
+def recv_message(sock, parser, flags=0):
+    """\
+    Receive and parse a published message.
+
+    :param sock: A SUB or XSUB socket.
+    :param parser: A :class:`BaseMessageParser` class.
+    :param flags: 0MQ receive flags (e.g., ``zmq.NOBLOCK``).
+    :returns: A ``(topic, message)`` tuple.
+    """
+    frames = sock.recv_multipart(flags)
+    return frames[0], parser.parse(frames[-1])
@@ -0,0 +1,152 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.sockets.rpc
+:synopsis: A pipelined asyncio RPC client.
+:author: Amr Ali <amr@ledgerx.com>
+
+Unlike a REQ socket, which allows a single outstanding request, the client
+sends requests over a DEALER socket as they come and matches replies to
+requests by their message ID (``MessageIDMixin.mid``). Servers must reply
+with the ID of the request, which is what ``BaseMessage.reply`` does.
+"""
+
+import asyncio
+
+import zmq
+
+from ledgerx.protocol.sockets import aio
+
+class RPCClient(object):
+    """\
+    An asyncio RPC client correlating replies by message ID.
+    """
+
+    def __init__(self, ctx, endpoint, parser, max_in_flight=128, timeout=1.0,
+            retries=2, sfn=aio.dealer_socket, **kwargs):
+        """\
+        :param ctx: The 0MQ context which the client socket will belong to.
+        :param endpoint: The server endpoint to connect to.
+        :param parser: A :class:`BaseMessageParser` class for replies.
+        :param max_in_flight: The maximum number of outstanding requests;
+            further requests wait for a slot.
+        :param timeout: The default time to wait for a reply in seconds.
+        :param retries: The default number of times a request is resent
+            after a timeout. Resent requests keep their message ID so a late
+            reply to an earlier attempt is accepted.
+        :param sfn: The asyncio socket creation function.
+        :param kwargs: Socket options; see :func:`sockets.create_socket`.
+        """
+        kwargs.setdefault('rtimeo', -1)
+        self.socket = sfn(ctx, **kwargs)
+        self.socket.connect(endpoint)
+        self.parser = parser
+        self.timeout = timeout
+        self.retries = retries
+        self.max_in_flight = max_in_flight
+        self.stats = {'sent': 0, 'retried': 0, 'timed_out': 0, 'unmatched': 0}
+        self._slots = None
+        self._pending = {}
+        self._reader = None
+
+    @property
+    def in_flight(self):
+        """\
+        The number of requests awaiting a reply.
+        """
+        return len(self._pending)
+
+    def submit(self, msg, timeout=None, retries=None):
+        """\
+        Send a request without waiting for the reply.
+
+        :returns: An :class:`asyncio.Future` of the reply message.
+        """
+        return asyncio.ensure_future(self.request(msg, timeout, retries))
+
+    async def request(self, msg, timeout=None, retries=None):
+        """\
+        Send a request and wait for its reply.
+
+        :param msg: The request; a message ID is generated if it has none,
+            so a frozen request must have one.
+        :param timeout: Seconds to wait for each attempt (default: ``timeout``).
+        :param retries: Resend attempts (default: ``retries``).
+        :returns: The parsed reply.
+        :raises asyncio.TimeoutError: If no reply arrived after all attempts.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        if msg.mid is None:
+            msg.generate_mid()
+        mid = msg.mid
+        data = msg.dumps()
+
+        async with self._slots:
+            if mid in self._pending:
+                raise ValueError("a request with ID {0} is in flight".format(mid))
+            loop = asyncio.get_event_loop()
+            fut = loop.create_future()
+            self._pending[mid] = fut
+            self._start_reader()
+            try:
+                for attempt in range(retries + 1):
+                    if attempt:
+                        self.stats['retried'] += 1
+                    await self.socket.send(data)
+                    self.stats['sent'] += 1
+                    # A plain timer avoids the tasks wait_for/shield create
+                    # for every attempt
+                    waiter = loop.create_future()
+                    fut.add_done_callback(_wake(waiter))
+                    timer = loop.call_later(timeout, _wake(waiter))
+                    try:
+                        await waiter
+                    finally:
+                        timer.cancel()
+                    if fut.done():
+                        return fut.result()
+                self.stats['timed_out'] += 1
+                raise asyncio.TimeoutError(
+                        "no reply to {0} after {1} attempt(s)".format(
+                            mid, retries + 1))
+            finally:
+                self._pending.pop(mid, None)
+                fut.cancel()
+
+    def _start_reader(self):
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.ensure_future(self._read())
+
+    async def _read(self):
+        while self._pending:
+            try:
+                replies = await aio.recv_messages(self.socket, self.parser)
+            except zmq.Again:
+                continue
+            for reply in replies:
+                fut = self._pending.get(getattr(reply, 'mid', None))
+                if fut is None or fut.done():
+                    self.stats['unmatched'] += 1
+                else:
+                    fut.set_result(reply)
+
+    def close(self, linger=None):
+        """\
+        Stop reading replies and close the socket. Outstanding requests
+        are cancelled.
+        """
+        if self._reader is not None:
+            self._reader.cancel()
+        for fut in self._pending.values():
+            fut.cancel()
+        self.socket.close(linger)
+
+def _wake(waiter):
+    def wake(*args):
+        if not waiter.done():
+            waiter.set_result(None)
+    return wake
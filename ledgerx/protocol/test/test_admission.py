@@ -0,0 +1,124 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.test.test_admission
+:synopsis: Unit tests for the admission module.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import time
+import unittest
+
+from ledgerx.protocol.admission import Admission
+from ledgerx.protocol.bench import messages
+
+def _frames(serializer):
+    order = messages.order(serializer)
+    book = messages.book_state(serializer, 1)
+    status = messages.parser(serializer).MessageStatus().client_error('x')
+    return order.dumps(), book.dumps(), status.dumps()
+
+class TestAdmission(unittest.TestCase):
+
+    def test_priority(self):
+        for serializer in ('json', 'msgpack'):
+            parser = messages.parser(serializer)
+            admission = Admission(parser, {'order': 0, 'book_state': 1})
+            order, book, status = _frames(serializer)
+            self.assertEqual(admission.classify(order)[0], 0)
+            self.assertEqual(admission.classify(book)[0], 1)
+            self.assertEqual(admission.classify(status), (2, None))
+            self.assertEqual(admission.classify(b'garbage'), (2, None))
+            for i, frame in enumerate((status, book, order, book, order)):
+                self.assertIsNone(admission.offer(frame, i))
+            self.assertEqual(len(admission), 5)
+            # Highest class first, in order within a class
+            taken = [(ctx, msg.type) for ctx, msg in admission.drain()]
+            self.assertEqual(taken, [(2, 'order'), (4, 'order'),
+                (1, 'book_state'), (3, 'book_state'), (0, 'status')])
+            self.assertIsNone(admission.take())
+            snapshot = admission.snapshot()
+            self.assertEqual(snapshot['admitted'], 5)
+            self.assertEqual(snapshot['taken'], 5)
+            self.assertEqual(snapshot['by_type']['order'],
+                    {'admitted': 2, 'shed': 0, 'rejected': 0})
+            self.assertEqual(snapshot['by_type'][None]['admitted'], 1)
+            self.assertEqual(snapshot['depths'], [0, 0, 0])
+            self.assertEqual(snapshot['wait_ns'][0]['count'], 2)
+
+    def test_reject(self):
+        admission = Admission(messages.parser('json'), {'order': 0},
+                max_depth=[1, 2])
+        order, book, _ = _frames('json')
+        self.assertIsNone(admission.offer(order))
+        reply = admission.offer(order)
+        parser = messages.parser('json')
+        mid = parser.parse(order).mid
+        self.assertEqual(reply.mid, mid)
+        self.assertTrue(reply.frozen)
+        self.assertEqual(reply.status, 500)
+        parsed = parser.parse(reply.dumps())
+        self.assertEqual((parsed.mid, parsed.status), (mid, 500))
+        self.assertEqual(parsed.message, "server overloaded")
+        self.assertIsNone(admission.offer(book))
+        self.assertIsNone(admission.offer(book))
+        self.assertIsNotNone(admission.offer(book).mid)
+        self.assertIs(admission.offer(b'garbage'), admission.reply)
+        self.assertEqual(admission.stats, {'admitted': 3, 'shed': 0,
+            'rejected': 3, 'taken': 0})
+        with self.assertRaises(ValueError):
+            Admission(messages.parser('json'), {'order': 0}, max_depth=[1])
+
+    def test_shared_reply(self):
+        for serializer in ('json', 'msgpack'):
+            admission = Admission(messages.parser(serializer), {'order': 0},
+                    max_depth=0, share_reply=True)
+            order, book, _ = _frames(serializer)
+            reply = admission.offer(order)
+            self.assertIs(reply, admission.reply)
+            self.assertTrue(reply.frozen)
+            self.assertIsNone(reply.mid)
+            self.assertIs(admission.offer(book), reply)
+            admission.share_reply = False
+            parser = messages.parser(serializer)
+            reply = parser.parse(admission.offer(order).dumps())
+            self.assertEqual(reply.mid, parser.parse(order).mid)
+            self.assertEqual(reply.status, 500)
+
+    def test_shed_depth(self):
+        admission = Admission(messages.parser('json'), {'order': 0,
+            'book_state': 1}, shed_depth=2)
+        order, book, status = _frames('json')
+        for frame in (book, status, order):
+            self.assertIsNone(admission.offer(frame))
+        self.assertTrue(admission.overloaded())
+        # Only the protected class gets in
+        self.assertIsNotNone(admission.offer(book))
+        self.assertIsNotNone(admission.offer(status))
+        self.assertIsNone(admission.offer(order))
+        snapshot = admission.snapshot(reset=True)
+        self.assertEqual(snapshot['shed'], 2)
+        self.assertEqual(snapshot['by_type']['book_state']['shed'], 1)
+        self.assertTrue(snapshot['overloaded'])
+        self.assertEqual(admission.stats['shed'], 0)
+        admission.take()
+        admission.take()
+        self.assertFalse(admission.overloaded())
+        self.assertIsNone(admission.offer(book))
+
+    def test_shed_latency(self):
+        admission = Admission(messages.parser('msgpack'), {'order': 0},
+                shed_latency=0.05)
+        order, book, _ = _frames('msgpack')
+        self.assertIsNone(admission.offer(book))
+        self.assertIsNone(admission.offer(book))
+        time.sleep(0.1)
+        self.assertTrue(admission.overloaded())
+        self.assertIsNotNone(admission.offer(book))
+        self.assertIsNone(admission.offer(order))
+        list(admission.drain(2))
+        self.assertEqual(admission.depth(1), 1)
+        self.assertEqual(admission.snapshot()['wait_ns'][1]['count'], 1)
+        admission.take()
+        self.assertFalse(admission.overloaded())
@@ -0,0 +1,81 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.test.test_bench
+:synopsis: Unit tests for the bench module.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import os
+import tempfile
+import unittest
+
+from ledgerx.protocol import bench
+from ledgerx.protocol.bench import messages
+from ledgerx.protocol.tester import load_benchmark_suite
+
+class _TestBench(bench.BenchmarkCase):
+    params = [{'size': 1}, {'size': 2}]
+    number = 10
+    repeat = 2
+
+    def setUp(self):
+        self.calls = 0
+
+    def bench_count(self):
+        self.calls += self.size
+
+class TestBench(unittest.TestCase):
+
+    def test_case(self):
+        suite = bench.BenchmarkLoader().load_from_case(_TestBench)
+        self.assertEqual(len(suite), 2)
+        self.assertEqual([c.name for c in suite], [
+            'test_bench._TestBench.bench_count[size=1]',
+            'test_bench._TestBench.bench_count[size=2]'])
+
+        case = suite.cases[1]
+        res = case.run()
+        self.assertEqual(case.calls, 2 * 10 * 2)
+        self.assertEqual(res['number'], 10)
+        self.assertEqual(res['repeat'], 2)
+        self.assertLessEqual(res['min_ns'], res['median_ns'])
+
+    def test_suite(self):
+        suite = load_benchmark_suite()
+        self.assertGreater(len(suite), 0)
+        clocks = suite.filter('ClockBench')
+        self.assertEqual(len(clocks), 2)
+
+    def test_save_compare(self):
+        results = bench.BenchmarkSuite(
+                bench.BenchmarkLoader().load_from_case(_TestBench)).run()
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            bench.save_results(results, path)
+            baseline = bench.load_results(path)
+        finally:
+            os.unlink(path)
+        self.assertEqual(baseline, results)
+
+        name = 'test_bench._TestBench.bench_count[size=1]'
+        baseline['results'][name]['median_ns'] = \
+                results['results'][name]['median_ns'] / 2
+        rows, regressions = bench.compare(results, baseline, threshold=0.5)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0][0], name)
+        self.assertAlmostEqual(rows[0][3], 2.0)
+        self.assertEqual(regressions, [name])
+
+    def test_sample_messages(self):
+        for serializer in ('json', 'msgpack'):
+            with self.subTest(serializer=serializer):
+                parser = messages.parser(serializer)
+                msg = messages.book_state(serializer, depth=3)
+                obj = parser.parse(msg.dumps())
+                self.assertEqual(obj.mid, msg.mid)
+                self.assertEqual([e.size for e in obj.entries], [10, 11, 12])
+                obj = parser.parse(b'\xff')
+                self.assertEqual(obj.status, 400)
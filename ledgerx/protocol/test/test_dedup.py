@@ -0,0 +1,65 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.test.test_dedup
+:synopsis: Unit tests for the dedup module.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import time
+import unittest
+
+from ledgerx.protocol.bench import messages
+from ledgerx.protocol.dedup import Deduplicator
+
+class TestDeduplicator(unittest.TestCase):
+
+    def test_seen(self):
+        dedup = Deduplicator(capacity=3)
+        msgs = [messages.order() for _ in range(4)]
+        self.assertFalse(dedup.check(msgs[0]))
+        self.assertTrue(dedup.check(msgs[0]))
+        self.assertIn(msgs[0].mid, dedup)
+        for msg in msgs[1:]:
+            self.assertFalse(dedup.check(msg))
+        # The oldest ID was evicted to make room
+        self.assertEqual(len(dedup), 3)
+        self.assertNotIn(msgs[0].mid, dedup)
+        self.assertFalse(dedup.check(msgs[0]))
+        self.assertEqual(dedup.stats, {'checked': 6, 'duplicates': 1,
+            'evicted': 2, 'expired': 0})
+        self.assertFalse(dedup.check(messages.parser('json').MessageStatus()))
+        self.assertFalse(dedup.seen('not hex'))
+        self.assertTrue(dedup.seen('not hex'))
+        dedup.clear()
+        self.assertEqual(len(dedup), 0)
+        with self.assertRaises(ValueError):
+            Deduplicator(capacity=0)
+
+    def test_compact(self):
+        msg = messages.order()
+        dedup = Deduplicator()
+        dedup.check(msg)
+        self.assertEqual(dedup._seen, {bytes.fromhex(msg.mid)})
+        dedup = Deduplicator(compact=False)
+        dedup.check(msg)
+        self.assertEqual(dedup._seen, {msg.mid})
+
+    def test_window(self):
+        dedup = Deduplicator(capacity=4, window=0.05)
+        msgs = [messages.order() for _ in range(6)]
+        for msg in msgs[:2]:
+            dedup.check(msg)
+        time.sleep(0.06)
+        self.assertFalse(dedup.check(msgs[1]))
+        self.assertEqual(dedup.stats['expired'], 2)
+        # The ring wraps around with expired and evicted positions
+        for msg in msgs[2:]:
+            self.assertFalse(dedup.check(msg))
+        self.assertEqual(len(dedup), 4)
+        self.assertEqual(dedup.stats['evicted'], 1)
+        self.assertTrue(dedup.check(msgs[5]))
+        fresh = messages.order()
+        self.assertEqual(list(dedup.filter([msgs[5], fresh, msgs[4], fresh])),
+                [fresh])
@@ -0,0 +1,185 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.test.test_journal
+:synopsis: Unit tests for the journal module.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from ledgerx.protocol.bench import messages
+from ledgerx.protocol.journal import (Journal, JournalReader, segments,
+        segment_path, ts_index_path, mid_index_path, build_index, INBOUND,
+        OUTBOUND, SYNC_ALWAYS, SYNC_NEVER)
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_replay(self):
+        journal = Journal(self.dir, segment_size=4096)
+        msgs = [messages.order('msgpack', mpid=i) for i in range(3)]
+        for msg in msgs:
+            journal.record(None, msg, OUTBOUND)
+        journal.record(msgs[0].dumps(), msgs[0], INBOUND)
+        journal.append(b'raw', ts=42)
+        reader = JournalReader(self.dir)
+        records = list(reader.records())
+        self.assertEqual(len(records), 5)
+        self.assertEqual(records[-1][:4], (42, 0, None, None))
+        self.assertEqual(bytes(records[-1][4]), b'raw')
+        replayed = list(reader.replay(messages.parser('msgpack'),
+            flags=OUTBOUND))
+        self.assertEqual([r[4].mpid for r in replayed], [0, 1, 2])
+        self.assertEqual([r[3] for r in replayed], [m.mid for m in msgs])
+        self.assertTrue(all(r[1] == OUTBOUND for r in replayed))
+        self.assertEqual([r[3] for r in reader.records(flags=INBOUND)],
+                [msgs[0].mid])
+        self.assertEqual(journal.stats['records'], 5)
+        journal.close()
+
+    def test_segments(self):
+        journal = Journal(self.dir, segment_size=4096, sync=SYNC_ALWAYS)
+        for i in range(100):
+            journal.append(b'%03d' % i * 30)
+        self.assertGreater(journal.segment, 0)
+        self.assertEqual(segments(self.dir), list(range(journal.segment + 1)))
+        # Every record, and the seal of every full segment
+        self.assertEqual(journal.stats['syncs'], 100 + journal.segment)
+        with self.assertRaises(ValueError):
+            journal.append(b'x' * 4096)
+        journal.close()
+        data = [bytes(r[4]) for r in JournalReader(self.dir).records()]
+        self.assertEqual(data, [b'%03d' % i * 30 for i in range(100)])
+        data = list(JournalReader(self.dir).records(start=journal.segment))
+        self.assertLess(len(data), 100)
+
+    def test_resume(self):
+        journal = Journal(self.dir, segment_size=4096, sync=SYNC_NEVER)
+        journal.append(b'first')
+        journal.append(b'torn')
+        journal.close()
+        # Clear the length of the last record as if the writer crashed
+        # before completing it
+        path = segment_path(self.dir, 0)
+        with open(path, 'r+b') as fd:
+            data = fd.read()
+            pos = data.index(b'torn')
+            fd.seek(pos - 36)
+            fd.write(b'\x00' * 4)
+        journal = Journal(self.dir, segment_size=4096)
+        journal.append(b'second')
+        journal.close()
+        # A journal with a different segment size starts a new segment
+        journal = Journal(self.dir, segment_size=8192)
+        journal.append(b'third')
+        journal.close()
+        self.assertEqual([bytes(r[4]) for r in JournalReader(self.dir).records()],
+                [b'first', b'second', b'third'])
+        self.assertEqual(segments(self.dir), [0, 1])
+
+    def test_flush_due(self):
+        journal = Journal(self.dir, segment_size=4096, sync_count=100,
+                sync_interval=0.05)
+        journal.append(b'first')
+        self.assertFalse(journal.flush_due())
+        time.sleep(0.06)
+        self.assertTrue(journal.flush_due())
+        self.assertEqual(journal.stats['syncs'], 1)
+        time.sleep(0.06)
+        self.assertFalse(journal.flush_due()) # Nothing new to flush
+        journal.close()
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            Journal(self.dir, sync='sometimes')
+        with open(segment_path(self.dir, 0), 'wb') as fd:
+            fd.write(b'\x00' * 4096)
+        with self.assertRaises(ValueError):
+            Journal(self.dir, segment_size=4096)
+        with self.assertRaises(ValueError):
+            list(JournalReader(self.dir).records())
+
+    def test_empty_record(self):
+        journal = Journal(self.dir, segment_size=4096)
+        journal.append(b'a')
+        with self.assertRaises(ValueError):
+            journal.append(b'')
+        journal.append(b'c')
+        msg = messages.order('json')
+        msg.mid = 'z' * 32 # Not hex, recorded without a MID
+        journal.record(None, msg, OUTBOUND)
+        journal.close()
+        journal = Journal(self.dir, segment_size=4096)
+        journal.close()
+        records = list(JournalReader(self.dir).records())
+        self.assertEqual([bytes(r[4]) for r in records[:2]], [b'a', b'c'])
+        self.assertEqual(len(records), 3)
+        self.assertIsNone(records[2][3])
+
+class TestJournalIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.msgs = [messages.order('json', mpid=i) for i in range(60)]
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def fill(self, journal):
+        for i, msg in enumerate(self.msgs):
+            journal.append(msg.dumps(), INBOUND, mid=msg.mid, ts=1000 + i)
+        # A reply with the MID of the first order and an early timestamp
+        journal.append(self.msgs[0].reply().client_error('no').dumps(),
+                OUTBOUND, mid=self.msgs[0].mid, ts=1005)
+
+    def check(self, reader):
+        parser = messages.parser('json')
+        found = list(reader.find(self.msgs[0].mid, parser))
+        self.assertEqual([r[1] for r in found], [INBOUND, OUTBOUND])
+        self.assertEqual(found[0][4].mpid, 0)
+        self.assertEqual(found[1][4].status, 400)
+        self.assertEqual([r[0] for r in reader.find(self.msgs[42].mid)],
+                [1042])
+        self.assertEqual(list(reader.find(messages.order('json').mid)), [])
+        self.assertEqual(sorted(r[0] for r in reader.window(1004, 1008)),
+                [1004, 1005, 1005, 1006, 1007])
+        window = [r[4].mpid for r in reader.window(1050, 2000, parser)]
+        self.assertEqual(window, list(range(50, 60)))
+
+    def test_write_index(self):
+        journal = Journal(self.dir, segment_size=4096, index=True)
+        self.fill(journal)
+        self.assertGreater(journal.segment, 2)
+        journal.close()
+        for number in segments(self.dir):
+            self.assertTrue(os.path.exists(ts_index_path(self.dir, number)))
+            self.assertTrue(os.path.exists(mid_index_path(self.dir, number)))
+        self.check(JournalReader(self.dir))
+        self.assertEqual(build_index(self.dir), [])
+
+    def test_build_index(self):
+        journal = Journal(self.dir, segment_size=4096)
+        self.fill(journal)
+        # Unindexed records are scanned
+        self.check(JournalReader(self.dir))
+        self.assertEqual(build_index(self.dir), segments(self.dir))
+        self.check(JournalReader(self.dir))
+        # As are records appended after the index was written
+        journal.append(b'{}', mid=self.msgs[0].mid, ts=1003)
+        self.assertEqual(len(list(JournalReader(self.dir).find(
+            self.msgs[0].mid))), 3)
+        self.assertEqual(len(list(JournalReader(self.dir).window(1003, 1004))),
+                2)
+        self.assertEqual(build_index(self.dir), [journal.segment])
+        journal.close()
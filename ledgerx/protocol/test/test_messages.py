@@ -7,6 +7,8 @@
 :author: Amr Ali <amr@ledgerx.com>
 """
 
+import uuid
+import pickle
 import unittest
 
 from ledgerx.protocol.detail import jsonapi, msgpack
@@ -24,7 +26,11 @@ from ledgerx.protocol.messages import (
         MessageCIDMixin,
         MessageVersionMixin,
         MessageTypeMixin,
-        MessageTimeMixin)
+        MessageTypeIDMixin,
+        MessageTimeMixin,
+        MessageTraceMixin)
+from ledgerx.protocol.registry import TypeRegistry, registry_of
+from ledgerx.protocol.bench import messages as sample
 
 class TestMessage(unittest.TestCase):
 
@@ -233,6 +239,11 @@ class TestMessage(unittest.TestCase):
         self.assertEqual(retval_mid, final_mid)
         self.assertEqual(msg.mid, final_mid)
 
+        mid = uuid.UUID(hex=final_mid)
+        self.assertEqual(mid.version, 4)
+        self.assertEqual(mid.variant, uuid.RFC_4122)
+        self.assertEqual(mid.hex, final_mid)
+
     def test_message_id_mixin_generate_mid_method_complex(self):
         class __TestMsg(MessageIDMixin):
             @MessageComplexField
@@ -302,6 +313,53 @@ class TestMessage(unittest.TestCase):
         self.assertEqual(msg.type, 'test')
         self.assertTrue(msg.fullfills(MessageTypeMixin))
 
+    def test_message_type_id_mixin(self):
+        class Struct(object):
+            def __init__(self, **entries):
+                self.__dict__.update(entries)
+        registry = TypeRegistry()
+        class _TestParentMsg(JsonMessage, MessageTypeMixin, MessageVersionMixin,
+                MessageTypeIDMixin):
+            Version = '0.0.7'
+            Registry = registry
+        class _TestMsg(_TestParentMsg):
+            Type = 'type_id_message'
+        class _TestOtherMsg(_TestParentMsg):
+            Type = 'other_type_id_message'
+        class _TestMsgParser(BaseMessageParser):
+            ParentMessage = _TestParentMsg
+            MessageVersions = {'0.0.7': Struct(MessageTypes={
+                'type_id_message': _TestMsg})}
+            MessageStatus = sample.parser('json').MessageStatus
+
+        msg = _TestMsg()
+        self.assertIsNone(msg.assign_tid())
+        with self.assertRaises(ValueError):
+            msg.tid = '0'
+
+        tid = registry.register(_TestMsg)
+        self.assertEqual(msg.assign_tid(), tid)
+        self.assertTrue(msg.fullfills(MessageTypeIDMixin))
+        self.assertIs(registry_of(_TestMsg), registry)
+        self.assertIsNone(registry_of(JsonMessage).type_id(_TestMsg))
+
+        obj = _TestMsgParser.parse(msg.dumps())
+        self.assertIsInstance(obj, _TestMsg)
+        self.assertEqual(obj.tid, tid)
+        # Seen once, the type is dispatched by its ID from then on
+        self.assertIs(_TestMsgParser._tids[tid][2], _TestMsg)
+        self.assertIsInstance(_TestMsgParser.parse(msg.dumps()), _TestMsg)
+        msg.tid = tid + 1
+        self.assertIsInstance(_TestMsgParser.parse(msg.dumps()), _TestMsg)
+        self.assertEqual(len(_TestMsgParser._tids), tid + 1)
+
+        # A registered type that is not one of the parser's is refused
+        other = _TestOtherMsg()
+        other.tid = registry.register(_TestOtherMsg)
+        obj = _TestMsgParser.parse(other.dumps())
+        self.assertEqual(obj.message, "unsupported message type")
+        self.assertEqual(_TestMsgParser.failures(), {'unsupported_type': 1})
+
     def test_message_time_mixin(self):
         class __TestMsg(MessageTimeMixin): pass
         msg = __TestMsg()
@@ -314,4 +372,110 @@ class TestMessage(unittest.TestCase):
         self.assertNotEqual(msg.timestamp, ts)
         self.assertTrue(msg.fullfills(MessageTimeMixin))
 
+        msg.timestamp = 1234567890123456789
+        msg.ticks = 42
+        self.assertEqual(msg.timestamp, 1234567890123456789)
+        self.assertEqual(msg.ticks, 42)
+        with self.assertRaises(ValueError):
+            msg.timestamp = 1.5
 
+    def test_message_trace_mixin(self):
+        class __TestMsg(MessageTraceMixin, MsgPackMessage):
+            MaxHops = 3
+        msg = __TestMsg()
+        self.assertIsNone(msg.trace)
+        msg.stamp('gateway', 100)
+        msg.stamp('engine', 250)
+        self.assertEqual(msg.trace, [['gateway', 100], ['engine', 250]])
+        ts = msg.stamp('publisher')
+        self.assertGreater(ts, 250)
+        msg.stamp('client', ts + 1)
+        self.assertEqual([h for h, _ in msg.trace],
+                ['gateway', 'publisher', 'client'])
+
+        obj = __TestMsg()
+        obj.loads(msg.dumps())
+        self.assertEqual(obj.trace, msg.trace)
+        with self.assertRaises(ValueError):
+            obj.trace = ['gateway']
+        self.assertTrue(msg.fullfills(MessageTraceMixin))
+
+    def test_message_freeze(self):
+        class __TestMsg(MessageIDMixin, MessageVersionMixin, JsonMessage):
+            finalized = 0
+            def finalize(self):
+                type(self).finalized += 1
+        msg = __TestMsg()
+        msg.generate_mid()
+        self.assertFalse(msg.frozen)
+        self.assertIs(msg.freeze(), msg)
+        self.assertTrue(msg.frozen)
+        self.assertIsInstance(msg, __TestMsg)
+        self.assertEqual(type(msg).__name__, '__TestMsg')
+        self.assertIs(msg.freeze(), msg)
+        with self.assertRaises(AttributeError):
+            msg.mid = None
+        # Lazy fields may still be cached
+        self.assertEqual(msg.mversion, '0.0.0')
+
+        data = msg.dumps()
+        self.assertIs(msg.dumps(), data)
+        self.assertEqual(__TestMsg.finalized, 1)
+        # Methods that change fields would leave the cached form stale
+        with self.assertRaises(AttributeError):
+            msg.generate_mid()
+        order = sample.order().freeze()
+        with self.assertRaises(AttributeError):
+            order.refresh_timers()
+        self.assertFalse(hasattr(order, 'stamp'))
+        # Frozen classes are made on the fly, yet pickle
+        frame = order.dumps()
+        copy = pickle.loads(pickle.dumps(order))
+        self.assertIs(type(copy), type(order))
+        self.assertEqual(copy.dumps(), frame)
+        obj = __TestMsg()
+        obj.loads(data)
+        self.assertEqual(obj.mid, msg.mid)
+        self.assertFalse(obj.frozen)
+
+    def test_parse_failures(self):
+        class _Parser(sample.parser('json')):
+            FailureLogInterval = 60
+        garbage = b'\x00garbage'
+        with self.assertLogs('ledgerx.protocol') as logs:
+            first = _Parser.parse(garbage)
+            second = _Parser.parse(garbage)
+        # Only the first failure is logged, with its traceback
+        self.assertEqual(len(logs.records), 1)
+        self.assertIsNotNone(logs.records[0].exc_info)
+        self.assertIs(first, second)
+        self.assertTrue(first.frozen)
+        self.assertEqual(first.status, 400)
+        self.assertIs(first.dumps(), second.dumps())
+
+        order = sample.order()
+        order.mversion = '9.9.9'
+        reply = _Parser.parse(order.dumps())
+        self.assertEqual(reply.mid, order.mid)
+        self.assertFalse(reply.frozen)
+        no_mid = sample.order()
+        no_mid.type = 'unknown'
+        no_mid.mid = None
+        # Replies to deserialized frames are not shared, even without a MID
+        reply = _Parser.parse(no_mid.dumps())
+        self.assertIsNot(reply, _Parser.parse(no_mid.dumps()))
+        self.assertFalse(reply.frozen)
+        self.assertIsNone(reply.mid)
+        self.assertEqual(_Parser.failure(reply), 'unsupported_type')
+        self.assertEqual(_Parser.failure(first), 'unparsable')
+        self.assertEqual(_Parser.failures(), {'unparsable': 2,
+            'unsupported_version': 1, 'unsupported_type': 2})
+        # Subclasses count their own failures
+        class _Other(_Parser):
+            pass
+        self.assertEqual(_Other.failures(), {})
+
+        _Parser.FailureLogInterval = 0
+        with self.assertLogs('ledgerx.protocol') as logs:
+            _Parser.parse(garbage)
+        self.assertIn('1 more since last logged', logs.output[0])
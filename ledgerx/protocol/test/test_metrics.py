@@ -0,0 +1,99 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.test.test_metrics
+:synopsis: Unit tests for the metrics module.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import unittest
+
+from ledgerx.protocol.bench import messages
+from ledgerx.protocol.metrics import Histogram, MessageMetrics
+
+class TestHistogram(unittest.TestCase):
+
+    def test_exact_values(self):
+        h = Histogram(precision=5)
+        for v in range(32):
+            h.record(v)
+        self.assertEqual(h.count, 32)
+        self.assertEqual(h.total, sum(range(32)))
+        self.assertEqual(h.min, 0)
+        self.assertEqual(h.max, 31)
+        self.assertEqual(h.percentile(50), 15)
+        self.assertEqual(h.percentile(100), 31)
+        self.assertEqual(len(h.buckets()), 32)
+
+    def test_relative_error(self):
+        h = Histogram(precision=5)
+        for v in (100, 1000, 12345, 10 ** 6, 987654321, 2 ** 63):
+            with self.subTest(v=v):
+                h.reset()
+                h.record(v)
+                h.record(v + 1)
+                low, high, count = h.buckets()[0]
+                self.assertLessEqual(low, v)
+                self.assertGreaterEqual(high, v)
+                self.assertLessEqual((high - low) / v, 2 ** -4)
+                self.assertLessEqual(h.percentile(50), v + 1)
+
+    def test_percentiles(self):
+        h = Histogram()
+        self.assertIsNone(h.percentile(50))
+        for v in range(1, 1001):
+            h.record(v * 1000)
+        snap = h.snapshot()
+        self.assertEqual(snap['count'], 1000)
+        self.assertEqual(snap['max'], 10 ** 6)
+        self.assertAlmostEqual(snap['p50'], 500000, delta=500000 / 16)
+        self.assertAlmostEqual(snap['p99'], 990000, delta=990000 / 16)
+        self.assertAlmostEqual(snap['mean'], 500500)
+
+    def test_merge(self):
+        h0, h1 = Histogram(), Histogram()
+        h0.record(10)
+        h1.record(20, count=3)
+        h0.merge(h1)
+        self.assertEqual(h0.count, 4)
+        self.assertEqual(h0.total, 70)
+        self.assertEqual((h0.min, h0.max), (10, 20))
+        with self.assertRaises(ValueError):
+            h0.merge(Histogram(precision=3))
+
+class TestMessageMetrics(unittest.TestCase):
+
+    def test_message_metrics(self):
+        metrics = MessageMetrics()
+        class _TestParser(messages.JsonParser):
+            Metrics = metrics
+
+        msg = messages.order()
+        messages.JsonOrder.Metrics = metrics
+        try:
+            data = msg.dumps()
+            msg.dumps()
+        finally:
+            del messages.JsonOrder.Metrics
+        obj = _TestParser.parse(data)
+        self.assertEqual(obj.mid, msg.mid)
+
+        snap = {s['op']: s for s in metrics.snapshot()}
+        self.assertEqual(sorted(snap), ['dumps', 'parse'])
+        self.assertEqual(snap['dumps']['type'], 'order')
+        self.assertEqual(snap['dumps']['mversion'], messages.VERSION)
+        self.assertEqual(snap['dumps']['count'], 2)
+        self.assertEqual(snap['dumps']['bytes'], 2 * len(data))
+        self.assertEqual(snap['parse']['count'], 1)
+        self.assertGreater(snap['parse']['latency_ns']['max'], 0)
+        self.assertEqual(snap['parse']['size']['max'], len(data))
+
+        latency, size = metrics.histograms('parse', 'order', messages.VERSION)
+        self.assertEqual(latency.count, 1)
+        self.assertEqual(len(metrics.snapshot(reset=True)), 2)
+        self.assertEqual(metrics.snapshot(), [])
+
+    def test_disabled(self):
+        self.assertIsNone(messages.JsonOrder.Metrics)
+        self.assertIsNone(messages.JsonParser.Metrics)
@@ -0,0 +1,130 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.test.test_pipeline
+:synopsis: Unit tests for the pipeline module.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import os
+import time
+import unittest
+
+import zmq
+
+from ledgerx.protocol.bench import messages
+from ledgerx.protocol.pipeline import ShardedParser, field_key, shard_of
+
+def _price(msg):
+    if msg.price < 0:
+        raise ValueError("negative price")
+    return msg.mpid, msg.price
+
+def _slow(msg):
+    time.sleep(0.2)
+
+def _die(msg):
+    if msg.price < 0:
+        os._exit(3)
+
+class TestKeys(unittest.TestCase):
+
+    def test_field_key(self):
+        for serializer in ('json', 'msgpack'):
+            parser = messages.parser(serializer)
+            key = field_key(parser)
+            self.assertIn(key(messages.order(serializer, mpid=77).dumps()),
+                    (b'77', 77))
+            # Nested messages do not count
+            self.assertIsNone(key(messages.book_state(serializer).dumps()))
+            key = field_key(parser, 'type')
+            self.assertIn(key(messages.order(serializer).dumps()),
+                    (b'"order"', b'order', 'order'))
+            # Malformed frames have no key
+            for frame in (b'\xff', b'\x81', b'\x82\xa4type', b'garbage'):
+                self.assertIsNone(key(frame))
+
+    def test_shard_of(self):
+        self.assertEqual(shard_of(None, 4), 0)
+        self.assertEqual(shard_of(b'77', 4), shard_of(b'77', 4))
+        self.assertEqual(shard_of(77, 4), shard_of(b'77', 4))
+        self.assertEqual(len({shard_of(i, 4) for i in range(100)}), 4)
+
+class TestShardedParser(unittest.TestCase):
+
+    def test_ordering(self):
+        for serializer in ('json', 'msgpack'):
+            pipeline = ShardedParser(messages.parser(serializer), shards=3,
+                    handler=_price, max_pending=8, batch=4)
+            try:
+                frames = []
+                for i in range(120):
+                    msg = messages.order(serializer, mpid=i % 10)
+                    msg.price = -1 if i == 5 else i
+                    frames.append(msg.dumps())
+                results = []
+                for frame in frames:
+                    pipeline.submit(frame)
+                    results.extend(pipeline.results())
+                self.assertTrue(pipeline.join(5))
+                results.extend(pipeline.results())
+                self.assertEqual(len(results), 119)
+                for mpid in range(10):
+                    prices = [p for m, p in results if m == mpid]
+                    self.assertEqual(prices, sorted(prices))
+                snapshot = pipeline.snapshot()
+                shards = snapshot['shards']
+                self.assertEqual(sum(s['submitted'] for s in shards), 120)
+                self.assertEqual(sum(s['completed'] for s in shards), 120)
+                self.assertEqual(sum(s['errors'] for s in shards), 1)
+                self.assertEqual(sum(s['pending'] for s in shards), 0)
+                self.assertGreaterEqual(snapshot['skew'], 1.0)
+                self.assertLessEqual(snapshot['skew'], 3.0)
+            finally:
+                pipeline.close(5)
+
+    def test_bounded(self):
+        pipeline = ShardedParser(messages.parser('json'), shards=2,
+                handler=_slow, max_pending=1)
+        try:
+            frame = messages.order('json').dumps()
+            shard = pipeline.submit(frame)
+            with self.assertRaises(zmq.Again):
+                pipeline.submit(frame, timeout=0.01)
+            self.assertEqual(pipeline.pending(shard), 1)
+            self.assertEqual(pipeline.stats[shard]['waited'], 1)
+            self.assertEqual(pipeline.submit(frame, timeout=5), shard)
+            with self.assertRaises(ValueError):
+                pipeline.submit(b'')
+            self.assertTrue(pipeline.join(5))
+            self.assertEqual(pipeline.results(), [])
+        finally:
+            pipeline.close(5)
+
+    def test_dead_worker(self):
+        pipeline = ShardedParser(messages.parser('json'), shards=1,
+                handler=_die, max_pending=1)
+        try:
+            msg = messages.order('json')
+            msg.price = -1
+            pipeline.submit(msg.dumps())
+            with self.assertRaises(RuntimeError):
+                pipeline.submit(msg.dumps(), timeout=5)
+            with self.assertRaises(RuntimeError):
+                pipeline.join(5)
+            with self.assertRaises(RuntimeError):
+                pipeline.results(5)
+        finally:
+            pipeline.close(5)
+
+    def test_malformed(self):
+        pipeline = ShardedParser(messages.parser('msgpack'), shards=2)
+        try:
+            for frame in (b'\xff', b'\x81', b'garbage'):
+                self.assertEqual(pipeline.submit(frame), 0)
+            self.assertTrue(pipeline.join(5))
+            self.assertEqual([r.status for r in pipeline.results()],
+                    [400] * 3)
+        finally:
+            pipeline.close(5)
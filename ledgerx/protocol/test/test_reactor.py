@@ -0,0 +1,184 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.test.test_reactor
+:synopsis: Unit tests for the reactor module.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import zmq
+import time
+import unittest
+
+from ledgerx.protocol import sockets
+from ledgerx.protocol.bench import messages
+from ledgerx.protocol.dedup import Deduplicator
+from ledgerx.protocol.messages import BaseMessage
+from ledgerx.protocol.reactor import Reactor
+from ledgerx.protocol.sockets.batch import pack_batch
+from ledgerx.protocol.sockets.message import MessageSocket
+
+class TestReactor(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.ctx = zmq.Context()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.ctx.destroy()
+
+    def setUp(self):
+        self.parser = messages.parser('json')
+        self.reactor = Reactor(budget=4)
+        # Endpoints are not reused: closed inproc sockets unbind lazily
+        endpoint = 'inproc://{0}'.format(self.id())
+        self.router = sockets.router_socket(self.ctx)
+        self.router.bind(endpoint)
+        self.dealer = sockets.dealer_socket(self.ctx)
+        self.dealer.connect(endpoint)
+        self.pull = sockets.pull_socket(self.ctx)
+        self.pull.bind(endpoint + '_pull')
+        self.push = sockets.push_socket(self.ctx)
+        self.push.connect(endpoint + '_pull')
+        self.reactor.add_socket(self.router, self.parser)
+        self.reactor.add_socket(self.pull, self.parser, passthrough=True)
+        self.received = []
+
+    def tearDown(self):
+        for s in (self.router, self.dealer, self.pull, self.push):
+            s.close(0)
+
+    def record(self, sock, routing, msg):
+        self.received.append((sock, len(routing), msg))
+
+    def test_dispatch_by_class(self):
+        self.reactor.add_handler(messages.JsonOrder, self.record)
+        self.reactor.add_handler(BaseMessage, lambda s, r, m: None)
+        self.dealer.send(messages.order().dumps())
+        self.push.send(messages.book_state().dumps())
+        self.reactor.run_once(1)
+        self.assertEqual([(s, n, m.type) for s, n, m in self.received],
+                [(self.router, 1, 'order')])
+        snapshot = self.reactor.snapshot()
+        self.assertEqual(snapshot['messages'], 2)
+        self.assertEqual(snapshot['unhandled'], 0)
+        self.assertEqual(snapshot['handlers_ns']['JsonOrder']['count'], 1)
+        self.assertEqual(snapshot['handlers_ns']['BaseMessage']['count'], 1)
+
+    def test_unhandled_and_errors(self):
+        @self.reactor.handler(messages.JsonOrder)
+        def fail(sock, routing, msg):
+            raise RuntimeError("handler failure")
+        self.push.send(messages.order().dumps())
+        self.push.send(messages.book_state().dumps())
+        self.reactor.run_once(1)
+        self.assertEqual(self.reactor.stats['errors'], 1)
+        self.assertEqual(self.reactor.stats['unhandled'], 1)
+
+    def test_duplicates(self):
+        self.reactor.dedup = Deduplicator()
+        self.reactor.add_handler(object, self.record)
+        msg = messages.order()
+        self.push.send(msg.dumps())
+        self.dealer.send(msg.dumps())
+        self.push.send(messages.order().dumps())
+        time.sleep(0.01)
+        self.reactor.run_once(1)
+        self.assertEqual(len(self.received), 2)
+        self.assertEqual(self.reactor.stats['duplicates'], 1)
+
+    def test_retry_after_parse_failure(self):
+        self.reactor.dedup = Deduplicator()
+        self.reactor.add_handler(object, self.record)
+        msg = messages.order()
+        self.push.send(msg.dumps().replace(b'"order"', b'"bogus"'))
+        self.push.send(msg.dumps())
+        time.sleep(0.01)
+        self.reactor.run_once(1)
+        failed, retried = [m for s, n, m in self.received]
+        self.assertEqual(self.parser.failure(failed), 'unsupported_type')
+        self.assertEqual(failed.mid, msg.mid)
+        self.assertEqual((retried.type, retried.mid), ('order', msg.mid))
+        self.assertIsNone(self.parser.failure(retried))
+        self.assertEqual(self.reactor.stats['duplicates'], 0)
+
+    def test_fairness_budget(self):
+        self.reactor.add_handler(object, self.record)
+        for i in range(10):
+            self.push.send(messages.order(mpid=i).dumps())
+        self.dealer.send(messages.order().dumps())
+        time.sleep(0.01)
+        self.reactor.run_once(1)
+        self.assertEqual(sorted(s is self.pull for s, n, m in self.received),
+                [False, True, True, True, True])
+        self.reactor.run_once(1)
+        self.reactor.run_once(1)
+        self.assertEqual([m.mpid for s, n, m in self.received
+            if s is self.pull], list(range(10)))
+
+    def test_batches_and_headers(self):
+        self.reactor.add_handler(object, self.record)
+        MessageSocket(self.dealer, self.parser).send_message(messages.order())
+        self.push.send(pack_batch([messages.order(mpid=i).dumps()
+            for i in range(3)]))
+        shared = messages.order(mpid=3).freeze()
+        MessageSocket(self.push, self.parser, passthrough=True).send_message(
+                shared)
+        time.sleep(0.01)
+        self.reactor.run_once(1)
+        self.assertEqual(sorted((n, m.mpid) for s, n, m in self.received),
+                [(0, 0), (0, 1), (0, 2), (0, 3), (1, 1)])
+        self.assertIn(shared, [m for s, n, m in self.received])
+
+    def test_passthrough_opt_in(self):
+        self.reactor.add_handler(object, self.record)
+        sender = MessageSocket(self.dealer, self.parser, passthrough=True)
+        sender.send_message(messages.order().freeze())
+        time.sleep(0.01)
+        self.reactor.run_once(1)
+        # The router was added without passthrough
+        failed, = [m for s, n, m in self.received]
+        self.assertEqual(self.parser.failure(failed), 'unparsable')
+
+    def test_malformed_frames(self):
+        self.reactor.add_handler(object, self.record)
+        with self.assertLogs('ledgerx.protocol'):
+            self.push.send(b'LXB1\x05\x00')
+            self.push.send(pack_batch([b'abcdef'])[:-1])
+            self.push.send(b'LXP1' + b'\xff' * 16)
+            self.push.send_multipart([b'LXH1\xff\x00', b'{}'])
+            self.push.send(messages.order(mpid=7).dumps())
+            time.sleep(0.01)
+            # One more frame than the budget
+            self.reactor.run_once(1)
+            self.reactor.run_once(1)
+        self.assertEqual(self.reactor.stats['errors'], 4)
+        self.assertEqual([m.mpid for s, n, m in self.received], [7])
+
+    def test_timers(self):
+        calls = []
+        self.reactor.call_later(0.01, calls.append, 'once')
+        every = self.reactor.call_every(0.01, calls.append, 'every')
+        cancelled = self.reactor.call_later(0.01, calls.append, 'cancelled')
+        cancelled.cancel()
+        self.reactor.call_later(0.045, self.reactor.stop)
+        self.reactor.run()
+        self.assertEqual(calls.count('once'), 1)
+        self.assertGreaterEqual(calls.count('every'), 3)
+        self.assertNotIn('cancelled', calls)
+        every.cancel()
+        self.assertIsNone(self.reactor._timeout())
+
+    def test_loop_lag(self):
+        self.reactor.add_handler(object, lambda s, r, m: time.sleep(0.05))
+        self.reactor.call_later(0, lambda: None)
+        self.push.send(messages.order().dumps())
+        time.sleep(0.01)
+        self.reactor.run_once(1)
+        self.assertGreaterEqual(self.reactor.lag.max, 50 * 1000 * 1000)
+        snapshot = self.reactor.snapshot(reset=True)
+        self.assertEqual(snapshot['lag_ns']['count'], 1)
+        self.assertEqual(self.reactor.lag.count, 0)
+        self.assertEqual(self.reactor.stats['messages'], 0)
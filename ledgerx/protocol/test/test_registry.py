@@ -0,0 +1,87 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.test.test_registry
+:synopsis: Unit tests for the registry module.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import unittest
+
+from ledgerx.protocol.detail import jsonapi
+from ledgerx.protocol.registry import (TypeRegistry, family_registry,
+        registry_of)
+
+class TestTypeRegistry(unittest.TestCase):
+
+    def test_register(self):
+        class _TestMsg(object): Type = 'test'; Version = '1.0.0'
+        class _TestOtherMsg(object): Type = 'other'; Version = '1.0.0'
+
+        reg = TypeRegistry()
+        self.assertEqual(reg.register(_TestMsg), 0)
+        self.assertEqual(reg.register(_TestOtherMsg), 1)
+        self.assertEqual(reg.register(_TestMsg), 0)
+        self.assertEqual(reg.register(_TestMsg, '2.0.0'), 2)
+        self.assertEqual(len(reg), 3)
+        self.assertIs(reg.lookup(1), _TestOtherMsg)
+        self.assertIsNone(reg.lookup(3))
+        self.assertIsNone(reg.lookup(None))
+        self.assertIsNone(reg.lookup(-1))
+        self.assertIsNone(reg.key(-1))
+        self.assertEqual(reg.key(2), ('2.0.0', 'test'))
+        self.assertEqual(reg.type_id(('1.0.0', 'other')), 1)
+        self.assertEqual(reg.type_id(_TestOtherMsg), 1)
+
+        # Another class of the same version and type is a conflict
+        class _TestClashMsg(object): Type = 'test'; Version = '1.0.0'
+        with self.assertRaises(ValueError):
+            reg.register(_TestClashMsg)
+        self.assertIs(reg.lookup(0), _TestMsg)
+
+    def test_explicit_type_id(self):
+        class _TestMsg(object): Type = 'test'; TypeID = 5
+        class _TestClashMsg(object): Type = 'clash'; TypeID = 5
+
+        reg = TypeRegistry()
+        self.assertEqual(reg.register(_TestMsg), 5)
+        self.assertIs(reg.lookup(5), _TestMsg)
+        self.assertIsNone(reg.lookup(0))
+        with self.assertRaises(ValueError):
+            reg.register(_TestClashMsg)
+
+    def test_export_load(self):
+        class _TestMsg(object): Type = 'test'; Version = '1.0.0'
+        class _TestOtherMsg(object): Type = 'other'; Version = '1.0.0'
+
+        reg0 = TypeRegistry()
+        reg0.register(_TestMsg)
+        reg0.register(_TestOtherMsg)
+        table = jsonapi.loads(jsonapi.dumps(reg0.export()))
+
+        # Register in the opposite order after pinning the persisted table
+        reg1 = TypeRegistry()
+        reg1.load(table)
+        self.assertEqual(reg1.register(_TestOtherMsg), 1)
+        self.assertEqual(reg1.register(_TestMsg), 0)
+        self.assertEqual(reg1.export(), reg0.export())
+
+        with self.assertRaises(ValueError):
+            reg1.load([[0, '1.0.0', 'other']])
+
+    def test_families(self):
+        # Two families may define the same version of the same type
+        klasses = [type('_TestMsg', (object,), {'Type': 'status',
+            'Version': '1.0.0', '__module__': '_family{0}.v1_0_0'.format(i)})
+            for i in range(2)]
+        for klass in klasses:
+            self.assertIs(registry_of(klass), family_registry(
+                klass.__module__.rpartition('.')[0]))
+            self.assertEqual(registry_of(klass).register(klass), 0)
+        self.assertIsNot(registry_of(klasses[0]), registry_of(klasses[1]))
+        self.assertIs(family_registry('_family0').lookup(0), klasses[0])
+
+        reg = TypeRegistry()
+        class _TestMsg(object): Type = 'test'; Registry = reg
+        self.assertIs(registry_of(_TestMsg), reg)
@@ -0,0 +1,125 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.test.test_shm
+:synopsis: Unit tests for the shm module.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import zmq
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+
+from ledgerx.protocol.bench import messages
+from ledgerx.protocol.shm import RingProducer, RingConsumer, ring_path
+
+def _consume(path, count, queue):
+    consumer = RingConsumer(path, oldest=True, rtimeo=5000)
+    queue.put([consumer.recv() for _ in range(count)])
+    consumer.close()
+
+class TestRing(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = ring_path('test', self.dir)
+        self.producer = RingProducer(self.path, slot_size=64, slot_count=4)
+
+    def tearDown(self):
+        self.producer.close(unlink=True)
+        shutil.rmtree(self.dir)
+
+    def test_send_recv(self):
+        consumer = RingConsumer(self.path, rtimeo=0)
+        with self.assertRaises(zmq.Again):
+            consumer.recv()
+        for i in range(3):
+            self.assertEqual(self.producer.send(b'msg%d' % i), i)
+        self.assertEqual(consumer.lag, 3)
+        self.assertEqual([consumer.recv() for _ in range(3)],
+                [b'msg0', b'msg1', b'msg2'])
+        with self.assertRaises(zmq.Again):
+            consumer.recv(zmq.NOBLOCK)
+        self.assertEqual(consumer.stats['received'], 3)
+        consumer.close()
+
+    def test_messages(self):
+        producer = RingProducer(self.path + '-msg', slot_size=1024)
+        consumer = RingConsumer(self.path + '-msg', messages.parser('msgpack'))
+        try:
+            msg = messages.order('msgpack')
+            producer.send_message(msg)
+            self.assertEqual(consumer.recv_message().mid, msg.mid)
+        finally:
+            consumer.close()
+            producer.close(unlink=True)
+
+    def test_start(self):
+        self.producer.send(b'before')
+        latest = RingConsumer(self.path, rtimeo=0)
+        oldest = RingConsumer(self.path, oldest=True, rtimeo=0)
+        self.producer.send(b'after')
+        self.assertEqual(latest.recv(), b'after')
+        self.assertEqual(oldest.recv(), b'before')
+        latest.close()
+        oldest.close()
+
+    def test_restart(self):
+        consumer = RingConsumer(self.path, rtimeo=1000)
+        for i in range(3):
+            self.producer.send(b'old%d' % i)
+        self.assertEqual(consumer.recv(), b'old0')
+        self.assertEqual(consumer.generation, 1)
+        # A restarted producer replaces the file instead of truncating it
+        # under the consumer, and starts over at sequence number 0
+        self.producer.close()
+        self.producer = RingProducer(self.path, slot_size=64, slot_count=4)
+        self.assertEqual(self.producer.generation, 2)
+        self.producer.send(b'new0')
+        self.assertEqual([consumer.recv(), consumer.recv()], [b'old1', b'old2'])
+        self.assertEqual(consumer.recv(), b'new0')
+        self.assertEqual(consumer.generation, 2)
+        self.assertEqual(consumer.stats['restarts'], 1)
+        consumer.close()
+
+    def test_overrun(self):
+        consumer = RingConsumer(self.path, rtimeo=0)
+        for i in range(10):
+            self.producer.send(b'%d' % i)
+        # Messages 0-6 are gone, or about to be overwritten
+        self.assertEqual(consumer.recv(), b'7')
+        self.assertEqual(consumer.stats['overruns'], 1)
+        self.assertEqual(consumer.stats['lost'], 7)
+        self.assertEqual([consumer.recv(), consumer.recv()], [b'8', b'9'])
+        # A slot being written for the first time is not an overrun
+        off = self.producer._buf.nbytes - self.producer._stride() * 2
+        self.producer._buf[off:off + 8] = b'\x00' * 8
+        with self.assertRaises(zmq.Again):
+            consumer.recv()
+        self.assertEqual(consumer.stats['overruns'], 1)
+        consumer.close()
+
+    def test_timeout_and_size(self):
+        consumer = RingConsumer(self.path, rtimeo=10, spin=10)
+        with self.assertRaises(zmq.Again):
+            consumer.recv()
+        consumer.close()
+        with self.assertRaises(ValueError):
+            self.producer.send(b'x' * 65)
+        with open(self.path + '-bad', 'wb') as fd:
+            fd.write(b'\x00' * 128)
+        with self.assertRaises(ValueError):
+            RingConsumer(self.path + '-bad')
+
+    def test_processes(self):
+        queue = multiprocessing.Queue()
+        proc = multiprocessing.Process(target=_consume,
+                args=(self.path, 3, queue))
+        proc.start()
+        for i in range(3):
+            self.producer.send(b'%d' % i)
+        self.assertEqual(queue.get(timeout=5), [b'0', b'1', b'2'])
+        proc.join(5)
@@ -0,0 +1,87 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.test.test_sockets_aio
+:synopsis: Unit tests for the sockets.aio module.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import zmq
+import asyncio
+import unittest
+import zmq.asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+
+from ledgerx.protocol.sockets import aio
+from ledgerx.protocol.bench import messages
+
+class TestAsyncSockets(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.ctx = zmq.Context()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.ctx.destroy()
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def test_create_socket(self):
+        s = aio.create_socket(self.ctx, zmq.REQ, rtimeo=10, send_hwm=5)
+        self.assertIsInstance(s, zmq.asyncio.Socket)
+        self.assertEqual(s.rcvtimeo, 10)
+        self.assertEqual(s.sndhwm, 5)
+        self.assertEqual(s.reconnect_ivl, 1)
+        s.close()
+
+    def test_sockets(self):
+        for name, stype in (('dealer', zmq.DEALER), ('router', zmq.ROUTER),
+                ('req', zmq.REQ), ('rep', zmq.REP), ('sub', zmq.SUB),
+                ('xsub', zmq.XSUB), ('pub', zmq.PUB), ('xpub', zmq.XPUB),
+                ('push', zmq.PUSH), ('pull', zmq.PULL), ('pair', zmq.PAIR)):
+            with self.subTest(socket=name):
+                s = getattr(aio, '{0}_socket'.format(name))(self.ctx)
+                self.assertIsInstance(s, zmq.asyncio.Socket)
+                self.assertEqual(s.type, stype)
+                s.close()
+
+    def test_send_recv_message(self):
+        # Sync and asyncio sockets share the same inproc namespace
+        router = aio.router_socket(self.ctx)
+        router.bind('inproc://test_aio_send_recv')
+        dealer = aio.dealer_socket(self.ctx)
+        dealer.connect('inproc://test_aio_send_recv')
+        parser = messages.parser('msgpack')
+        executor = ThreadPoolExecutor(1)
+
+        async def run():
+            sent = [messages.order('msgpack', mpid=i) for i in range(5)]
+            for msg in sent:
+                await aio.send_message(dealer, msg)
+
+            routing, first = await aio.recv_message(router, parser, routed=True)
+            self.assertEqual(first.mid, sent[0].mid)
+            await asyncio.sleep(0.01)
+            rest = await aio.recv_messages(router, parser, max_batch=10,
+                    executor=executor, offload_size=0)
+            self.assertEqual([m.mpid for m in rest], [1, 2, 3, 4])
+
+            await aio.send_message(router, first.reply(), routing=routing)
+            reply = await aio.recv_message(dealer, parser)
+            self.assertEqual(reply.mid, first.mid)
+
+        try:
+            self.loop.run_until_complete(asyncio.wait_for(run(), 5))
+        finally:
+            executor.shutdown()
+            router.close()
+            dealer.close()
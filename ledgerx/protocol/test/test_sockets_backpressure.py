@@ -0,0 +1,128 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.test.test_sockets_backpressure
+:synopsis: Unit tests for the sockets.backpressure module.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import zmq
+import time
+import threading
+import unittest
+
+from ledgerx.protocol import sockets
+from ledgerx.protocol.sockets import backpressure
+from ledgerx.protocol.sockets.backpressure import BoundedSender
+
+HWM = 5
+
+class SlowConsumer(threading.Thread):
+    """\
+    Receive a message every ``delay`` seconds once started.
+    """
+
+    def __init__(self, sock, delay):
+        super().__init__(daemon=True)
+        self.socket = sock
+        self.delay = delay
+        self.received = []
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            try:
+                self.received.append(self.socket.recv_multipart(zmq.NOBLOCK))
+            except zmq.Again:
+                pass
+            time.sleep(self.delay)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+class TestBoundedSender(unittest.TestCase):
+
+    def setUp(self):
+        self.ctx = zmq.Context()
+        self.pull = sockets.pull_socket(self.ctx, recv_hwm=HWM)
+        self.pull.bind('inproc://test_backpressure')
+        self.push = sockets.push_socket(self.ctx, send_hwm=HWM)
+        self.push.connect('inproc://test_backpressure')
+        self.consumer = None
+
+    def tearDown(self):
+        if self.consumer is not None:
+            self.consumer.stop()
+        self.push.close(0)
+        self.pull.close(0)
+        self.ctx.term()
+
+    def fill(self, sender):
+        """\
+        :returns: The number of messages sent before the queue filled up.
+        """
+        count = 0
+        while sender.send(b'%d' % count):
+            count += 1
+        return count
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            BoundedSender(self.push, policy='spill')
+
+    def test_fail(self):
+        sender = BoundedSender(self.push, backpressure.FAIL)
+        with self.assertRaises(zmq.Again):
+            self.fill(sender)
+        # The queues of both ends are bounded
+        self.assertLessEqual(sender.stats['sent'], HWM * 2)
+        self.assertEqual(sender.stats['failed'], 1)
+
+    def test_block(self):
+        sender = BoundedSender(self.push, backpressure.BLOCK, timeout=0.05)
+        with self.assertRaises(zmq.Again):
+            self.fill(sender)
+        self.assertEqual(sender.stats['blocked'], 1)
+
+        self.consumer = SlowConsumer(self.pull, 0.001)
+        self.consumer.start()
+        for i in range(20):
+            self.assertTrue(sender.send(b'x'))
+        self.assertGreater(sender.stats['blocked'], 1)
+        self.assertEqual(sender.stats['failed'], 1)
+
+    def test_drop_oldest(self):
+        sender = BoundedSender(self.push, backpressure.DROP_OLDEST,
+                max_pending=3)
+        sent = self.fill(sender)
+        self.assertEqual(sender.pending, 1)
+        for i in range(4):
+            self.assertFalse(sender.send(b'late%d' % i))
+        self.assertEqual(sender.pending, 3)
+        self.assertEqual(sender.stats['dropped'], 2)
+
+        self.consumer = SlowConsumer(self.pull, 0.001)
+        self.consumer.start()
+        self.assertEqual(sender.flush(None), 0)
+        deadline = time.monotonic() + 1
+        while len(self.consumer.received) < sent + 3 and \
+                time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([f[0] for f in self.consumer.received[sent:]],
+                [b'late1', b'late2', b'late3'])
+
+    def test_conflate(self):
+        sender = BoundedSender(self.push, backpressure.DROP_OLDEST,
+                conflate=lambda frames: frames[0])
+        self.fill(sender)
+        for price in range(10):
+            sender.send([b'order|1.0.0|1|', b'%d' % price])
+            sender.send([b'order|1.0.0|2|', b'%d' % price])
+        self.assertEqual(sender.pending, 3)
+        self.assertEqual(sender.stats['dropped'], 0)
+        self.assertEqual(sender.stats['conflated'], 18)
+        pending = list(sender._pending.values())
+        self.assertEqual(pending[1:], [[b'order|1.0.0|1|', b'9'],
+            [b'order|1.0.0|2|', b'9']])
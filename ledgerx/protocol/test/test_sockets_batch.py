@@ -0,0 +1,154 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.test.test_sockets_batch
+:synopsis: Unit tests for the sockets.batch module.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import zmq
+import time
+import asyncio
+import unittest
+
+from ledgerx.protocol import sockets
+from ledgerx.protocol.bench import messages
+from ledgerx.protocol.sockets import aio
+from ledgerx.protocol.sockets.batch import (
+        BatchSender,
+        pack_batch,
+        parse_batch,
+        unpack_batch)
+
+class TestBatchFrames(unittest.TestCase):
+
+    def test_pack_unpack(self):
+        bodies = [b'a', b'', b'xyz' * 100]
+        self.assertEqual([bytes(b) for b in unpack_batch(pack_batch(bodies))],
+                bodies)
+        self.assertEqual(unpack_batch(b'{"plain": 1}'), [b'{"plain": 1}'])
+        with self.assertRaises(ValueError):
+            unpack_batch(pack_batch([b'abcdef'])[:-1])
+        with self.assertRaises(ValueError):
+            unpack_batch(b'LXB1\x05\x00')
+
+    def test_parse_batch(self):
+        parser = messages.parser('msgpack')
+        sent = [messages.order('msgpack', mpid=i) for i in range(3)]
+        frame = pack_batch([m.dumps() for m in sent])
+        self.assertEqual([m.mid for m in parse_batch(parser, frame)],
+                [m.mid for m in sent])
+        self.assertEqual(parse_batch(parser, sent[0].dumps())[0].mid, sent[0].mid)
+
+class TestBatchSender(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.ctx = zmq.Context()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.ctx.destroy()
+
+    def setUp(self):
+        self.parser = messages.parser('json')
+        self.pull = sockets.pull_socket(self.ctx, rtimeo=100)
+        # Endpoints are not reused: closed inproc sockets unbind lazily
+        endpoint = 'inproc://{0}'.format(self.id())
+        self.pull.bind(endpoint)
+        self.push = sockets.push_socket(self.ctx)
+        self.push.connect(endpoint)
+
+    def tearDown(self):
+        self.push.close(0)
+        self.pull.close(0)
+
+    def received(self):
+        msgs = []
+        while self.pull.poll(0):
+            msgs.append(parse_batch(self.parser, self.pull.recv()))
+        return msgs
+
+    def test_idle_sends_directly(self):
+        sender = BatchSender(self.push, max_delay=10)
+        sender.send(messages.order())
+        self.assertEqual(len(sender), 0)
+        self.assertEqual([len(m) for m in self.received()], [1])
+        self.assertEqual(sender.stats['direct'], 1)
+
+    def test_count_threshold(self):
+        sender = BatchSender(self.push, max_count=3, max_delay=10)
+        for i in range(7):
+            sender.send(messages.order(mpid=i))
+        self.assertEqual(len(sender), 0)
+        msgs = self.received()
+        self.assertEqual([len(m) for m in msgs], [1, 3, 3])
+        self.assertEqual([m.mpid for batch in msgs for m in batch],
+                list(range(7)))
+
+    def test_bytes_threshold(self):
+        data = messages.order().dumps()
+        sender = BatchSender(self.push, max_bytes=len(data) * 2, max_delay=10)
+        for _ in range(5):
+            sender.send(data)
+        self.assertEqual([len(m) for m in self.received()], [1, 2, 2])
+
+    def test_timer(self):
+        sender = BatchSender(self.push, max_delay=0.01)
+        sender.send(messages.order())
+        sender.send(messages.order())
+        self.assertEqual(len(sender), 1)
+        self.assertFalse(sender.flush_due())
+        self.assertLessEqual(sender.timeout(), 0.01)
+        time.sleep(0.01)
+        self.assertTrue(sender.flush_due())
+        self.assertIsNone(sender.timeout())
+        self.assertEqual([len(m) for m in self.received()], [1, 1])
+
+    def test_aio_recv_messages(self):
+        sender = BatchSender(self.push, max_delay=10)
+        for i in range(5):
+            sender.send(messages.order(mpid=i))
+        sender.flush()
+        pull = aio.pull_socket(self.ctx)
+        pull.connect('inproc://test_batch_aio')
+        push = sockets.push_socket(self.ctx)
+        push.bind('inproc://test_batch_aio')
+        try:
+            for frame in [self.pull.recv(), self.pull.recv()]:
+                push.send(frame)
+            loop = asyncio.new_event_loop()
+            msgs = loop.run_until_complete(asyncio.wait_for(
+                aio.recv_messages(pull, self.parser), 5))
+            loop.close()
+        finally:
+            push.close(0)
+            pull.close(0)
+        self.assertEqual([m.mpid for m in msgs], list(range(5)))
+
+    def test_aio_recv_message(self):
+        sender = BatchSender(self.push, max_delay=10)
+        for i in range(4):
+            sender.send(messages.order(mpid=i))
+        sender.flush()
+        pull = aio.pull_socket(self.ctx)
+        pull.connect('inproc://test_batch_aio_one')
+        push = sockets.push_socket(self.ctx)
+        push.bind('inproc://test_batch_aio_one')
+        async def recv():
+            # The rest of a batch is kept for the next calls
+            first = await aio.recv_message(pull, self.parser)
+            second = await aio.recv_message(pull, self.parser)
+            rest = await aio.recv_messages(pull, self.parser)
+            return [first, second] + rest
+        try:
+            for frame in [self.pull.recv(), self.pull.recv()]:
+                push.send(frame)
+            loop = asyncio.new_event_loop()
+            msgs = loop.run_until_complete(asyncio.wait_for(recv(), 5))
+            loop.close()
+        finally:
+            push.close(0)
+            pull.close(0)
+        self.assertEqual([m.mpid for m in msgs], list(range(4)))
@@ -0,0 +1,180 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.test.test_sockets_broker
+:synopsis: Unit tests for the sockets.broker module.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import zmq
+import time
+import threading
+import unittest
+
+from ledgerx.protocol import sockets
+from ledgerx.protocol.bench import messages
+from ledgerx.protocol.sockets.message import MessageSocket
+from ledgerx.protocol.sockets.broker import (Broker, Worker, READY,
+        HEARTBEAT)
+
+class NamedWorker(Worker):
+
+    def __init__(self, parser, name, **kwargs):
+        super().__init__(parser, **kwargs)
+        self.name = name
+        self.handled = 0
+
+    def handle(self, msg):
+        self.handled += 1
+        if msg.size == 0:
+            raise RuntimeError("cannot handle an empty order")
+        if msg.size < 0:
+            time.sleep(-msg.size / 1000)
+        reply = msg.reply()
+        reply.message = self.name
+        return reply
+
+class TestBroker(unittest.TestCase):
+
+    def setUp(self):
+        self.ctx = zmq.Context()
+        self.parser = messages.parser('json')
+        self.broker = Broker(self.ctx, 'inproc://test_broker_front',
+                'inproc://test_broker_back', heartbeat_ivl=0.05)
+        self.broker_thread = self.start(self.broker.run)
+        self.workers = []
+        self.client = sockets.dealer_socket(self.ctx)
+        self.client.connect('inproc://test_broker_front')
+
+    def tearDown(self):
+        self.broker.stop()
+        self.broker_thread.join()
+        self.broker.close()
+        for worker, thread in self.workers:
+            thread.join(1)
+        self.client.close(0)
+        self.ctx.term()
+
+    def start(self, target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        return thread
+
+    def add_worker(self, name):
+        worker = NamedWorker(self.parser, name, heartbeat_ivl=0.05)
+        self.workers.append((worker,
+            self.start(worker.run, self.ctx, 'inproc://test_broker_back')))
+        return worker
+
+    def drain(self, sock):
+        res = []
+        while sock.poll(0):
+            res.append(sock.recv_multipart())
+        return res
+
+    def wait_workers(self, count):
+        deadline = time.monotonic() + 1
+        while self.broker.workers != count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.broker.workers, count)
+
+    def test_round_trip(self):
+        self.add_worker('a')
+        self.wait_workers(1)
+        msg = messages.order()
+        self.client.send(msg.dumps())
+        reply = self.parser.parse(self.client.recv())
+        self.assertEqual(reply.mid, msg.mid)
+        self.assertEqual(reply.message, 'a')
+
+    def test_handler_error(self):
+        worker = self.add_worker('a')
+        self.wait_workers(1)
+        msg = messages.order()
+        msg.size = 0
+        with self.assertLogs('ledgerx.protocol'):
+            self.client.send(msg.dumps())
+            reply = self.parser.parse(self.client.recv())
+        self.assertEqual(reply.mid, msg.mid)
+        self.assertEqual(reply.status, 500)
+        # The worker is still serving
+        self.client.send(messages.order().dumps())
+        self.assertEqual(self.parser.parse(self.client.recv()).message, 'a')
+        self.assertEqual(worker.handled, 2)
+
+    def test_message_socket(self):
+        self.add_worker('a')
+        self.wait_workers(1)
+        client = MessageSocket(self.client, self.parser)
+        msg = messages.order()
+        client.send_message(msg)
+        routing, header, body = client.recv_frames()
+        self.assertEqual(header, ('status', msg.mid))
+        self.assertEqual(self.parser.parse(body).mid, msg.mid)
+
+    def test_least_recently_used(self):
+        workers = [self.add_worker(name) for name in 'abc']
+        self.wait_workers(3)
+        names = []
+        for _ in range(6):
+            self.client.send(messages.order().dumps())
+            names.append(self.parser.parse(self.client.recv()).message)
+        self.assertEqual(sorted(names[:3]), ['a', 'b', 'c'])
+        self.assertEqual(names[3:], names[:3])
+        self.assertEqual([w.handled for w in workers], [2, 2, 2])
+        self.assertEqual(self.broker.stats['requests'], 6)
+        self.assertEqual(self.broker.stats['replies'], 6)
+
+    def test_heartbeat_keeps_order(self):
+        raw = []
+        for identity in (b'first', b'second'):
+            sock = sockets.dealer_socket(self.ctx, linger=0)
+            sock.setsockopt(zmq.IDENTITY, identity)
+            sock.connect('inproc://test_broker_back')
+            sock.send(READY)
+            raw.append(sock)
+            self.wait_workers(len(raw))
+        # A heartbeat does not make the first worker the most recently used
+        raw[0].send(HEARTBEAT)
+        time.sleep(0.02)
+        self.client.send(messages.order().dumps())
+        try:
+            time.sleep(0.1)
+            # Requests have routing frames, heartbeats do not
+            requests = [[f for f in self.drain(sock) if len(f) > 1]
+                    for sock in raw]
+            self.assertEqual([len(r) for r in requests], [1, 0])
+        finally:
+            for sock in raw:
+                sock.close()
+
+    def test_slow_handler(self):
+        worker = self.add_worker('a')
+        self.wait_workers(1)
+        # Handling takes longer than the worker waits for heartbeats
+        msg = messages.order()
+        msg.size = -300
+        self.client.send(msg.dumps())
+        reply = self.parser.parse(self.client.recv())
+        self.assertEqual((reply.mid, reply.message), (msg.mid, 'a'))
+        self.client.send(messages.order().dumps())
+        self.assertEqual(self.parser.parse(self.client.recv()).message, 'a')
+        self.assertEqual(worker.handled, 2)
+
+    def test_eviction(self):
+        silent = sockets.dealer_socket(self.ctx, linger=0)
+        silent.connect('inproc://test_broker_back')
+        silent.send(READY)
+        self.wait_workers(1)
+        time.sleep(0.3)
+        self.assertEqual(self.broker.workers, 0)
+        self.assertEqual(self.broker.stats['evicted'], 1)
+        silent.close()
+
+    def test_heartbeat_keeps_worker(self):
+        self.add_worker('a')
+        self.wait_workers(1)
+        time.sleep(0.3)
+        self.assertEqual(self.broker.workers, 1)
+        self.assertEqual(self.broker.stats['evicted'], 0)
@@ -0,0 +1,116 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.test.test_sockets_lvc
+:synopsis: Unit tests for the sockets.lvc module.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import zmq
+import time
+import threading
+import unittest
+
+from ledgerx.protocol import sockets
+from ledgerx.protocol.bench import messages
+from ledgerx.protocol.sockets import pubsub
+from ledgerx.protocol.sockets.lvc import LastValueCache
+
+class TestLastValueCache(unittest.TestCase):
+
+    def setUp(self):
+        self.ctx = zmq.Context()
+        self.parser = messages.parser('json')
+        self.pub = sockets.pub_socket(self.ctx)
+        self.pub.bind('inproc://test_lvc_pub')
+        self.lvc = LastValueCache(self.ctx, 'inproc://test_lvc_pub',
+                'inproc://test_lvc', max_topics=2)
+        self.thread = threading.Thread(target=self.lvc.run, daemon=True)
+        self.thread.start()
+        self.subs = []
+
+    def tearDown(self):
+        self.lvc.stop()
+        self.thread.join()
+        self.lvc.close(0)
+        self.pub.close(0)
+        for sub in self.subs:
+            sub.close(0)
+        self.ctx.term()
+
+    def subscriber(self, *types):
+        sub = sockets.sub_socket(self.ctx, rtimeo=200)
+        sub.connect('inproc://test_lvc')
+        pubsub.subscribe(sub, *types)
+        self.subs.append(sub)
+        return sub
+
+    def publish(self, contract_id, price):
+        msg = messages.order(contract_id=contract_id)
+        msg.price = price
+        pubsub.publish(self.pub, msg, 'contract_id')
+
+    def wait(self, updates):
+        deadline = time.monotonic() + 1
+        while self.lvc.stats['updates'] < updates and \
+                time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.lvc.stats['updates'], updates)
+
+    def test_snapshot_on_subscribe(self):
+        self.subscriber('order')
+        time.sleep(0.05)
+        self.publish(1, 100)
+        self.publish(2, 200)
+        self.publish(1, 101)
+        self.wait(3)
+        self.assertEqual(len(self.lvc), 2)
+
+        late = self.subscriber(messages.JsonOrder)
+        received = {}
+        for _ in range(2):
+            topic, msg = pubsub.recv_message(late, self.parser)
+            received[msg.contract_id] = msg.price
+        self.assertEqual(received, {1: 101, 2: 200})
+        self.assertEqual(self.lvc.stats['replayed'], 2)
+
+    def test_replay_fits_hwm(self):
+        # A snapshot of every topic fits on top of a full queue of updates
+        self.assertEqual(self.lvc.backend.getsockopt(zmq.SNDHWM),
+                sockets.DEFAULT_HWM + self.lvc.max_topics)
+
+    def test_eviction(self):
+        self.subscriber('order')
+        time.sleep(0.05)
+        for contract_id in (1, 2, 3):
+            self.publish(contract_id, 100)
+        self.wait(3)
+        self.assertEqual(len(self.lvc), 2)
+        self.assertEqual(self.lvc.stats['evicted'], 1)
+        self.assertIsNone(self.lvc.get(pubsub.topic('order', '1.0.0', 1)))
+        self.assertIsNotNone(self.lvc.get(pubsub.topic('order', '1.0.0', 3)))
+
+    def test_late_subscriber(self):
+        # Nobody subscribes before the updates are published
+        time.sleep(0.05)
+        self.publish(1, 100)
+        self.wait(1)
+        sub = self.subscriber('order')
+        topic, msg = pubsub.recv_message(sub, self.parser)
+        self.assertEqual((msg.contract_id, msg.price), (1, 100))
+
+    def test_resubscribe(self):
+        sub = self.subscriber('order')
+        time.sleep(0.05)
+        self.publish(5, 100)
+        self.wait(1)
+        pubsub.recv_message(sub, self.parser)
+        pubsub.unsubscribe(sub, 'order')
+        time.sleep(0.05)
+        # Still cached while nobody is subscribed
+        self.publish(5, 200)
+        self.wait(2)
+        pubsub.subscribe(sub, 'order')
+        topic, msg = pubsub.recv_message(sub, self.parser)
+        self.assertEqual((msg.contract_id, msg.price), (5, 200))
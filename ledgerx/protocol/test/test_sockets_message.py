@@ -0,0 +1,153 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.test.test_sockets_message
+:synopsis: Unit tests for the sockets.message module.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import zmq
+import unittest
+
+from ledgerx.protocol import sockets
+from ledgerx.protocol.bench import messages
+from ledgerx.protocol.sockets.message import (
+        MessageSocket,
+        pack_header,
+        unpack_header,
+        _senders)
+
+class TestMessageSocket(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.ctx = zmq.Context()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.ctx.destroy()
+
+    def setUp(self):
+        self.parser = messages.parser('json')
+        self.router = MessageSocket(sockets.router_socket(self.ctx), self.parser,
+                copy_threshold=4096)
+        # Endpoints are not reused: closed inproc sockets unbind lazily
+        endpoint = 'inproc://{0}'.format(self.id())
+        self.router.socket.bind(endpoint)
+        self.dealer = MessageSocket(sockets.dealer_socket(self.ctx), self.parser,
+                copy_threshold=4096)
+        self.dealer.socket.connect(endpoint)
+
+    def tearDown(self):
+        self.router.close(0)
+        self.dealer.close(0)
+
+    def test_header(self):
+        msg = messages.order()
+        self.assertEqual(unpack_header(pack_header(msg)), ('order', msg.mid))
+        msg.mid = None
+        self.assertEqual(unpack_header(pack_header(msg)), ('order', None))
+        self.assertIsNone(unpack_header(b'\x00\x6b\x8b\x45\x67'))
+
+    def test_send_recv(self):
+        msg = messages.order()
+        self.assertIsNone(self.dealer.send_message(msg))
+
+        routing, header, body = self.router.recv_frames()
+        self.assertEqual(len(routing), 1)
+        self.assertEqual(header, ('order', msg.mid))
+        self.assertIsInstance(body, bytes)
+
+        self.router.send_message(self.parser.parse(body).reply(), routing)
+        reply = self.dealer.recv_message()
+        self.assertEqual(reply.type, 'status')
+        self.assertEqual(reply.mid, msg.mid)
+
+    def test_zero_copy(self):
+        msg = messages.book_state(depth=100)
+        tracker = self.dealer.send_message(msg)
+        self.assertIsInstance(tracker, zmq.MessageTracker)
+
+        routing, obj = self.router.recv_routed()
+        self.assertEqual(obj.mid, msg.mid)
+        self.assertEqual(len(obj.entries), 100)
+        tracker.wait(1)
+        self.assertEqual(self.dealer.in_flight, 0)
+
+    def test_single_frame_peer(self):
+        msg = messages.order()
+        self.dealer.socket.send(msg.dumps())
+        routing, header, body = self.router.recv_frames()
+        self.assertEqual(len(routing), 1)
+        self.assertIsNone(header)
+        self.assertEqual(self.parser.parse(body).mid, msg.mid)
+
+    def receiver(self):
+        return MessageSocket(self.router.socket, self.parser,
+                copy_threshold=4096, accept_passthrough=True)
+
+    def test_passthrough(self):
+        sender = MessageSocket(self.dealer.socket, self.parser, passthrough=True)
+        receiver = self.receiver()
+        msg = messages.book_state(depth=3)
+        self.assertIsNone(sender.send_message(msg))
+        # The receiver gets a frozen copy; the sender's message is unchanged
+        self.assertFalse(msg.frozen)
+        self.assertFalse(msg.entries[0].frozen)
+        routing, obj = receiver.recv_routed()
+        self.assertIsNot(obj, msg)
+        self.assertTrue(obj.frozen)
+        self.assertEqual(obj.mid, msg.mid)
+        self.assertEqual(len(routing), 1)
+
+        # Messages frozen by the sender are not copied
+        sender.send_message(msg.freeze())
+        self.assertIs(receiver.recv_routed()[1], msg)
+
+        sender.send_message(msg)
+        routing, header, body = receiver.recv_frames()
+        self.assertEqual(header, ('book_state', msg.mid))
+        self.assertEqual(len(self.parser.parse(body).entries), 3)
+
+        # Replies over the network path reach a passthrough sender
+        self.router.send_message(obj.reply(), routing)
+        self.assertEqual(sender.recv_message().mid, msg.mid)
+
+    def test_passthrough_socket_types(self):
+        with self.assertRaises(ValueError):
+            MessageSocket(self.router.socket, self.parser, passthrough=True)
+
+    def test_passthrough_opt_in(self):
+        sender = MessageSocket(self.dealer.socket, self.parser, passthrough=True)
+        sender.send_message(messages.order())
+        # Taken for a body by receivers that did not opt in
+        failed = self.router.recv_message()
+        self.assertEqual(self.parser.failure(failed), 'unparsable')
+        self.assertEqual(len(_senders[sender._sender]), 1)
+        sender.close(0)
+        self.assertNotIn(sender._sender, _senders)
+
+    def test_passthrough_pending(self):
+        sender = MessageSocket(self.dealer.socket, self.parser, passthrough=True,
+                max_pending=2)
+        receiver = self.receiver()
+        for i in range(3):
+            sender.send_message(messages.order(mpid=i).freeze())
+        self.assertEqual(sender.stats['evicted'], 1)
+        with self.assertLogs('ledgerx.protocol'):
+            self.assertEqual(receiver.recv_message().mpid, 1)
+        self.assertEqual(receiver.recv_message().mpid, 2)
+        self.assertEqual(receiver.stats['dropped'], 1)
+
+    def test_malformed_frames(self):
+        receiver = self.receiver()
+        msg = messages.order()
+        self.dealer.socket.send(b'LXP1' + b'\xff' * 16)
+        self.dealer.socket.send_multipart([b'LXH1\xff\x00', msg.dumps()])
+        self.dealer.socket.send(msg.dumps())
+        with self.assertLogs('ledgerx.protocol'):
+            self.assertEqual(receiver.recv_message().mid, msg.mid)
+        self.assertEqual(receiver.stats['dropped'], 2)
+        with self.assertRaises(zmq.Again):
+            receiver.recv_message(zmq.NOBLOCK)
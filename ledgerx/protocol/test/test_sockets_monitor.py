@@ -0,0 +1,105 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.test.test_sockets_monitor
+:synopsis: Unit tests for the sockets.monitor module.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import os
+import zmq
+import time
+import shutil
+import tempfile
+import unittest
+
+from ledgerx.protocol import sockets
+from ledgerx.protocol.sockets.monitor import EVENT_KINDS, SocketMonitor
+
+class TestSocketMonitor(unittest.TestCase):
+
+    def setUp(self):
+        self.ctx = zmq.Context()
+        self.dir = tempfile.mkdtemp()
+        self.endpoint = 'ipc://{0}'.format(os.path.join(self.dir, 'monitor'))
+        self.monitor = SocketMonitor(poll_ivl=0.01)
+        self.socks = []
+
+    def tearDown(self):
+        for s in self.socks:
+            s.close(0)
+        self.monitor.stop()
+        self.ctx.term()
+        shutil.rmtree(self.dir)
+
+    def socket(self, sfn, *args, **kwargs):
+        s = sfn(*args, ctx=self.ctx, monitor=self.monitor, linger=0, **kwargs)
+        self.socks.append(s)
+        return s
+
+    def wait_for(self, label, kind, count=1):
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline:
+            snapshot = self.monitor.snapshot()
+            if snapshot['sockets'][label][kind]['count'] >= count:
+                return snapshot
+            time.sleep(0.01)
+        self.fail("no {0} event on {1}".format(kind, label))
+
+    def wait_gone(self, label):
+        deadline = time.monotonic() + 2
+        while label in self.labels():
+            if time.monotonic() > deadline:
+                self.fail("{0} is still watched".format(label))
+            time.sleep(0.01)
+
+    def labels(self):
+        return sorted(self.monitor.snapshot()['sockets'])
+
+    def test_connect_disconnect(self):
+        router = self.socket(sockets.router_socket)
+        router.bind(self.endpoint)
+        dealer = self.socket(sockets.dealer_socket)
+        dealer.connect(self.endpoint)
+        client, server = self.labels()
+        self.assertTrue(server.startswith('router-'))
+        self.wait_for(server, 'connected')
+        self.wait_for(client, 'connected')
+
+        self.socks.remove(dealer)
+        dealer.close(0)
+        snapshot = self.wait_for(server, 'disconnected')
+        self.assertEqual(set(snapshot['total']), set(EVENT_KINDS))
+        self.assertEqual(snapshot['total']['connected']['count'], 2)
+        self.assertGreater(snapshot['total']['connected']['rate'], 0)
+        # Closed sockets only count in the total
+        self.wait_gone(client)
+        self.assertEqual(self.labels(), [server])
+        self.monitor.unwatch(router)
+        self.wait_gone(server)
+        snapshot = self.monitor.snapshot()
+        self.assertEqual(snapshot['total']['connected']['count'], 2)
+        self.assertEqual(snapshot['total']['disconnected']['count'], 1)
+
+    def test_reconnect_storm(self):
+        dealer = self.socket(sockets.dealer_socket)
+        label = self.monitor.watch(self.socket(sockets.pair_socket), 'pair')
+        self.assertEqual(label, 'pair')
+        dealer.connect(self.endpoint)
+        snapshot = self.wait_for(self.labels()[0], 'retried', 5)
+        self.assertGreater(snapshot['total']['retried']['rate'], 0)
+        self.assertEqual(snapshot['sockets']['pair']['retried']['count'], 0)
+
+    @unittest.skipUnless(zmq.has('curve'), "libzmq has no CURVE support")
+    def test_handshake_failed(self):
+        server_pub, server_priv = zmq.curve_keypair()
+        client_pub, client_priv = zmq.curve_keypair()
+        wrong_pub, _ = zmq.curve_keypair()
+        server = self.socket(sockets.secure_socket, sockets.router_socket,
+                server_priv, server_pub)
+        server.bind(self.endpoint)
+        client = self.socket(sockets.secure_socket, sockets.dealer_socket,
+                client_priv, client_pub, serverkey=wrong_pub)
+        client.connect(self.endpoint)
+        self.wait_for(self.labels()[0], 'handshake_failed')
@@ -0,0 +1,58 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.test.test_sockets_profiles
+:synopsis: Unit tests for the sockets.profiles module.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import zmq
+import unittest
+
+from ledgerx.protocol import sockets
+from ledgerx.protocol.sockets import aio
+from ledgerx.protocol.sockets import profiles
+from ledgerx.protocol.sockets.profiles import Profile
+
+class TestProfiles(unittest.TestCase):
+
+    def test_builtin_profiles(self):
+        for name in ('low_latency', 'high_throughput', 'market_data'):
+            with self.subTest(profile=name):
+                profile = profiles.get_profile(name)
+                self.assertEqual(profile.name, name)
+                ctx = profiles.create_context(name)
+                self.assertEqual(ctx.get(zmq.IO_THREADS),
+                        profile.context_options[zmq.IO_THREADS])
+                for sfn in (sockets.push_socket, sockets.sub_socket,
+                        sockets.router_socket, aio.dealer_socket):
+                    s = sfn(ctx, profile=name)
+                    for option, value in profile.socket_options.items():
+                        self.assertEqual(s.getsockopt(option), value)
+                    s.close(0)
+                ctx.term()
+
+    def test_arguments_override_profile(self):
+        ctx = zmq.Context()
+        s = sockets.dealer_socket(ctx, send_hwm=5, linger=1000,
+                profile=profiles.LOW_LATENCY)
+        self.assertEqual(s.sndhwm, 5)
+        self.assertEqual(s.linger, 1000)
+        # The profile replaces the defaults of the other arguments
+        self.assertEqual(s.rcvhwm, 1000)
+        self.assertEqual(s.rcvtimeo, 1000)
+        s.close()
+        ctx.term()
+
+    def test_register(self):
+        profile = Profile('test_register', {zmq.SNDHWM: 7})
+        self.assertIs(profiles.register_profile(profile), profile)
+        try:
+            self.assertIs(profiles.get_profile('test_register'), profile)
+            with self.assertRaises(ValueError):
+                profiles.register_profile(Profile('test_register'))
+        finally:
+            del profiles.PROFILES['test_register']
+        with self.assertRaises(ValueError):
+            profiles.get_profile('test_register')
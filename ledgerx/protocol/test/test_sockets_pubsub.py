@@ -0,0 +1,95 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.test.test_sockets_pubsub
+:synopsis: Unit tests for the sockets.pubsub module.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import zmq
+import time
+import unittest
+
+from ledgerx.protocol import sockets
+from ledgerx.protocol.bench import messages
+from ledgerx.protocol.sockets import pubsub
+
+class TestTopics(unittest.TestCase):
+
+    def test_topic(self):
+        self.assertEqual(pubsub.topic('order'), b'order|')
+        self.assertEqual(pubsub.topic('order', '1.0.0'), b'order|1.0.0|')
+        self.assertEqual(pubsub.topic('order', '1.0.0', 42), b'order|1.0.0|42|')
+        with self.assertRaises(ValueError):
+            pubsub.topic('order', key=42)
+
+    def test_message_topic(self):
+        msg = messages.order(contract_id=7)
+        self.assertEqual(pubsub.message_topic(msg), b'order|1.0.0||')
+        self.assertEqual(pubsub.message_topic(msg, 'contract_id'),
+                b'order|1.0.0|7|')
+        self.assertEqual(pubsub.message_topic(msg, 'missing'), b'order|1.0.0||')
+
+class TestPubSub(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.ctx = zmq.Context()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.ctx.destroy()
+
+    def setUp(self):
+        self.parser = messages.parser('json')
+        self.pub = sockets.pub_socket(self.ctx)
+        # Endpoints are not reused: closed inproc sockets unbind lazily
+        endpoint = 'inproc://{0}'.format(self.id())
+        self.pub.bind(endpoint)
+        self.sub = sockets.sub_socket(self.ctx, rtimeo=100)
+        self.sub.connect(endpoint)
+
+    def tearDown(self):
+        self.pub.close(0)
+        self.sub.close(0)
+
+    def publish_all(self):
+        # Subscriptions reach the publisher asynchronously
+        time.sleep(0.05)
+        pubsub.publish(self.pub, messages.book_state(contract_id=1), 'contract_id')
+        for contract_id in (1, 2):
+            pubsub.publish(self.pub, messages.order(contract_id=contract_id),
+                    'contract_id')
+        pubsub.publish(self.pub, messages.book_state(contract_id=2), 'contract_id')
+
+    def received(self):
+        msgs = []
+        while True:
+            try:
+                topic, msg = pubsub.recv_message(self.sub, self.parser)
+            except zmq.Again:
+                return msgs
+            self.assertTrue(topic.startswith(msg.type.encode('utf8')))
+            msgs.append((msg.type, msg.contract_id))
+
+    def test_subscribe_type(self):
+        pubsub.subscribe(self.sub, 'order')
+        self.publish_all()
+        self.assertEqual(self.received(), [('order', 1), ('order', 2)])
+
+    def test_subscribe_class_keys(self):
+        pubsub.subscribe(self.sub, messages.JsonBookState, keys=[2])
+        pubsub.subscribe(self.sub, messages.JsonOrder, keys=[1])
+        self.publish_all()
+        self.assertEqual(self.received(), [('order', 1), ('book_state', 2)])
+        with self.assertRaises(ValueError):
+            pubsub.subscribe(self.sub, 'order', keys=[1])
+
+    def test_subscribe_all_and_unsubscribe(self):
+        pubsub.subscribe(self.sub)
+        self.publish_all()
+        self.assertEqual(len(self.received()), 4)
+        pubsub.unsubscribe(self.sub)
+        self.publish_all()
+        self.assertEqual(self.received(), [])
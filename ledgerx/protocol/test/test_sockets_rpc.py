@@ -0,0 +1,102 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.test.test_sockets_rpc
+:synopsis: Unit tests for the sockets.rpc module.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import zmq
+import asyncio
+import unittest
+
+from ledgerx.protocol import sockets
+from ledgerx.protocol.bench import messages
+from ledgerx.protocol.sockets.rpc import RPCClient
+
+class TestRPCClient(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.ctx = zmq.Context()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.ctx.destroy()
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.parser = messages.parser('msgpack')
+        self.router = sockets.router_socket(self.ctx, rtimeo=1000)
+        # Closed sockets release inproc endpoints asynchronously
+        endpoint = 'inproc://{0}'.format(self.id())
+        self.router.bind(endpoint)
+        self.client = RPCClient(self.ctx, endpoint,
+                self.parser, timeout=0.05, retries=1)
+
+    def tearDown(self):
+        self.client.close(0)
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.router.close(0)
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def serve(self, count, drop=0):
+        """\
+        Receive ``count`` requests, dropping the first ``drop`` of them, and
+        reply to the rest in reverse order.
+        """
+        requests = [self.router.recv_multipart() for _ in range(count)]
+        for frames in reversed(requests[drop:]):
+            reply = self.parser.parse(frames[-1]).reply()
+            self.router.send_multipart(frames[:-1] + [reply.dumps()])
+
+    def test_pipelined(self):
+        sent = [messages.order('msgpack', mpid=i) for i in range(10)]
+
+        async def run():
+            # Long enough not to retry while the host is busy
+            futs = [self.client.submit(msg, timeout=5) for msg in sent]
+            await asyncio.sleep(0.01)
+            self.assertEqual(self.client.in_flight, 10)
+            await self.loop.run_in_executor(None, self.serve, 10)
+            return await asyncio.gather(*futs)
+
+        replies = self.loop.run_until_complete(run())
+        self.assertEqual([r.mid for r in replies], [m.mid for m in sent])
+        self.assertEqual(self.client.in_flight, 0)
+        self.assertEqual(self.client.stats['sent'], 10)
+        self.assertEqual(self.client.stats['retried'], 0)
+
+    def test_retry(self):
+        msg = messages.order('msgpack')
+
+        async def run():
+            fut = self.client.submit(msg)
+            await self.loop.run_in_executor(None, self.serve, 2, 1)
+            return await fut
+
+        reply = self.loop.run_until_complete(run())
+        self.assertEqual(reply.mid, msg.mid)
+        self.assertEqual(self.client.stats['retried'], 1)
+
+    def test_timeout(self):
+        msg = messages.order('msgpack')
+        with self.assertRaises(asyncio.TimeoutError):
+            self.loop.run_until_complete(self.client.request(msg, retries=0))
+        self.assertEqual(self.client.stats['timed_out'], 1)
+        self.assertEqual(self.client.in_flight, 0)
+
+    def test_duplicate_mid(self):
+        msg = messages.order('msgpack')
+
+        async def run():
+            fut = self.client.submit(msg)
+            await asyncio.sleep(0)
+            with self.assertRaises(ValueError):
+                await self.client.request(msg)
+            fut.cancel()
+
+        self.loop.run_until_complete(run())
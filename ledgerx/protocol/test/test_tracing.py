@@ -0,0 +1,64 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.test.test_tracing
+:synopsis: Unit tests for the tracing module.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import unittest
+
+from ledgerx.protocol import tracing
+from ledgerx.protocol.messages import (
+        JsonMessage,
+        MessageTypeMixin,
+        MessageTraceMixin)
+
+class _TestMsg(JsonMessage, MessageTypeMixin, MessageTraceMixin):
+    Type = 'order'
+
+class TestTracing(unittest.TestCase):
+
+    def test_hop_latencies(self):
+        msg = _TestMsg()
+        self.assertEqual(tracing.hop_latencies(msg), [])
+        self.assertIsNone(tracing.end_to_end(msg))
+        msg.stamp('gateway', 1000)
+        msg.stamp('engine', 1500)
+        msg.stamp('publisher', 1400)
+        self.assertEqual(tracing.hop_latencies(msg), [
+            ('gateway', 'engine', 500), ('engine', 'publisher', -100)])
+        self.assertEqual(tracing.end_to_end(msg.trace), 400)
+
+    def test_trace_stats(self):
+        stats = tracing.TraceStats()
+        for i in range(100):
+            msg = _TestMsg()
+            msg.stamp('gateway', 0)
+            msg.stamp('engine', 1000 + i)
+            msg.stamp('publisher', 3000)
+            received = _TestMsg()
+            received.loads(msg.dumps())
+            stats.record(received)
+
+        e2e = stats.percentiles('order', 'gateway')
+        self.assertEqual(e2e[50], 3000)
+        hop = stats.percentiles('order', 'gateway', 'engine', pcts=(0, 100))
+        self.assertAlmostEqual(hop[0], 1000, delta=1000 / 16)
+        self.assertEqual(hop[100], 1099)
+        self.assertIsNone(stats.percentiles('order', 'nowhere'))
+
+        msg = _TestMsg()
+        msg.stamp('gateway', 0)
+        stats.record(msg, hop='client')
+        self.assertEqual(len(msg.trace), 2)
+
+        snap = stats.snapshot(reset=True)
+        self.assertEqual([(s['from'], s['to']) for s in snap], [
+            ('engine', 'publisher'),
+            ('gateway', tracing.END_TO_END),
+            ('gateway', 'client'),
+            ('gateway', 'engine')])
+        self.assertEqual(snap[1]['latency_ns']['count'], 101)
+        self.assertEqual(stats.snapshot(), [])
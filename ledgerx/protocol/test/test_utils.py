@@ -0,0 +1,87 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.test.test_utils
+:synopsis: Unit tests for the utils module.
+:author: Amr Ali <amr@ledgerx.com>
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import importlib
+import unittest
+
+from ledgerx.protocol import utils
+
+class TestVersions(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.package = '_ledgerx_test_versions'
+        pkgdir = os.path.join(self.root, self.package)
+        os.mkdir(pkgdir)
+        with open(os.path.join(pkgdir, '__init__.py'), 'w') as fd:
+            fd.write("from ledgerx.protocol.registry import TypeRegistry\n"
+                    "REGISTRY = TypeRegistry()\n")
+        for name in ('v0_1_0', 'v0_2_0'):
+            with open(os.path.join(pkgdir, name + '.py'), 'w') as fd:
+                fd.write("from . import REGISTRY\n"
+                        "VERSION = {0!r}\n"
+                        "for mtype in ('a', 'b'):\n"
+                        "    REGISTRY.register(type(mtype, (object,), {{\n"
+                        "        'Type': mtype, 'Version': VERSION}}))\n"
+                        .format(name))
+        self.basefile = os.path.join(pkgdir, '__init__.py')
+        sys.path.insert(0, self.root)
+        self.registry = importlib.import_module(self.package).REGISTRY
+
+    def tearDown(self):
+        sys.path.remove(self.root)
+        for name in list(sys.modules):
+            if name.startswith(self.package):
+                del sys.modules[name]
+        shutil.rmtree(self.root)
+
+    def test_import_versions(self):
+        vers = utils.import_versions(self.basefile, self.package,
+                registry=self.registry)
+        self.assertEqual(sorted(vers), ['0.1.0', '0.2.0'])
+        self.assertEqual(vers['0.2.0'].VERSION, 'v0_2_0')
+
+    def test_lazy_import_versions(self):
+        vers = utils.lazy_import_versions(self.basefile, self.package,
+                registry=self.registry)
+        self.assertEqual(sorted(vers), ['0.1.0', '0.2.0'])
+        self.assertIn('0.1.0', vers)
+        self.assertNotIn('0.3.0', vers)
+        self.assertEqual(vers.loaded(), [])
+        self.assertNotIn(self.package + '.v0_1_0', sys.modules)
+
+        self.assertEqual(vers['0.1.0'].VERSION, 'v0_1_0')
+        self.assertEqual(vers.loaded(), ['0.1.0'])
+        self.assertNotIn(self.package + '.v0_2_0', sys.modules)
+        with self.assertRaises(KeyError):
+            vers['0.3.0']
+
+    def test_lazy_import_versions_preload(self):
+        vers = utils.lazy_import_versions(self.basefile, self.package,
+                preload=['0.2.0'], registry=self.registry)
+        self.assertEqual(vers.loaded(), ['0.2.0'])
+        self.assertIn(self.package + '.v0_2_0', sys.modules)
+
+    def test_lazy_import_versions_type_ids(self):
+        vers = utils.import_versions(self.basefile, self.package,
+                registry=self.registry)
+        eager = self.registry.export()
+        self.tearDown()
+        self.setUp()
+        # The later version is imported first, yet gets the same type IDs
+        vers = utils.lazy_import_versions(self.basefile, self.package,
+                preload=['0.2.0'], registry=self.registry)
+        vers['0.1.0']
+        self.assertEqual(self.registry.export(), eager)
+        self.assertEqual([key for _, key, _ in eager],
+                ['v0_1_0', 'v0_1_0', 'v0_2_0', 'v0_2_0'])
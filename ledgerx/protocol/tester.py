@@ -15,3 +15,8 @@ def load_test_suite():
     suite = TestLoader().discover(root_dir)
     return suite
 
+def load_benchmark_suite():
+    from ledgerx.protocol.bench import BenchmarkLoader
+    root_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench')
+    suite = BenchmarkLoader().discover(root_dir)
+    return suite
@@ -0,0 +1,109 @@
+# Copyright 2014 NYBX Inc.
+# All rights reserved.
+
+"""
+:module: ledgerx.protocol.tracing
+:synopsis: Hop-by-hop latency of messages carrying a trace.
+:author: Amr Ali <amr@ledgerx.com>
+
+Every component a message passes through calls
+:meth:`MessageTraceMixin.stamp <ledgerx.protocol.messages.MessageTraceMixin.stamp>`
+before sending it on. The receiver computes the latency of every hop with
+:func:`hop_latencies` and aggregates them per message type with
+:class:`TraceStats`.
+"""
+
+import threading
+
+from ledgerx.protocol.metrics import Histogram
+
+END_TO_END = '*'
+
+def hop_latencies(trace):
+    """\
+    Compute the latency between consecutive stamps of a trace.
+
+    :param trace: A message with a ``trace`` field or the trace itself.
+    :returns: A list of ``(from hop, to hop, nanoseconds)``. Latencies are
+        negative when the clocks of two hosts disagree.
+    """
+    trace = getattr(trace, 'trace', trace) or []
+    return [(trace[i - 1][0], trace[i][0], trace[i][1] - trace[i - 1][1])
+            for i in range(1, len(trace))]
+
+def end_to_end(trace):
+    """\
+    :param trace: A message with a ``trace`` field or the trace itself.
+    :returns: Nanoseconds between the first and last stamps, or None.
+    """
+    trace = getattr(trace, 'trace', trace) or []
+    if len(trace) < 2:
+        return None
+    return trace[-1][1] - trace[0][1]
+
+class TraceStats(object):
+    """\
+    Per-message-type latency histograms of every hop and end to end.
+    """
+
+    def __init__(self, precision=5):
+        self.precision = precision
+        self._lock = threading.Lock()
+        self._hops = {}
+        self._skewed = {}
+
+    def record(self, msg, hop=None):
+        """\
+        Record the trace of a received message.
+
+        :param msg: A message with ``type`` and ``trace`` fields.
+        :param hop: Stamp the message as ``hop`` first (default: None).
+        """
+        if hop is not None:
+            msg.stamp(hop)
+        trace = msg.trace
+        if not trace or len(trace) < 2:
+            return
+        mtype = msg.type
+        segments = hop_latencies(trace)
+        segments.append((trace[0][0], END_TO_END, trace[-1][1] - trace[0][1]))
+        for src, dst, ns in segments:
+            key = (mtype, src, dst)
+            hist = self._hops.get(key)
+            if hist is None:
+                with self._lock:
+                    hist = self._hops.setdefault(key, Histogram(self.precision))
+            if ns < 0:
+                self._skewed[key] = self._skewed.get(key, 0) + 1
+            hist.record(ns)
+
+    def percentiles(self, mtype, src, dst=END_TO_END, pcts=Histogram.Percentiles):
+        """\
+        :returns: A dictionary of percentile -> nanoseconds of a hop, or
+            None if it was never recorded.
+        """
+        hist = self._hops.get((mtype, src, dst))
+        if hist is None:
+            return None
+        return {pct: hist.percentile(pct) for pct in pcts}
+
+    def snapshot(self, reset=False):
+        """\
+        :param reset: Start over after taking the snapshot.
+        :returns: A list of dictionaries with ``type``, ``from``, ``to``,
+            ``skewed`` (latencies below zero, recorded as zero) and
+            ``latency_ns`` (a :meth:`Histogram.snapshot` summary) entries.
+            End-to-end entries have ``to`` set to :data:`END_TO_END`.
+        """
+        with self._lock:
+            hops, skewed = self._hops, self._skewed
+            if reset:
+                self._hops, self._skewed = {}, {}
+        return [{
+            'type': key[0],
+            'from': key[1],
+            'to': key[2],
+            'skewed': skewed.get(key, 0),
+            'latency_ns': hist.snapshot(),
+            } for key, hist in sorted(hops.items(),
+                key=lambda x: tuple(map(str, x[0])))]
@@ -9,11 +9,39 @@
 
 import os
 import importlib
+import importlib.util
+import threading
 
 from semantic_version import Version
-from collections import deque as consume
+from collections.abc import Mapping
 
-def import_versions(basefile, package):
+from ledgerx.protocol.registry import family_registry
+
+def _discover_versions(basefile):
+    """\
+    Find version files adjacent to ``basefile``.
+
+    :returns: A dictionary of versions `x.x.x` and version module names.
+    """
+    vers = filter(lambda x: Version.version_re.match(x.lstrip('v').replace('_', '.')),
+            map(lambda x: x.rstrip('.py'),
+                os.listdir(os.path.dirname(basefile))
+                )
+            )
+    return {x.lstrip('v').replace('_', '.'): x for x in vers}
+
+def _reserve_type_ids(names, package, registry):
+    """\
+    Set aside type IDs for version modules in version order, so they are the
+    same whatever order the modules are imported in.
+    """
+    if registry is None:
+        registry = family_registry(package)
+    for ver in sorted(names, key=Version):
+        registry.reserve(importlib.util.resolve_name(
+            ".{0}".format(names[ver]), package))
+
+def import_versions(basefile, package, registry=None):
     """\
     Iterate over protocol files and import all version modules.
 
@@ -21,18 +49,82 @@ def import_versions(basefile, package):
         The file from which adjacent version files will be imported.
     :param package:
         The package name that contains the version files.
+    :param registry:
+        The :class:`~ledgerx.protocol.registry.TypeRegistry` the version
+        modules register their message types in (default: the family
+        registry of ``package``).
     :returns:
         A dictionary of versions `x.x.x` and imported version modules.
     """
-    vers = filter(lambda x: Version.version_re.match(x.lstrip('v').replace('_', '.')),
-            map(lambda x: x.rstrip('.py'),
-                os.listdir(os.path.dirname(basefile))
-                )
-            )
-    res = {}
-    consume(map(lambda x: res.update(
-        {x.lstrip('v').replace('_', '.'): importlib.import_module(".{0}".format(x),
-            package=package)}
-        ), vers), maxlen=0)
-    return res
+    names = _discover_versions(basefile)
+    _reserve_type_ids(names, package, registry)
+    return {ver: importlib.import_module(".{0}".format(name), package=package)
+            for ver, name in sorted(names.items(), key=lambda x: Version(x[0]))}
+
+def lazy_import_versions(basefile, package, preload=(), registry=None):
+    """\
+    Same as :func:`import_versions` except that version modules are only
+    imported on first lookup.
+
+    :param basefile:
+        The file from which adjacent version files will be imported.
+    :param package:
+        The package name that contains the version files.
+    :param preload:
+        Versions `x.x.x` to import right away.
+    :param registry:
+        The :class:`~ledgerx.protocol.registry.TypeRegistry` the version
+        modules register their message types in (default: the family
+        registry of ``package``).
+    :returns:
+        A :class:`LazyVersions` mapping.
+    """
+    names = _discover_versions(basefile)
+    _reserve_type_ids(names, package, registry)
+    return LazyVersions(names, package, preload)
+
+class LazyVersions(Mapping):
+    """\
+    A mapping of versions `x.x.x` to version modules that imports a module
+    the first time it is looked up. Membership tests and iteration never
+    import anything, which is all ``BaseMessageParser`` needs to reject an
+    unsupported version.
+
+    The type IDs of the modules are set aside by
+    :func:`lazy_import_versions` in version order before any is imported.
+    """
+
+    def __init__(self, names, package, preload=()):
+        self._names = dict(names)
+        self._package = package
+        self._modules = {}
+        self._lock = threading.Lock()
+        for ver in preload:
+            self[ver]
+
+    def __getitem__(self, ver):
+        try:
+            return self._modules[ver]
+        except KeyError:
+            pass
+        name = self._names[ver]
+        with self._lock:
+            if ver not in self._modules:
+                self._modules[ver] = importlib.import_module(
+                        ".{0}".format(name), package=self._package)
+        return self._modules[ver]
+
+    def __contains__(self, ver):
+        return ver in self._names
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
 
+    def loaded(self):
+        """\
+        :returns: A list of versions whose modules have been imported.
+        """
+        return list(self._modules)